@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db import async_session, get_session
+from ..models import Analysis
+from ..services import events
+from ..services.jobs import STATUS_FAILED, STATUS_PROCESSED
+from .deps import AuthUser, get_current_user
+from .reports import load_report
+
+router = APIRouter()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+def sse_message(event: str, data: Any) -> bytes:
+    """Сообщение text/event-stream; строка передаётся как есть (готовый JSON), прочее — json.dumps."""
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    lines = "".join(f"data: {line}\n" for line in payload.split("\n"))
+    return f"event: {event}\n{lines}\n".encode("utf-8")
+
+
+async def _db_state(analysis_id: int, user_id: int) -> tuple[str | None, str | None]:
+    """(статус, JSON отчёта, если анализ обработан); соединение с БД держим только на время запроса."""
+    async with async_session() as session:
+        status = await session.scalar(
+            select(Analysis.status).where(Analysis.id == analysis_id, Analysis.user_id == user_id)
+        )
+        if status != STATUS_PROCESSED:
+            return status, None
+        body, _etag, _final = await load_report(session, analysis_id, user_id)
+        return status, body.decode("utf-8")
+
+
+async def _event_stream(analysis_id: int, user_id: int) -> AsyncIterator[bytes]:
+    """
+    status при подключении -> progress по страницам OCR -> status processed + report (или status failed).
+    События приходят из шины процесса; на каждом heartbeat статус сверяется с БД — на случай,
+    если документ обрабатывает другой процесс API или событие пришло до подписки.
+    """
+    heartbeat = max(1.0, _env_float("SSE_HEARTBEAT_SECONDS", 15))
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + _env_float("SSE_MAX_SECONDS", 900)
+    status: str | None = None
+    # подписываемся до первого чтения статуса, чтобы не потерять событие между ними
+    with events.subscribe(analysis_id) as queue:
+        while True:
+            current, report = await _db_state(analysis_id, user_id)
+            if current is None:  # анализ удалён
+                return
+            if current != status:
+                status = current
+                yield sse_message(events.EVENT_STATUS, {"status": status})
+            if report is not None:
+                yield sse_message(events.EVENT_REPORT, report)
+                return
+            if status == STATUS_FAILED:
+                return
+
+            while True:
+                timeout = min(heartbeat, deadline - loop.time())
+                if timeout <= 0:
+                    return
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    # комментарий держит соединение живым через прокси; затем сверка с БД
+                    yield b": ping\n\n"
+                    break
+                yield sse_message(event.event, event.data)
+                if event.event == events.EVENT_REPORT:
+                    return
+                if event.event == events.EVENT_STATUS:
+                    status = event.data["status"]
+                    if status == STATUS_FAILED:
+                        return
+
+
+@router.get("/{analysis_id}/events")
+async def analysis_events(
+    analysis_id: int,
+    current_user: AuthUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Server-Sent Events обработки анализа: `status`, `progress` (страницы OCR), `report`
+    (тот же JSON, что GET /report/{id}). Поток закрывается после report или status=failed.
+    """
+    exists = await session.scalar(
+        select(Analysis.id).where(Analysis.id == analysis_id, Analysis.user_id == current_user.id)
+    )
+    if exists is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    # сессия зависимости (её же использует get_current_user) живёт до конца ответа:
+    # закрываем её сейчас, чтобы поток не держал соединение пула; дальше — короткие сессии в _db_state
+    await session.close()
+    return StreamingResponse(
+        _event_stream(analysis_id, current_user.id),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx не должен буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -5,20 +5,29 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from ..db import get_session
 from ..models import User
 from ..schemas import Token, UserCreate, UserLogin, UserPublic
-from ..services.security import create_access_token, hash_password, verify_password
+from ..services.security import PasswordHasherBusy, ahash_password, averify_and_update, create_access_token
 
 router = APIRouter()
 
 
+def _busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Too many auth requests, retry later", headers={"Retry-After": "1"})
+
+
 @router.post("/register", response_model=UserPublic)
 async def register(user: UserCreate, session: AsyncSession = Depends(get_session)):
     exists = await session.scalar(select(User).where(User.email == user.email))
     if exists:
         raise HTTPException(status_code=400, detail="User exists")
 
+    try:
+        password_hash = await ahash_password(user.password)
+    except PasswordHasherBusy:
+        raise _busy()
+
     db_user = User(
         email=user.email,
-        password_hash=hash_password(user.password),
+        password_hash=password_hash,
         age=user.age,
         gender=user.gender,
         language=user.language,
@@ -39,8 +48,18 @@ async def register(user: UserCreate, session: AsyncSession = Depends(get_session
 @router.post("/login", response_model=Token)
 async def login(user: UserLogin, session: AsyncSession = Depends(get_session)):
     db_user = await session.scalar(select(User).where(User.email == user.email))
-    if not db_user or not verify_password(user.password, db_user.password_hash):
+    if not db_user:
+        raise HTTPException(status_code=400, detail="Incorrect credentials")
+    try:
+        ok, new_hash = await averify_and_update(user.password, db_user.password_hash)
+    except PasswordHasherBusy:
+        raise _busy()
+    if not ok:
         raise HTTPException(status_code=400, detail="Incorrect credentials")
-    token = create_access_token(subject=db_user.email)
+    if new_hash:
+        # сменилась стоимость bcrypt (BCRYPT_ROUNDS) — сохраняем хэш с новой стоимостью
+        db_user.password_hash = new_hash
+        await session.commit()
+    token = create_access_token(subject=db_user.email, user_id=db_user.id)
     return Token(access_token=token, token_type="bearer")
 
@@ -1,13 +1,12 @@
 from fastapi import APIRouter, Depends
 
-from ..models import User
-from .deps import get_current_user
+from .deps import AuthUser, get_current_user
 
 router = APIRouter()
 
 
 @router.post("/request")
-async def request_consultation(current_user: User = Depends(get_current_user)):
+async def request_consultation(current_user: AuthUser = Depends(get_current_user)):
     return {
         "status": "requested",
         "details": "consultation scheduled (MVP stub)",
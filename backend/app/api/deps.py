@@ -1,3 +1,6 @@
+import hmac
+import os
+
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy import select
@@ -6,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from ..db import get_session
 from ..models import User
 from ..services.security import decode_token
+from ..services.user_cache import AuthUser, cache_user, get_cached_user
 
 bearer = HTTPBearer(auto_error=False)
 
@@ -13,7 +17,7 @@ bearer = HTTPBearer(auto_error=False)
 async def get_current_user(
     creds: HTTPAuthorizationCredentials | None = Depends(bearer),
     session: AsyncSession = Depends(get_session),
-) -> User:
+) -> AuthUser:
     if not creds:
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
@@ -25,8 +29,30 @@ async def get_current_user(
     if not email:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = await session.scalar(select(User).where(User.email == email))
-    if not user:
+    uid = payload.get("uid")
+    if isinstance(uid, int):
+        # быстрый путь: пользователь из короткоживущего in-process кэша, без запроса в БД
+        cached = get_cached_user(uid)
+        if cached is not None and cached.email == email:
+            return cached
+        user = await session.get(User, uid)
+    else:
+        # токены, выданные до появления uid в claims
+        user = await session.scalar(select(User).where(User.email == email))
+    if not user or user.email != email:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
+    auth_user = AuthUser.from_orm_user(user)
+    cache_user(auth_user)
+    return auth_user
+
 
+async def require_metrics_token(creds: HTTPAuthorizationCredentials | None = Depends(bearer)) -> None:
+    """
+    Доступ к служебным метрикам: `Authorization: Bearer <METRICS_TOKEN>`.
+    Без METRICS_TOKEN эндпоинт выключен (404) — наружу метрики по умолчанию не видны.
+    """
+    token = os.environ.get("METRICS_TOKEN", "")
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not creds or not hmac.compare_digest(creds.credentials.encode("utf-8"), token.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
@@ -0,0 +1,141 @@
+"""
+Лимит размера загрузок.
+
+FastAPI разбирает multipart-тело (и спулит файлы во временные файлы) до вызова обработчика,
+поэтому проверка в самом обработчике срабатывает только после приёма всего тела. Лимит
+применяется раньше, на уровне ASGI: по Content-Length — до чтения тела, а для тел без
+Content-Length (chunked) — по мере приёма, обрывая чтение на первом лишнем куске.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Callable
+
+# запас на заголовки multipart-частей и прочие поля формы
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+def max_upload_bytes() -> int:
+    """MAX_UPLOAD_MB — максимальный размер одного загружаемого файла."""
+    try:
+        mb = float(os.environ.get("MAX_UPLOAD_MB", "25"))
+    except ValueError:
+        mb = 25.0
+    return int(mb * 1024 * 1024)
+
+
+def max_batch_bytes() -> int:
+    """MAX_BATCH_UPLOAD_MB — максимальный размер тела POST /upload/batch (все файлы/архивы вместе)."""
+    try:
+        mb = float(os.environ.get("MAX_BATCH_UPLOAD_MB", "200"))
+    except ValueError:
+        mb = 200.0
+    return int(mb * 1024 * 1024)
+
+
+def max_batch_files() -> int:
+    """MAX_BATCH_FILES — максимум документов в одном пакете (с учётом содержимого zip)."""
+    try:
+        return max(1, int(os.environ.get("MAX_BATCH_FILES", "50")))
+    except ValueError:
+        return 50
+
+
+def max_batch_expanded_bytes() -> int:
+    """
+    Сколько байт документов пакета может получиться после распаковки zip:
+    MAX_BATCH_UPLOAD_MB x MAX_BATCH_EXPAND_RATIO (по умолчанию 2 — PDF/сканы почти не сжимаются).
+    """
+    try:
+        ratio = float(os.environ.get("MAX_BATCH_EXPAND_RATIO", "2"))
+    except ValueError:
+        ratio = 2.0
+    return int(max_batch_bytes() * max(1.0, ratio))
+
+
+def max_zip_ratio() -> float:
+    """MAX_ZIP_RATIO — максимальная степень сжатия члена zip (file_size / compress_size)."""
+    try:
+        return max(1.0, float(os.environ.get("MAX_ZIP_RATIO", "20")))
+    except ValueError:
+        return 20.0
+
+
+def too_large_detail(limit: int) -> str:
+    return f"File too large (max {round(limit / (1024 * 1024), 2):g} MB)"
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI-middleware: POST на пути загрузок с телом больше лимита -> 413.
+    limits — префикс пути -> функция, возвращающая лимит тела в байтах.
+    """
+
+    def __init__(self, app, limits: dict[str, Callable[[], int]]) -> None:
+        self.app = app
+        self.limits = limits
+
+    def _limit_for(self, path: str) -> int | None:
+        for prefix, limit in self.limits.items():
+            if path.startswith(prefix):
+                return limit() + _MULTIPART_OVERHEAD
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        limit = self._limit_for(scope["path"])
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            return await _reject(send, limit)
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # ошибку разбора тела (FastAPI превращает исключение в 400) заменяем на 413
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            pass
+        if exceeded and not started:
+            await _reject(send, limit)
+
+
+async def _reject(send, limit: int) -> None:
+    body = json.dumps({"detail": too_large_detail(limit - _MULTIPART_OVERHEAD)}).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
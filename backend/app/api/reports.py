@@ -1,127 +1,337 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlalchemy import select
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import case, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..db import get_session
-from ..models import Analysis, TestIndicator, User
-from ..services.pdf_report import build_report_pdf
-from ..services.report_generator import generate_recommendations
-from .deps import get_current_user
+from ..models import Analysis, TestIndicator
+from ..services.jobs import STATUS_PROCESSED
+from ..services.normalization import canonical_test_name
+from ..services.pdf_report import PDF_TEMPLATE_VERSION, build_report_pdf_from_payload
+from ..services.report_generator import build_report_payload, dump_report, report_cache
+from ..services.storage import aget_object_bytes, aget_ocr_text, aput_object
+from .deps import AuthUser, get_current_user
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
-@router.get("/{analysis_id}")
-async def get_report(
-    analysis_id: int,
-    current_user: User = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
-):
-    analysis = await session.scalar(
-        select(Analysis).where(Analysis.id == analysis_id, Analysis.user_id == current_user.id)
-    )
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analysis not found")
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
 
-    indicators = (
-        (await session.execute(select(TestIndicator).where(TestIndicator.analysis_id == analysis.id)))
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # слабые валидаторы (W/"...") для GET сравниваем как сильные
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag in tags
+
+
+def _json_response(body: bytes, etag: str, if_none_match: str | None) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def _indicator_dicts(session: AsyncSession, analysis_id: int) -> list[dict]:
+    rows = (
+        (await session.execute(select(TestIndicator).where(TestIndicator.analysis_id == analysis_id)))
         .scalars()
         .all()
     )
-
-    deviations = [
+    return [
         {
-            "test": i.test_name,
-            "value": float(i.value) if i.value is not None else None,
+            "test_name": i.test_name,
+            "value": i.value,
             "units": i.units,
+            "ref_min": i.ref_min,
+            "ref_max": i.ref_max,
             "deviation": i.deviation,
-            "reason": "MVP: причина уточняется врачом",
+            "comment": i.comment,
         }
-        for i in indicators
-        if i.deviation in ("low", "high")
+        for i in rows
     ]
 
-    recs = generate_recommendations(deviations)
 
-    report = {
-        "analysis_id": analysis.id,
-        "ocr_text": analysis.ocr_text,
-        "deviations": deviations,
-        "recommendations": [{"text": r.text, "doctor_contact": r.doctor_contact} for r in recs],
-        "indicators": [
+async def load_report(session: AsyncSession, analysis_id: int, user_id: int) -> tuple[bytes, str, bool]:
+    """
+    Байты JSON-отчёта, их ETag и признак "отчёт окончательный" (анализ обработан и
+    отчёт больше не изменится). Обработанные отчёты берутся из кэша/report_json.
+    """
+    cached = report_cache.get(str(analysis_id))
+    if cached is not None and cached["user_id"] == user_id:
+        return cached["body"], cached["etag"], True
+
+    row = (
+        await session.execute(
+            select(Analysis.status, Analysis.report_json).where(
+                Analysis.id == analysis_id, Analysis.user_id == user_id
+            )
+        )
+    ).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    status, report_json = row
+
+    if report_json is None:
+        # анализ ещё в обработке (или обработан до появления report_json) — собираем на лету
+        report_json = dump_report(
+            build_report_payload(
+                analysis_id=analysis_id,
+                status=status,
+                indicators=await _indicator_dicts(session, analysis_id),
+            )
+        )
+        if status != STATUS_PROCESSED:
+            body = report_json.encode("utf-8")
+            return body, _etag(body), False
+        # старый обработанный анализ: materialize-им, чтобы больше не пересобирать
+        await session.execute(update(Analysis).where(Analysis.id == analysis_id).values(report_json=report_json))
+        await session.commit()
+
+    body = report_json.encode("utf-8")
+    etag = _etag(body)
+    report_cache.set(str(analysis_id), {"user_id": user_id, "etag": etag, "body": body})
+    return body, etag, True
+
+
+async def _load_ocr_text(session: AsyncSession, analysis_id: int) -> str | None:
+    """Полный OCR-текст из хранилища; для старых анализов — превью из analyses.ocr_text."""
+    try:
+        return await aget_ocr_text(analysis_id)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.exception("analysis %s: failed to read ocr text from storage", analysis_id)
+    return await session.scalar(select(Analysis.ocr_text).where(Analysis.id == analysis_id))
+
+
+def _num(x) -> float | None:
+    return float(x) if x is not None else None
+
+
+@router.get("/trends")
+async def get_trends(
+    tests: str | None = Query(default=None, description="Показатели через запятую (по умолчанию — все)"),
+    date_from: datetime | None = Query(default=None),
+    date_to: datetime | None = Query(default=None),
+    max_points: int = Query(default=200, ge=1, le=2000, description="Максимум точек на ряд"),
+    current_user: AuthUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Временные ряды показателей пользователя одним запросом.
+    Длинный ряд (n > max_points) режется по порядку на max_points корзин, для каждой
+    корзины — min/max и последнее значение; короткий ряд отдаётся точка в точку.
+    """
+    points = (
+        select(
+            TestIndicator.test_key,
+            TestIndicator.test_name,
+            TestIndicator.value,
+            TestIndicator.units,
+            Analysis.id.label("analysis_id"),
+            Analysis.date,
+            func.count().over(partition_by=TestIndicator.test_key).label("n"),
+            func.row_number()
+            .over(partition_by=TestIndicator.test_key, order_by=(Analysis.date, Analysis.id))
+            .label("rn"),
+        )
+        .join(Analysis, Analysis.id == TestIndicator.analysis_id)
+        .where(
+            Analysis.user_id == current_user.id,
+            Analysis.status == STATUS_PROCESSED,
+            TestIndicator.value.is_not(None),
+            TestIndicator.test_key.is_not(None),
+        )
+    )
+    if tests:
+        keys = {canonical_test_name(t) for t in tests.split(",")} - {""}
+        points = points.where(TestIndicator.test_key.in_(keys))
+    if date_from is not None:
+        points = points.where(Analysis.date >= date_from)
+    if date_to is not None:
+        points = points.where(Analysis.date <= date_to)
+    points = points.cte("points")
+
+    # номер корзины: равные по числу точек отрезки ряда; при n <= max_points — по точке в корзине
+    bucketed = select(
+        points,
+        ((points.c.rn - 1) * max_points // points.c.n).label("bucket"),
+    ).cte("bucketed")
+    ranked = select(
+        bucketed,
+        func.row_number()
+        .over(
+            partition_by=(bucketed.c.test_key, bucketed.c.bucket),
+            order_by=(bucketed.c.date.desc(), bucketed.c.analysis_id.desc()),
+        )
+        .label("rb"),
+    ).cte("ranked")
+
+    def _last(col):
+        return func.max(case((ranked.c.rb == 1, col)))
+
+    stmt = (
+        select(
+            ranked.c.test_key,
+            func.min(ranked.c.value).label("min"),
+            func.max(ranked.c.value).label("max"),
+            func.count().label("count"),
+            _last(ranked.c.value).label("last"),
+            _last(ranked.c.date).label("date"),
+            _last(ranked.c.analysis_id).label("analysis_id"),
+            _last(ranked.c.test_name).label("test_name"),
+            _last(ranked.c.units).label("units"),
+        )
+        .group_by(ranked.c.test_key, ranked.c.bucket)
+        .order_by(ranked.c.test_key, ranked.c.bucket)
+    )
+
+    series: dict[str, dict] = {}
+    for r in (await session.execute(stmt)).all():
+        s = series.get(r.test_key)
+        if s is None:
+            s = series[r.test_key] = {
+                "test": r.test_key,
+                "name": None,
+                "units": None,
+                "count": 0,
+                "min": None,
+                "max": None,
+                "last": None,
+                "points": [],
+            }
+        s["points"].append(
             {
-                "test_name": i.test_name,
-                "value": float(i.value) if i.value is not None else None,
-                "units": i.units,
-                "ref_min": float(i.ref_min) if i.ref_min is not None else None,
-                "ref_max": float(i.ref_max) if i.ref_max is not None else None,
-                "deviation": i.deviation,
-                "comment": i.comment,
+                "date": r.date.isoformat() if r.date else None,
+                "analysis_id": r.analysis_id,
+                "value": _num(r.last),
+                "min": _num(r.min),
+                "max": _num(r.max),
+                "count": r.count,
             }
-            for i in indicators
-        ],
-    }
-    return report
+        )
+        s["count"] += r.count
+        s["min"] = _num(r.min) if s["min"] is None else min(s["min"], _num(r.min))
+        s["max"] = _num(r.max) if s["max"] is None else max(s["max"], _num(r.max))
+        # корзины идут по возрастанию даты — последняя перезаписывает
+        s["name"], s["units"] = r.test_name, r.units
+        s["last"] = {"date": s["points"][-1]["date"], "analysis_id": r.analysis_id, "value": _num(r.last)}
+    return {"series": list(series.values())}
 
 
-@router.get("/{analysis_id}/pdf")
-async def get_report_pdf(
+@router.get("/{analysis_id}")
+async def get_report(
     analysis_id: int,
-    current_user: User = Depends(get_current_user),
+    include: str | None = Query(default=None, description="ocr_text — добавить в ответ OCR-текст"),
+    if_none_match: str | None = Header(default=None),
+    current_user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    analysis = await session.scalar(
-        select(Analysis).where(Analysis.id == analysis_id, Analysis.user_id == current_user.id)
+    body, etag, _final = await load_report(session, analysis_id, current_user.id)
+    if include and "ocr_text" in {x.strip() for x in include.split(",")}:
+        ocr_text = await _load_ocr_text(session, analysis_id)
+        # дописываем поле в готовый JSON-объект, не разбирая его
+        body = body[:-1] + b',"ocr_text":' + json.dumps(ocr_text, ensure_ascii=False).encode("utf-8") + b"}"
+        etag = _etag(body)
+    return _json_response(body, etag, if_none_match)
+
+
+@router.get("/{analysis_id}/ocr-text")
+async def get_report_ocr_text(
+    analysis_id: int,
+    current_user: AuthUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    exists = await session.scalar(
+        select(Analysis.id).where(Analysis.id == analysis_id, Analysis.user_id == current_user.id)
     )
-    if not analysis:
+    if not exists:
         raise HTTPException(status_code=404, detail="Analysis not found")
+    return PlainTextResponse(await _load_ocr_text(session, analysis_id) or "")
 
-    indicators_rows = (
-        (await session.execute(select(TestIndicator).where(TestIndicator.analysis_id == analysis.id)))
-        .scalars()
-        .all()
-    )
 
-    indicators = [
-        {
-            "test_name": i.test_name,
-            "value": float(i.value) if i.value is not None else None,
-            "units": i.units,
-            "ref_min": float(i.ref_min) if i.ref_min is not None else None,
-            "ref_max": float(i.ref_max) if i.ref_max is not None else None,
-            "deviation": i.deviation,
-        }
-        for i in indicators_rows
-    ]
+def _pdf_object_name(analysis_id: int) -> str:
+    return f"reports/{analysis_id}/report_t{PDF_TEMPLATE_VERSION}.pdf"
 
-    deviations = [
-        {
-            "test": i.test_name,
-            "value": float(i.value) if i.value is not None else None,
-            "units": i.units,
-            "deviation": i.deviation,
-            "reason": "MVP: причина уточняется врачом",
-        }
-        for i in indicators_rows
-        if i.deviation in ("low", "high")
-    ]
 
-    recs = generate_recommendations(deviations)
-    recommendations = [{"text": r.text, "doctor_contact": r.doctor_contact} for r in recs]
+def _parse_range(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """Один диапазон вида bytes=a-b / bytes=a- / bytes=-n. None — отдать весь файл."""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_s, _, end_s = range_header[len("bytes=") :].strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        else:
+            start = max(0, size - int(end_s))
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
 
-    pdf_bytes = build_report_pdf(
-        analysis_id=analysis.id,
-        indicators=indicators,
-        deviations=deviations,
-        recommendations=recommendations,
-    )
 
-    filename = f"report_{analysis.id}.pdf"
-    return Response(
-        content=pdf_bytes,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-    )
+@router.get("/{analysis_id}/pdf")
+async def get_report_pdf(
+    analysis_id: int,
+    if_none_match: str | None = Header(default=None),
+    range_header: str | None = Header(default=None, alias="Range"),
+    current_user: AuthUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    body, report_etag, final = await load_report(session, analysis_id, current_user.id)
+    # PDF однозначно определяется JSON-отчётом и версией шаблона — ETag известен без рендера/чтения из хранилища
+    etag = '"' + report_etag.strip('"') + f'-t{PDF_TEMPLATE_VERSION}"'
+    filename = f"report_{analysis_id}.pdf"
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    pdf_bytes: bytes | None = None
+    if final:
+        try:
+            pdf_bytes = await aget_object_bytes(_pdf_object_name(analysis_id))
+        except FileNotFoundError:
+            pdf_bytes = None
+        except Exception:
+            logger.exception("report %s: failed to read cached pdf", analysis_id)
+
+    if pdf_bytes is None:
+        # ReportLab — короткая CPU-работа: в потоке, не в event loop и не в очереди пула OCR
+        # (иначе первое скачивание PDF ждёт, пока распознаются все документы в очереди)
+        pdf_bytes = await asyncio.to_thread(build_report_pdf_from_payload, json.loads(body))
+        if final:
+            try:
+                await aput_object(_pdf_object_name(analysis_id), pdf_bytes, content_type="application/pdf")
+            except Exception:
+                # не удалось сохранить — не страшно, отдадим и отрендерим в следующий раз
+                logger.exception("report %s: failed to store rendered pdf", analysis_id)
 
+    rng = _parse_range(range_header, len(pdf_bytes))
+    if rng is not None:
+        start, end = rng
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(pdf_bytes)}"
+        return Response(content=pdf_bytes[start : end + 1], status_code=206, media_type="application/pdf", headers=headers)
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
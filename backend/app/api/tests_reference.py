@@ -1,12 +1,21 @@
 from fastapi import APIRouter
 
+from ..services.analytes import ANALYTES
+
 router = APIRouter()
 
 
 @router.get("/list")
 async def list_tests():
     return [
-        {"name": "Glucose", "ref_min": 3.9, "ref_max": 5.5, "units": "mmol/L"},
-        {"name": "Cholesterol", "ref_min": 0, "ref_max": 200, "units": "mg/dL"},
+        {
+            "key": a.key,
+            "code": a.code,
+            "name": a.name,
+            "ref_min": a.ref_min,
+            "ref_max": a.ref_max,
+            "units": a.units,
+            "synonyms": list(a.synonyms),
+        }
+        for a in ANALYTES
     ]
-
@@ -1,165 +1,262 @@
 from __future__ import annotations
 
+import asyncio
+import base64
+import mimetypes
 import uuid
-from decimal import Decimal
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import BinaryIO
 
-from fastapi import APIRouter, Depends, File, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from sqlalchemy import insert, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..db import get_session
-from ..models import Analysis, TestIndicator, User
-from ..schemas import UploadResponse
-from ..services.normalization import compute_deviation
-from ..services.ocr import extract_tests_from_pdf, extract_tests_from_text, mock_extract_tests, ocr_image_bytes, ocr_pdf_bytes
-from ..services.storage import put_object
-from .deps import get_current_user
+from ..models import Analysis
+from ..schemas import BatchUploadItem, BatchUploadResponse, UploadResponse
+from ..services.jobs import STATUS_RECEIVED, submit_analysis
+from ..services.storage import aput_stream
+from .deps import AuthUser, get_current_user
+from .limits import (
+    max_batch_expanded_bytes,
+    max_batch_files,
+    max_upload_bytes,
+    max_zip_ratio,
+    too_large_detail,
+)
 
 router = APIRouter()
 
 
-def _merge_tests(primary: list[dict], secondary: list[dict]) -> list[dict]:
-    """
-    Сливаем результаты двух парсеров (структурный PDF + OCR-текст) с дедупом по имени.
-    Предпочитаем запись, где есть числовое value/референсы/единицы/комментарий.
-    """
-
-    def _key(t: dict) -> str:
-        return " ".join(str(t.get("test_name", "")).lower().split())
-
-    def _score(t: dict) -> int:
-        s = 0
-        if t.get("value") is not None:
-            s += 3
-        if t.get("units"):
-            s += 1
-        if t.get("ref_min") is not None or t.get("ref_max") is not None:
-            s += 1
-        if t.get("comment"):
-            s += 1
-        return s
-
-    out: dict[str, dict] = {}
-    for t in primary + secondary:
-        k = _key(t)
-        if not k:
-            continue
-        if k not in out or _score(t) > _score(out[k]):
-            out[k] = t
-    return list(out.values())
-
-
-def _truncate_text(s: str | None, limit: int = 15000) -> str | None:
-    if not s:
-        return None
-    s = s.strip()
-    if len(s) <= limit:
-        return s
-    return s[:limit] + "\n\n...[truncated]..."
-
-
 @router.post("/document", response_model=UploadResponse)
 async def upload_document(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    # 1) сохраняем файл в MinIO
-    content = await file.read()
+    # тело больше лимита отсекает UploadSizeLimitMiddleware; здесь — размер самого файла
+    limit = max_upload_bytes()
+    if file.size is not None and file.size > limit:
+        raise HTTPException(status_code=413, detail=too_large_detail(limit))
+
+    # 1) сохраняем файл в MinIO — потоково из временного файла UploadFile, без чтения целиком в память
     object_name = f"{current_user.id}/{uuid.uuid4()}_{file.filename}"
-    put_object(object_name=object_name, content=content, content_type=file.content_type)
-
-    # 2) создаём анализ в БД
-    analysis = Analysis(
-        user_id=current_user.id,
-        source="web",
-        format=(file.content_type or "file"),
-        status="received",
-        document_ref=object_name,
+    # (в пуле потоков storage: event loop не блокируется на сетевой записи)
+    stored = await aput_stream(object_name, file.file, length=file.size, content_type=file.content_type)
+
+    # 2) создаём анализ в БД: один INSERT ... RETURNING id
+    analysis_id = await session.scalar(
+        insert(Analysis)
+        .values(
+            user_id=current_user.id,
+            source="web",
+            format=(file.content_type or "file"),
+            status=STATUS_RECEIVED,
+            document_ref=object_name,
+        )
+        .returning(Analysis.id)
     )
-    session.add(analysis)
     await session.commit()
-    await session.refresh(analysis)
-
-    # 3) OCR и извлечение показателей (MVP)
-    ocr_text: str | None = None
-    tests: list[dict] = []
-    ctype = (file.content_type or "").lower()
-    if ctype.startswith("image/"):
-        try:
-            ocr_text = ocr_image_bytes(content)
-            tests = extract_tests_from_text(ocr_text)
-        except Exception:
-            ocr_text = None
-            tests = []
-    elif ctype in ("application/pdf",) or ctype.endswith("+pdf"):
-        try:
-            import os
-
-            pdf_max_pages = int(os.environ.get("PDF_MAX_PAGES", "4"))
-            min_pdf_tests = int(os.environ.get("PDF_MIN_TESTS", "3"))
-
-            # 1) Пробуем структурно извлечь из "цифрового" PDF по координатам
-            tests_struct, preview = extract_tests_from_pdf(content, max_pages=pdf_max_pages)
-            ocr_text = _truncate_text(preview) or None
-
-            # 2) Fallback: если получилось слишком мало показателей — делаем OCR и построчный парсинг
-            tests = tests_struct
-            if len(tests_struct) < min_pdf_tests:
-                ocr_full = ocr_pdf_bytes(content, max_pages=pdf_max_pages)
-                tests_ocr = extract_tests_from_text(ocr_full)
-                tests = _merge_tests(tests_ocr, tests_struct) if len(tests_ocr) > len(tests_struct) else _merge_tests(tests_struct, tests_ocr)
-                # для пользователя/отладки полезнее хранить именно OCR-текст, а не preview из PDF
-                ocr_text = _truncate_text(ocr_full) or ocr_text
-        except Exception:
-            ocr_text = None
-            tests = []
-
-    # Важно: если OCR/парсер ничего не нашёл, оставляем пусто (это честнее, чем одинаковая заглушка).
-    # Заглушку оставим только как ручной fallback через env.
-    if not tests and (str(__import__("os").environ.get("USE_MOCK_TESTS", "false")).lower() == "true"):
-        tests = mock_extract_tests(ocr_text or "")
-
-    analysis.ocr_text = ocr_text
-    for t in tests:
-        value = Decimal(str(t.get("value"))) if t.get("value") is not None else None
-        ref_min = Decimal(str(t.get("ref_min"))) if t.get("ref_min") is not None else None
-        ref_max = Decimal(str(t.get("ref_max"))) if t.get("ref_max") is not None else None
-
-        ind = TestIndicator(
-            analysis_id=analysis.id,
-            test_name=str(t.get("test_name")),
-            value=value,
-            units=t.get("units"),
-            ref_min=ref_min,
-            ref_max=ref_max,
-            deviation=compute_deviation(value=value, ref_min=ref_min, ref_max=ref_max),
-            comment=t.get("comment"),
+
+    # 3) OCR и извлечение показателей — в фоне, в пуле воркеров.
+    # Клиент сразу получает analysis_id и следит за статусом через /report/{id}.
+    submit_analysis(analysis_id, object_name, file.content_type, stored.sha256)
+
+    return UploadResponse(analysis_id=analysis_id, status=STATUS_RECEIVED)
+
+
+# типы документов, которые понимает pipeline (PDF и изображения), по расширению члена zip
+_BATCH_TYPES = {"application/pdf", "image/png", "image/jpeg", "image/tiff"}
+
+
+@dataclass
+class _BatchDoc:
+    filename: str
+    data: BinaryIO
+    size: int | None
+    content_type: str | None
+
+
+def _is_zip(file: UploadFile) -> bool:
+    ct = (file.content_type or "").lower()
+    return ct in ("application/zip", "application/x-zip-compressed") or (file.filename or "").lower().endswith(".zip")
+
+
+# маленькие члены сжимаются как угодно сильно без вреда — степень сжатия проверяем начиная с 1 МБ
+_ZIP_RATIO_MIN_BYTES = 1024 * 1024
+
+
+def _zip_documents(zf: zipfile.ZipFile, limit: int, budget: int) -> list[tuple[zipfile.ZipInfo, str]]:
+    """
+    Документы архива: (член, content type). Каталоги, служебные файлы (__MACOSX, скрытые)
+    и неподдерживаемые типы пропускаются.
+    Защита от zip-бомб — по заголовкам, до распаковки (zipfile не отдаёт больше объявленного
+    file_size): член больше лимита одного файла, сумма членов больше budget байт или член
+    со степенью сжатия больше MAX_ZIP_RATIO -> 413.
+    """
+    ratio = max_zip_ratio()
+    total = 0
+    docs = []
+    for info in zf.infolist():
+        base = info.filename.rsplit("/", 1)[-1]
+        if info.is_dir() or not base or base.startswith(".") or info.filename.startswith("__MACOSX/"):
+            continue
+        content_type = mimetypes.guess_type(base)[0]
+        if content_type not in _BATCH_TYPES:
+            continue
+        if info.file_size > limit:
+            raise HTTPException(status_code=413, detail=f"{base}: {too_large_detail(limit)}")
+        if info.file_size > _ZIP_RATIO_MIN_BYTES and info.file_size > ratio * max(1, info.compress_size):
+            raise HTTPException(status_code=413, detail=f"{base}: compression ratio too high")
+        total += info.file_size
+        if total > budget:
+            raise HTTPException(status_code=413, detail="Batch too large after decompression")
+        docs.append((info, content_type))
+    return docs
+
+
+@router.post("/batch", response_model=BatchUploadResponse)
+async def upload_batch(
+    files: list[UploadFile] = File(...),
+    current_user: AuthUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Пакет документов одним запросом: несколько файлов и/или zip-архивы с PDF/изображениями.
+    Аутентификация, транзакция и постановка в очередь — один раз на пакет, файлы пишутся
+    в MinIO параллельно (пул потоков storage).
+    """
+    limit = max_upload_bytes()
+    # распакованный объём всех архивов пакета (MAX_BATCH_UPLOAD_MB ограничивает только сжатое тело)
+    budget = max_batch_expanded_bytes()
+    docs: list[_BatchDoc] = []
+    archives: list[zipfile.ZipFile] = []
+    try:
+        for file in files:
+            if _is_zip(file):
+                try:
+                    # чтение центрального каталога архива — дисковое I/O спула, не в event loop
+                    zf = await asyncio.to_thread(zipfile.ZipFile, file.file)
+                except zipfile.BadZipFile:
+                    raise HTTPException(status_code=400, detail=f"{file.filename}: invalid zip archive")
+                archives.append(zf)
+                members = _zip_documents(zf, limit, budget)
+                budget -= sum(info.file_size for info, _ in members)
+                for info, content_type in members:
+                    name = info.filename.rsplit("/", 1)[-1]
+                    docs.append(_BatchDoc(name, zf.open(info), info.file_size, content_type))
+            else:
+                if file.size is not None and file.size > limit:
+                    raise HTTPException(status_code=413, detail=f"{file.filename}: {too_large_detail(limit)}")
+                docs.append(_BatchDoc(file.filename or "file", file.file, file.size, file.content_type))
+
+        if not docs:
+            raise HTTPException(status_code=400, detail="No documents in batch")
+        max_files = max_batch_files()
+        if len(docs) > max_files:
+            raise HTTPException(status_code=400, detail=f"Too many documents in batch (max {max_files})")
+
+        # 1) все файлы в MinIO параллельно (члены одного zip читаются безопасно: ZipFile
+        # разделяет файл архива между открытыми членами под блокировкой)
+        object_names = [f"{current_user.id}/{uuid.uuid4()}_{d.filename}" for d in docs]
+        stored = await asyncio.gather(
+            *(
+                aput_stream(name, d.data, length=d.size, content_type=d.content_type)
+                for name, d in zip(object_names, docs)
+            )
         )
-        session.add(ind)
+    finally:
+        for zf in archives:
+            zf.close()
 
-    analysis.status = "processed"
+    # 2) все анализы пакета — один INSERT ... RETURNING id в одной транзакции
+    analysis_ids = list(
+        await session.scalars(
+            insert(Analysis).returning(Analysis.id, sort_by_parameter_order=True),
+            [
+                {
+                    "user_id": current_user.id,
+                    "source": "web",
+                    "format": (d.content_type or "file"),
+                    "status": STATUS_RECEIVED,
+                    "document_ref": name,
+                }
+                for name, d in zip(object_names, docs)
+            ],
+        )
+    )
     await session.commit()
 
-    return UploadResponse(analysis_id=analysis.id, status=analysis.status)
+    # 3) OCR всего пакета — в фоне, в общем пуле воркеров
+    for analysis_id, name, d, s in zip(analysis_ids, object_names, docs, stored):
+        submit_analysis(analysis_id, name, d.content_type, s.sha256)
+
+    return BatchUploadResponse(
+        analysis_ids=analysis_ids,
+        items=[
+            BatchUploadItem(analysis_id=analysis_id, filename=d.filename, status=STATUS_RECEIVED)
+            for analysis_id, d in zip(analysis_ids, docs)
+        ],
+    )
+
+
+def _encode_cursor(date: datetime, analysis_id: int) -> str:
+    raw = f"{date.isoformat()}|{analysis_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        date_s, _, id_s = raw.rpartition("|")
+        return datetime.fromisoformat(date_s), int(id_s)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.get("/history")
 async def history(
-    current_user: User = Depends(get_current_user),
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: str | None = None,
+    status: str | None = None,
+    source: str | None = None,
+    current_user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    # упрощённо: список анализов пользователя
-    from sqlalchemy import select
-
-    rows = (await session.execute(select(Analysis).where(Analysis.user_id == current_user.id))).scalars().all()
-    return [
-        {
-            "id": a.id,
-            "date": a.date.isoformat(),
-            "status": a.status,
-            "source": a.source,
-            "format": a.format,
-        }
-        for a in rows
-    ]
+    """
+    Анализы пользователя, новые сначала. Keyset-пагинация по (date, id):
+    next_cursor из ответа передаётся в следующий запрос. Читаем только нужные колонки
+    (без ocr_text/report_json) по индексу ix_analyses_user_id_date_id.
+    """
+    q = (
+        select(Analysis.id, Analysis.date, Analysis.status, Analysis.source, Analysis.format)
+        .where(Analysis.user_id == current_user.id)
+        .order_by(Analysis.date.desc(), Analysis.id.desc())
+        .limit(limit + 1)
+    )
+    if status:
+        q = q.where(Analysis.status == status)
+    if source:
+        q = q.where(Analysis.source == source)
+    if cursor:
+        c_date, c_id = _decode_cursor(cursor)
+        q = q.where(tuple_(Analysis.date, Analysis.id) < tuple_(c_date, c_id))
 
+    rows = (await session.execute(q)).all()
+    page = rows[:limit]
+    next_cursor = _encode_cursor(page[-1].date, page[-1].id) if len(rows) > limit else None
+    return {
+        "items": [
+            {
+                "id": a.id,
+                "date": a.date.isoformat(),
+                "status": a.status,
+                "source": a.source,
+                "format": a.format,
+            }
+            for a in page
+        ],
+        "next_cursor": next_cursor,
+    }
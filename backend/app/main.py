@@ -1,18 +1,32 @@
+import asyncio
 import os
 
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .api import auth, consultations, reports, tests_reference, uploads
-from .db import init_db
+from .api import analysis, auth, consultations, reports, tests_reference, uploads
+from .api.deps import require_metrics_token
+from .api.limits import UploadSizeLimitMiddleware, max_batch_bytes, max_upload_bytes
+from .db import pool_metrics
+from .migrate import migrate
+from .services import jobs, security, storage
+from .services.result_cache import get_result_cache
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    await init_db()
+    # DDL не на горячем пути старта: схему накатывает `python -m app.migrate` (см. docker-compose.yml)
+    if os.environ.get("DB_AUTO_MIGRATE", "false").lower() == "true":
+        await migrate()
+    # анализы, брошенные упавшим/перезапущенным процессом, не висят в received/processing
+    sweeper = asyncio.create_task(jobs.sweep_stale_analyses())
     yield
+    sweeper.cancel()
+    await jobs.shutdown()
+    storage.shutdown()
+    security.shutdown()
 
 
 app = FastAPI(title="MedicalLab Backend", lifespan=lifespan)
@@ -28,9 +42,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# лимит размера загрузок — до разбора multipart-тела (MAX_UPLOAD_MB)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={"/upload/document": max_upload_bytes, "/upload/batch": max_batch_bytes},
+)
+
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(uploads.router, prefix="/upload", tags=["uploads"])
 app.include_router(reports.router, prefix="/report", tags=["reports"])
+app.include_router(analysis.router, prefix="/analysis", tags=["analysis"])
 app.include_router(consultations.router, prefix="/consultation", tags=["consultations"])
 app.include_router(tests_reference.router, prefix="/tests", tags=["tests_reference"])
 
@@ -39,3 +60,11 @@ app.include_router(tests_reference.router, prefix="/tests", tags=["tests_referen
 async def root():
     return {"status": "ok", "message": "Medical Lab MVP Backend"}
 
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    cache = get_result_cache()
+    return {
+        "db_pool": pool_metrics(),
+        "result_cache": cache.stats() if cache is not None else None,
+    }
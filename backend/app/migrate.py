@@ -0,0 +1,89 @@
+"""
+Явный шаг миграции схемы: `python -m app.migrate`.
+
+Запускается один раз перед стартом uvicorn (см. docker-compose.yml), а не в каждом воркере
+на каждом старте. Автоматический запуск из lifespan — только при DB_AUTO_MIGRATE=true.
+"""
+
+import asyncio
+
+from sqlalchemy import insert, select, text, update
+
+from .db import engine
+from .models import Base, SchemaMarker
+from .services.normalization import TEST_KEY_VERSION, canonical_test_name
+
+
+async def migrate() -> None:
+    # MVP-упрощение: создаём таблицы автоматически.
+    # Для продакшена лучше Alembic-миграции.
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # MVP: "лёгкая миграция" для уже созданной БД (create_all не меняет типы колонок).
+        # application/pdf > 10 символов, поэтому расширяем колонку.
+        await conn.execute(text("ALTER TABLE IF EXISTS analyses ALTER COLUMN format TYPE VARCHAR(100)"))
+        await conn.execute(text("ALTER TABLE IF EXISTS analyses ADD COLUMN IF NOT EXISTS report_json TEXT"))
+        await conn.execute(text("ALTER TABLE IF EXISTS analyses ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP"))
+        # create_all не создаёт новые индексы на уже существующих таблицах
+        await conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_analyses_user_id_date_id "
+                "ON analyses (user_id, date DESC, id DESC)"
+            )
+        )
+        await conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_analyses_pending_date "
+                "ON analyses (date) WHERE status IN ('received', 'processing')"
+            )
+        )
+        await conn.execute(text("ALTER TABLE IF EXISTS test_indicators ADD COLUMN IF NOT EXISTS test_key VARCHAR(255)"))
+        await _rekey_indicators(conn)
+        await conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_test_indicators_test_key_analysis_id "
+                "ON test_indicators (test_key, analysis_id)"
+            )
+        )
+
+
+_TEST_KEY_MARKER = "test_key"
+
+
+async def _rekey_indicators(conn) -> None:
+    """
+    test_key по текущему словарю аналитов: проставляем старым строкам и обновляем после
+    изменения словаря. Различных названий немного — считаем ключи в Python по DISTINCT.
+    Выполняется один раз на TEST_KEY_VERSION (отметка в schema_markers), а не на каждом запуске.
+    """
+    done = await conn.scalar(select(SchemaMarker.version).where(SchemaMarker.name == _TEST_KEY_MARKER))
+    if done == TEST_KEY_VERSION:
+        return
+    pairs = (await conn.execute(text("SELECT DISTINCT test_name, test_key FROM test_indicators"))).all()
+    stale = [
+        {"name": name, "key": key}
+        for name, old_key in pairs
+        if (key := canonical_test_name(name)) != old_key
+    ]
+    if stale:
+        await conn.execute(
+            text("UPDATE test_indicators SET test_key = :key WHERE test_name = :name AND test_key IS DISTINCT FROM :key"),
+            stale,
+        )
+    if done is None:
+        await conn.execute(insert(SchemaMarker).values(name=_TEST_KEY_MARKER, version=TEST_KEY_VERSION))
+    else:
+        await conn.execute(
+            update(SchemaMarker).where(SchemaMarker.name == _TEST_KEY_MARKER).values(version=TEST_KEY_VERSION)
+        )
+
+
+async def _main() -> None:
+    try:
+        await migrate()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
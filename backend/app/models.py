@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import DateTime, ForeignKey, Integer, Numeric, String, Text
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, Numeric, String, Text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -41,10 +41,16 @@ class Analysis(Base):
     source: Mapped[str] = mapped_column(String(20), default="web")
     # content-type вроде application/pdf не помещается в 10 символов
     format: Mapped[str] = mapped_column(String(100), default="file")
-    status: Mapped[str] = mapped_column(String(20), default="received")  # received/processed/failed
+    status: Mapped[str] = mapped_column(String(20), default="received")  # received/processing/processed/failed
 
     document_ref: Mapped[str | None] = mapped_column(String(255), nullable=True)  # minio object key
-    ocr_text: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Большие текстовые колонки не грузятся при select(Analysis) (deferred) — только по явному запросу.
+    # ocr_text — превью (до 15000 символов); полный текст лежит сжатым в хранилище (ocr/{id}.txt.gz).
+    ocr_text: Mapped[str | None] = mapped_column(Text, nullable=True, deferred=True)
+    # готовый JSON отчёта (materialized при завершении обработки, анализ после этого не меняется)
+    report_json: Mapped[str | None] = mapped_column(Text, nullable=True, deferred=True)
+    # последняя отметка процесса API, у которого анализ в очереди/в обработке (jobs.fail_stale_analyses)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     user: Mapped[User] = relationship(back_populates="analyses")
     indicators: Mapped[list[TestIndicator]] = relationship(
@@ -52,6 +58,16 @@ class Analysis(Base):
     )
 
 
+# История анализов пользователя: WHERE user_id = ? ORDER BY date DESC, id DESC (keyset-пагинация)
+Index("ix_analyses_user_id_date_id", Analysis.user_id, Analysis.date.desc(), Analysis.id.desc())
+# Поиск зависших анализов (jobs.fail_stale_analyses): только незавершённые строки
+Index(
+    "ix_analyses_pending_date",
+    Analysis.date,
+    postgresql_where=Analysis.status.in_(("received", "processing")),
+)
+
+
 class TestIndicator(Base):
     __tablename__ = "test_indicators"
 
@@ -61,6 +77,8 @@ class TestIndicator(Base):
     )
 
     test_name: Mapped[str] = mapped_column(String(255), nullable=False)
+    # канонический ключ показателя (normalization.canonical_test_name) — по нему строятся тренды
+    test_key: Mapped[str | None] = mapped_column(String(255), nullable=True)
     value: Mapped[Decimal | None] = mapped_column(Numeric(18, 6), nullable=True)
     units: Mapped[str | None] = mapped_column(String(50), nullable=True)
     ref_min: Mapped[Decimal | None] = mapped_column(Numeric(18, 6), nullable=True)
@@ -70,3 +88,14 @@ class TestIndicator(Base):
 
     analysis: Mapped[Analysis] = relationship(back_populates="indicators")
 
+
+# Тренды: WHERE test_key IN (...) + JOIN analyses по analysis_id
+Index("ix_test_indicators_test_key_analysis_id", TestIndicator.test_key, TestIndicator.analysis_id)
+
+
+# Версии одноразовых шагов миграции данных (пересчёт test_key): шаг выполняется, только если версия изменилась
+class SchemaMarker(Base):
+    __tablename__ = "schema_markers"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
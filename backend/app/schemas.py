@@ -53,6 +53,17 @@ class UploadResponse(BaseModel):
     status: str
 
 
+class BatchUploadItem(BaseModel):
+    analysis_id: int
+    filename: str
+    status: str
+
+
+class BatchUploadResponse(BaseModel):
+    analysis_ids: list[int]
+    items: list[BatchUploadItem]
+
+
 class Indicator(BaseModel):
     test_name: str
     value: Decimal | None = None
@@ -0,0 +1,234 @@
+"""
+Словарь аналитов (канонические показатели) и сопоставление свободных названий из OCR/PDF с ними.
+
+Словарь компилируется один раз при импорте в префиксное дерево синонимов: поиск всех
+синонимов в тексте — один проход по началам слов, независимо от размера словаря.
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+@dataclass(frozen=True)
+class Analyte:
+    key: str  # стабильный ключ (test_key в БД, тренды, дедуп)
+    code: str  # LOINC-подобный код
+    name: str  # отображаемое имя
+    synonyms: tuple[str, ...] = ()
+    units: str | None = None  # единицы и референсы по умолчанию (взрослые)
+    ref_min: float | None = None
+    ref_max: float | None = None
+
+
+ANALYTES: tuple[Analyte, ...] = (
+    # Биохимия
+    Analyte("glucose", "2345-7", "Glucose", ("глюкоза", "глюкозы", "глюкоза в крови", "glu"), "mmol/L", 3.9, 5.5),
+    Analyte("hba1c", "4548-4", "HbA1c", ("гликированный гемоглобин", "гликозилированный гемоглобин", "hba1c", "hb a1c"), "%", 4.0, 6.0),
+    Analyte("insulin", "20448-7", "Insulin", ("инсулин",), "µU/mL", 2.6, 24.9),
+    Analyte("cholesterol", "2093-3", "Cholesterol", ("холестерин", "холестерин общий", "общий холестерин", "total cholesterol", "chol"), "mmol/L", 0, 5.2),
+    Analyte("hdl", "2085-9", "HDL cholesterol", ("холестерин лпвп", "лпвп холестерин", "лпвп", "hdl", "hdl cholesterol", "холестерин липопротеинов высокой плотности"), "mmol/L", 1.0, None),
+    Analyte("ldl", "2089-1", "LDL cholesterol", ("холестерин лпнп", "лпнп холестерин", "лпнп", "ldl", "ldl cholesterol", "холестерин липопротеинов низкой плотности"), "mmol/L", None, 3.0),
+    Analyte("triglycerides", "2571-8", "Triglycerides", ("триглицериды", "tg", "trig"), "mmol/L", None, 1.7),
+    Analyte("alt", "1742-6", "ALT", ("алт", "алат", "аланинаминотрансфераза", "аланинаминотрансфераза алт", "alanine aminotransferase"), "U/L", 0, 40),
+    Analyte("ast", "1920-8", "AST", ("аст", "асат", "аспартатаминотрансфераза", "aspartate aminotransferase"), "U/L", 0, 40),
+    Analyte("ggt", "2324-2", "GGT", ("ггт", "гамма гт", "гамма глутамилтрансфераза", "гамма глутамилтранспептидаза", "ggtp"), "U/L", 0, 55),
+    Analyte("alp", "6768-6", "Alkaline phosphatase", ("щелочная фосфатаза", "щф", "alp", "alkaline phosphatase"), "U/L", 40, 150),
+    Analyte("bilirubin_total", "1975-2", "Total bilirubin", ("билирубин общий", "общий билирубин", "билирубин", "total bilirubin", "bilirubin"), "µmol/L", 3.4, 20.5),
+    Analyte("bilirubin_direct", "1968-7", "Direct bilirubin", ("билирубин прямой", "прямой билирубин", "direct bilirubin"), "µmol/L", 0, 8.6),
+    Analyte("creatinine", "2160-0", "Creatinine", ("креатинин", "crea"), "µmol/L", 62, 115),
+    Analyte("urea", "3091-6", "Urea", ("мочевина", "urea"), "mmol/L", 2.5, 8.3),
+    Analyte("uric_acid", "3084-1", "Uric acid", ("мочевая кислота", "uric acid"), "µmol/L", 150, 420),
+    Analyte("protein_total", "2885-2", "Total protein", ("общий белок", "белок общий", "total protein"), "g/L", 64, 83),
+    Analyte("albumin", "1751-7", "Albumin", ("альбумин",), "g/L", 35, 52),
+    Analyte("crp", "1988-5", "CRP", ("с реактивный белок", "c реактивный белок", "срб", "crp", "c reactive protein"), "mg/L", 0, 5),
+    Analyte("iron", "2498-4", "Iron", ("железо", "железо сывороточное", "сывороточное железо", "fe"), "µmol/L", 9, 30.4),
+    Analyte("ferritin", "2276-4", "Ferritin", ("ферритин",), "ng/mL", 20, 250),
+    Analyte("vitamin_b12", "2132-9", "Vitamin B12", ("витамин b12", "витамин в12", "цианокобаламин", "b12"), "pg/mL", 187, 883),
+    Analyte("vitamin_d", "1989-3", "25-OH vitamin D", ("витамин d", "витамин д", "25 oh витамин d", "25 он витамин d", "25 oh vitamin d", "vitamin d"), "ng/mL", 30, 100),
+    Analyte("sodium", "2951-2", "Sodium", ("натрий", "na"), "mmol/L", 136, 145),
+    Analyte("potassium", "2823-3", "Potassium", ("калий",), "mmol/L", 3.5, 5.1),
+    Analyte("calcium", "17861-6", "Calcium", ("кальций", "кальций общий", "общий кальций", "ca"), "mmol/L", 2.15, 2.5),
+    Analyte("calcium_ionized", "1994-3", "Ionized calcium", ("кальций ионизированный", "ионизированный кальций", "ca++"), "mmol/L", 1.15, 1.29),
+    # Гормоны
+    Analyte("tsh", "3016-3", "TSH", ("ттг", "тиреотропный гормон", "tsh"), "mIU/L", 0.4, 4.0),
+    Analyte("ft4", "3024-7", "Free T4", ("т4 свободный", "свободный т4", "free t4", "ft4"), "pmol/L", 9, 19),
+    # Общий анализ крови
+    Analyte("hemoglobin", "718-7", "Hemoglobin", ("гемоглобин", "hgb", "hb", "hemoglobin"), "g/L", None, None),
+    Analyte("hematocrit", "4544-3", "Hematocrit", ("гематокрит", "hct", "hematocrit"), "%", None, None),
+    Analyte("rbc", "789-8", "RBC", ("эритроциты", "rbc"), "10^12/L", None, None),
+    Analyte("wbc", "6690-2", "WBC", ("лейкоциты", "wbc"), "10^9/L", 4.0, 9.0),
+    Analyte("platelets", "777-3", "Platelets", ("тромбоциты", "plt"), "10^9/L", 150, 400),
+    Analyte("esr", "30341-2", "ESR", ("соэ", "скорость оседания эритроцитов", "esr"), "mm/h", None, None),
+    Analyte("mcv", "787-2", "MCV", ("mcv", "средний объем эритроцита", "средний объём эритроцита"), "fL", 80, 100),
+    Analyte("mch", "785-6", "MCH", ("mch", "среднее содержание гемоглобина в эритроците"), "pg", 27, 34),
+    Analyte("mchc", "786-4", "MCHC", ("mchc", "средняя концентрация гемоглобина в эритроците"), "g/L", 300, 380),
+)
+
+# Дефисы/тире и любые пробелы в названиях эквивалентны одному пробелу ("25-OH" == "25 oh")
+_SEPARATORS = frozenset(" \t\r\n\f\v-‐‑‒–—−_")
+_SEPARATOR_RE = re.compile("[" + re.escape("".join(sorted(_SEPARATORS))) + "]")
+_SPACE_RUN_RE = re.compile(r"^ | {2,}")
+_WORD_START_RE = re.compile(r"(?<!\w)\w")
+_WORD_RE = re.compile(r"\w+")
+
+# Слова, которые могут окружать синоним в названии показателя, не меняя аналит
+# (материал и условия забора: кровь/сыворотка/плазма). "моча", "непрямой" и т.п. сюда не входят.
+_QUALIFIERS = frozenset(
+    {
+        "в", "из", "крови", "кровь", "сыворотке", "сыворотки", "сыворотка", "плазме", "плазмы", "плазма",
+        "венозной", "капиллярной", "натощак", "in", "blood", "serum", "plasma",
+    }
+)
+
+
+def _fold(ch: str) -> str:
+    if ch in _SEPARATORS:
+        return " "
+    low = ch.lower()
+    if len(low) != 1:  # "İ".lower() — два символа; позиции в тексте должны сохраниться
+        return ch
+    return "е" if low == "ё" else low
+
+
+def _fold_text(text: str) -> str:
+    """_fold для всей строки; длина сохраняется. Обычный путь — lower/re.sub на уровне C."""
+    low = text.lower()
+    if len(low) != len(text):
+        return "".join(map(_fold, text))
+    # str.translate с не-ASCII таблицей посимвольный и в разы медленнее
+    return _SEPARATOR_RE.sub(" ", low).replace("ё", "е")
+
+
+def _fold_pattern(s: str) -> str:
+    return " ".join(_fold_text(s).split())
+
+
+@dataclass(frozen=True)
+class AnalyteMatch:
+    start: int
+    end: int  # позиция после совпадения в исходном тексте
+    analyte: Analyte
+
+
+class AnalyteMatcher:
+    """
+    Префиксное дерево (trie) синонимов словаря. Совпадения — только целыми словами,
+    поэтому дерево проходим только от начала слов (их находит regex на уровне C):
+    на каждом шаге — один dict lookup, обычно 1–3 шага на слово.
+    Из пересекающихся совпадений берём самое левое, а среди них — самое длинное
+    ("холестерин лпвп" -> HDL, а не Cholesterol).
+    """
+
+    def __init__(self, analytes: tuple[Analyte, ...]) -> None:
+        self._children: list[dict[str, int]] = [{}]
+        self._terminal: list[Analyte | None] = [None]
+        for a in analytes:
+            for syn in {_fold_pattern(s) for s in (a.key.replace("_", " "), a.name, *a.synonyms)}:
+                if syn:
+                    self._add(syn, a)
+
+    def _add(self, pattern: str, analyte: Analyte) -> None:
+        node = 0
+        for ch in pattern:
+            nxt = self._children[node].get(ch)
+            if nxt is None:
+                nxt = len(self._children)
+                self._children[node][ch] = nxt
+                self._children.append({})
+                self._terminal.append(None)
+            node = nxt
+        # один синоним у двух аналитов — побеждает объявленный раньше
+        if self._terminal[node] is None:
+            self._terminal[node] = analyte
+
+    def find(self, text: str) -> list[AnalyteMatch]:
+        """Все аналиты в тексте за один проход: непересекающиеся совпадения слева направо."""
+        folded = _fold_text(text)
+        # Схлопываем пробелы в начале и подряд идущие разделители. Позиция в исходном тексте:
+        # orig = k + shifts[i], где i — последний отрезок с cuts[i] <= k.
+        cuts, shifts = [0], [0]
+        if _SPACE_RUN_RE.search(folded):
+            parts: list[str] = []
+            last = removed = 0
+            for m in _SPACE_RUN_RE.finditer(folded):
+                keep = 0 if m.start() == 0 else 1
+                parts.append(folded[last : m.start() + keep])
+                removed += m.end() - m.start() - keep
+                last = m.end()
+                cuts.append(m.end() - removed)
+                shifts.append(removed)
+            parts.append(folded[last:])
+            folded = "".join(parts)
+
+        def _orig(k: int) -> int:
+            return k + shifts[bisect_right(cuts, k) - 1]
+
+        children, terminal = self._children, self._terminal
+        n = len(folded)
+        out: list[AnalyteMatch] = []
+        last_end = 0
+        for m in _WORD_START_RE.finditer(folded):
+            start = m.start()
+            if start < last_end:
+                continue
+            node, k, best = 0, start, None
+            while k < n:
+                node = children[node].get(folded[k])
+                if node is None:
+                    break
+                k += 1
+                # синоним закончился на границе слова — кандидат; идём дальше за более длинным
+                if terminal[node] is not None and (k == n or not folded[k].isalnum()):
+                    best = (k, terminal[node])
+            if best is not None:
+                out.append(AnalyteMatch(_orig(start), _orig(best[0] - 1) + 1, best[1]))
+                last_end = best[0]
+        return out
+
+    def match_name(self, name: str | None) -> Analyte | None:
+        """
+        Аналит для названия показателя — только если название целиком состоит из его синонимов
+        и уточнений, не меняющих аналит ("Глюкоза (GLU)", "Глюкоза в сыворотке крови").
+        Остаток, меняющий смысл ("Глюкоза в моче", "Билирубин непрямой", "Холестерин ЛПОНП"),
+        -> None: такой показатель — не словарный аналит, а отдельный.
+        """
+        if not name:
+            return None
+        matches = self.find(name)
+        if not matches or any(m.analyte is not matches[0].analyte for m in matches):
+            return None
+        rest, last = [], 0
+        for m in matches:
+            rest.append(name[last : m.start])
+            last = m.end
+        rest.append(name[last:])
+        if not _QUALIFIERS.issuperset(_WORD_RE.findall(_fold_text(" ".join(rest)))):
+            return None
+        return matches[0].analyte
+
+    def mentions(self, text: str | None) -> bool:
+        """В тексте есть хотя бы один синоним словаря (в любом месте)."""
+        return bool(text) and bool(self.find(text))
+
+
+# Словарь компилируется один раз на процесс (воркеры пула OCR получают его при fork/импорте)
+_matcher = AnalyteMatcher(ANALYTES)
+
+
+def find_analytes(text: str) -> list[AnalyteMatch]:
+    return _matcher.find(text)
+
+
+# названия показателей повторяются (варианты OCR одной страницы, типовые бланки) — кэшируем
+@lru_cache(maxsize=4096)
+def match_analyte(name: str | None) -> Analyte | None:
+    return _matcher.match_name(name)
+
+
+def mentions_analyte(text: str | None) -> bool:
+    """Похоже ли на название показателя (для отсева мусора парсерами; ключ не определяет)."""
+    return _matcher.mentions(text)
@@ -0,0 +1,54 @@
+"""
+События обработки анализов для GET /analysis/{id}/events (SSE): смена статуса,
+прогресс OCR по страницам, итоговый отчёт.
+
+Шина — в памяти процесса API: публикует services/jobs.py (фоновые задачи обработки живут
+в том же процессе), подписчики — открытые SSE-соединения. Подписчик другого процесса uvicorn
+событий не увидит, поэтому SSE-обработчик дополнительно сверяет статус с БД на heartbeat.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+EVENT_STATUS = "status"
+EVENT_PROGRESS = "progress"
+EVENT_REPORT = "report"
+
+# медленный клиент не должен копить события без предела: при переполнении старые отбрасываем
+_QUEUE_SIZE = 64
+
+
+@dataclass
+class Event:
+    event: str
+    data: Any = field(default=None)
+
+
+_subscribers: dict[int, set[asyncio.Queue]] = {}
+
+
+@contextmanager
+def subscribe(analysis_id: int) -> Iterator[asyncio.Queue]:
+    """Очередь событий анализа на время соединения."""
+    q: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_SIZE)
+    _subscribers.setdefault(analysis_id, set()).add(q)
+    try:
+        yield q
+    finally:
+        subs = _subscribers.get(analysis_id)
+        if subs is not None:
+            subs.discard(q)
+            if not subs:
+                del _subscribers[analysis_id]
+
+
+def publish(analysis_id: int, event: str, data: Any = None) -> None:
+    """Разослать событие подписчикам анализа (вызывать из event loop)."""
+    for q in _subscribers.get(analysis_id, ()):
+        if q.full():
+            q.get_nowait()
+        q.put_nowait(Event(event, data))
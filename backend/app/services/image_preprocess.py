@@ -0,0 +1,285 @@
+"""
+Предобработка изображений для OCR на NumPy.
+
+Одно изображение в оттенках серого: гистограмма считается один раз, из неё на NumPy —
+решение об инверсии (средняя яркость) и пороги бинаризации (метод Оцу). Все бинарные
+варианты строятся из того же буфера таблицей подстановки на 256 значений через Image.point
+(проход по пикселям на C, без промежуточных массивов; быстрее fancy-indexing NumPy).
+Массив NumPy из пикселей нужен только опциональным стадиям (deskew, adaptive).
+
+OCR_PREPROCESS — опциональные стадии через запятую:
+- deskew: выравнивание наклона (проекционный профиль строк текста);
+- denoise: медианный фильтр 3x3 на NumPy (сканы/фото с "солью и перцем");
+- adaptive: дополнительный вариант с локальным порогом (неравномерное освещение, фото).
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+MIN_SIDE = 1200  # без оценки высоты строк: изображения меньше увеличиваем в 2 раза
+TEXT_HEIGHT_PX = 30  # целевая высота строки текста для Tesseract (от верха до низа букв)
+MIN_SCALE = 0.35
+MAX_SCALE = 3.0
+SCALE_SLACK = 0.2  # масштаб в пределах 1±20% не трогаем: ресэмплинг дороже выигрыша
+LAYOUT_PROBE_SIDE = 1000  # разметку ищем на уменьшенной копии
+INK_ROW_MIN = 0.004  # доля тёмных пикселей: ниже — пустая строка пикселей (промежуток между строками)
+# текст даёт короткие серии "чернил"; край листа, тень, фон фото, линейки таблиц — длинные:
+# средняя длина серии больше этой доли строки/столбца — это не текст
+MAX_MEAN_RUN = 0.1
+CROP_MASS = 0.003  # доля "чернил", отбрасываемая с каждого края (одиночные точки на полях)
+LAYOUT_STRIPS = 4  # профиль строк считаем в вертикальных полосах: наклон меньше склеивает строки
+DARK_MEAN = 110  # средняя яркость ниже — тёмный фон (скриншот/тёмная тема), инвертируем
+THRESHOLD_SPREAD = 30  # пороги: Оцу и ±30 (раньше фиксированные 140/170/200)
+MIN_VARIANT_DIFF = 0.002  # доля пикселей между двумя порогами, ниже — варианты почти одинаковые
+MAX_SKEW_DEG = 5.0
+SKEW_STEP_DEG = 0.25
+ADAPTIVE_C = 10  # локальный порог: пиксель темнее среднего по окну больше чем на C — текст
+
+_LEVELS = np.arange(256)
+_INVERT_LUT = (255 - _LEVELS).tolist()
+
+
+@dataclass
+class TextLayout:
+    box: tuple[int, int, int, int]  # область текста (x0, y0, x1, y1) в пикселях изображения
+    line_height: float | None  # медианная высота строки текста, px; None — не удалось оценить
+
+
+@dataclass
+class Variant:
+    name: str  # стабильное имя варианта (статистика побед в ocr_image)
+    image: Image.Image
+
+
+def _stages() -> set[str]:
+    raw = os.environ.get("OCR_PREPROCESS", "")
+    return {s.strip().lower() for s in raw.split(",") if s.strip()}
+
+
+def histogram(gray: Image.Image) -> np.ndarray:
+    return np.asarray(gray.histogram(), dtype=np.int64)
+
+
+def otsu_threshold(hist: np.ndarray) -> int:
+    """Порог Оцу по гистограмме: максимум межклассовой дисперсии (пиксели > t — фон)."""
+    total = float(hist.sum())
+    omega = np.cumsum(hist, dtype=np.float64)
+    mu = np.cumsum(hist * _LEVELS, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma_b = (mu[-1] * omega - mu * total) ** 2 / (omega * (total - omega))
+    sigma_b[~np.isfinite(sigma_b)] = -1.0
+    peak = sigma_b.max()
+    if peak <= 0:  # один уровень яркости (пустая страница) — порог не важен
+        return 127
+    # между уровнями без пикселей критерий постоянный — берём середину плато, а не его край
+    best = np.flatnonzero(sigma_b >= peak * (1 - 1e-9))
+    return int(best[0] + best[-1]) // 2
+
+
+def pick_thresholds(hist: np.ndarray) -> list[tuple[str, int]]:
+    """
+    Оцу и соседние пороги (имя, порог); порог, который почти не меняет картинку относительно
+    уже выбранных (между порогами < MIN_VARIANT_DIFF пикселей), отбрасываем — лишний проход OCR.
+    """
+    t = otsu_threshold(hist)
+    cum = np.cumsum(hist) / max(1, int(hist.sum()))
+    picked: list[tuple[str, int]] = []
+    for name, cand in (("otsu", t), ("otsu_low", t - THRESHOLD_SPREAD), ("otsu_high", t + THRESHOLD_SPREAD)):
+        cand = min(254, max(1, cand))
+        if all(abs(cum[cand] - cum[p]) >= MIN_VARIANT_DIFF for _, p in picked):
+            picked.append((name, cand))
+    return picked
+
+
+def binarize(gray: Image.Image, threshold: int) -> Image.Image:
+    return gray.point(np.where(_LEVELS > threshold, 255, 0).tolist())
+
+
+def estimate_skew(gray: np.ndarray, threshold: int) -> float:
+    """
+    Угол наклона строк (градусы, >0 — строки уходят вниз вправо). Перебираем углы и берём тот,
+    при котором проекция тёмных пикселей на ось y самая "резкая" (строки не размазаны).
+    Считаем на прореженном изображении: угол от масштаба не зависит.
+    """
+    step = max(1, max(gray.shape) // 1000)
+    ys, xs = np.nonzero(gray[::step, ::step] <= threshold)
+    if ys.size < 100:
+        return 0.0
+    if ys.size > 200_000:
+        keep = np.linspace(0, ys.size - 1, 200_000).astype(np.int64)
+        ys, xs = ys[keep], xs[keep]
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW_DEG, MAX_SKEW_DEG + SKEW_STEP_DEG / 2, SKEW_STEP_DEG):
+        proj = np.rint(ys - xs * np.tan(np.radians(angle))).astype(np.int64)
+        counts = np.bincount(proj - proj.min())
+        score = float(np.dot(counts, counts))
+        # при равенстве — меньший по модулю угол (не крутим без необходимости)
+        if score > best_score or (score == best_score and abs(angle) < abs(best_angle)):
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+# Сеть сравнений для медианы 9 элементов (19 обменов, медиана в позиции 4)
+_MEDIAN9_NETWORK = (
+    (1, 2), (4, 5), (7, 8), (0, 1), (3, 4), (6, 7), (1, 2), (4, 5), (7, 8), (0, 3),
+    (5, 8), (4, 7), (3, 6), (1, 4), (2, 5), (4, 7), (4, 2), (6, 4), (4, 2),
+)
+
+
+def median3(gray: np.ndarray) -> np.ndarray:
+    """
+    Медианный фильтр 3x3: сеть сравнений над 9 сдвинутыми представлениями массива
+    (np.minimum/np.maximum целиком по изображению). Результат совпадает с
+    ImageFilter.MedianFilter(3), но на порядок быстрее.
+    """
+    h, w = gray.shape
+    padded = np.pad(gray, 1, mode="edge")
+    v = [padded[dy : dy + h, dx : dx + w] for dy in range(3) for dx in range(3)]
+    for i, j in _MEDIAN9_NETWORK:
+        lo = np.minimum(v[i], v[j])
+        v[j] = np.maximum(v[i], v[j])
+        v[i] = lo
+    return v[4]
+
+
+def adaptive_binarize(gray: Image.Image, c: int = ADAPTIVE_C) -> Image.Image:
+    """Локальный порог: пиксель против среднего по окну ~1/40 меньшей стороны (BoxBlur на C)."""
+    r = max(7, min(gray.size) // 80)
+    mean = np.asarray(gray.filter(ImageFilter.BoxBlur(r)), dtype=np.int16)
+    return Image.fromarray(np.asarray(gray, dtype=np.int16) > mean - c)
+
+
+def dark_on_light(gray: Image.Image) -> Image.Image:
+    """Тёмный фон (скриншот/тёмная тема) — инвертируем: дальше везде тёмный текст на светлом."""
+    hist = histogram(gray)
+    if float(hist @ _LEVELS) / max(1, int(hist.sum())) < DARK_MEAN:
+        return gray.point(_INVERT_LUT)
+    return gray
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """Длины серий True в 1D-маске."""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+
+def _text_profile(ink: np.ndarray, axis: int) -> np.ndarray:
+    """
+    Профиль "текстовости" строк (axis=1) или столбцов (axis=0): число серий "чернил",
+    0 — если серий нет или они в среднем длинные (рамки, фон, края листа).
+    """
+    first = np.take(ink, 0, axis=axis).astype(np.int64)
+    starts = (ink[:, 1:] & ~ink[:, :-1]) if axis == 1 else (ink[1:] & ~ink[:-1])
+    segments = first + starts.sum(axis=axis)
+    mean_run = ink.sum(axis=axis) / np.maximum(segments, 1)
+    return np.where(mean_run <= MAX_MEAN_RUN * ink.shape[axis], segments, 0)
+
+
+def _mass_bounds(mass: np.ndarray) -> tuple[int, int]:
+    """[начало, конец) отрезка, содержащего всё, кроме CROP_MASS массы с каждого края."""
+    cum = np.cumsum(mass, dtype=np.float64)
+    total = cum[-1]
+    lo = int(np.searchsorted(cum, total * CROP_MASS, side="right"))
+    hi = int(np.searchsorted(cum, total * (1 - CROP_MASS), side="left")) + 1
+    return lo, max(lo + 1, min(hi, mass.size))
+
+
+def text_layout(gray: Image.Image) -> TextLayout | None:
+    """
+    Предварительный проход разметки по проекциям "чернил" (тёмный текст на светлом фоне):
+    рамка текста без полей/фона и медианная высота строки. На уменьшенной копии — дёшево.
+    None — текста не нашли (пустая страница, шум).
+    """
+    factor = max(1, -(-max(gray.size) // LAYOUT_PROBE_SIDE))
+    small = gray.reduce(factor) if factor > 1 else gray
+    ink = np.asarray(small) <= otsu_threshold(histogram(small))
+
+    # серии "чернил" в строках/столбцах: по ним отличаем текст от полей, рамок и фона
+    rows = _text_profile(ink, axis=1)
+    if np.count_nonzero(rows) < 2:
+        return None
+    y0, y1 = _mass_bounds(rows)
+    # столбцы — в полосе строк текста целиком (с промежутками: строки текста дают разные серии)
+    cols = _text_profile(ink[y0:y1], axis=0)
+    if not cols.any():
+        return None
+    x0, x1 = _mass_bounds(cols)
+
+    # высота строки: серии непустых строк пикселей в нескольких вертикальных полосах рамки
+    region = ink[y0:y1, x0:x1]
+    heights = []
+    for strip in np.array_split(region, LAYOUT_STRIPS, axis=1):
+        if strip.shape[1] == 0:
+            continue
+        runs = _runs(strip.mean(axis=1) >= INK_ROW_MIN)
+        heights.append(runs[runs >= 2])
+    runs = np.concatenate(heights) if heights else np.zeros(0)
+    # меньше трёх строк или "строка" в пол-рамки (склеились из-за наклона) — высоте не верим
+    line_height = float(np.median(runs)) * factor if runs.size >= 3 else None
+    if line_height is not None and line_height * 4 > (y1 - y0) * factor:
+        line_height = None
+
+    # поля вокруг текста: строка сверху/снизу, чтобы не срезать выносные элементы букв
+    pad = int(round(line_height if line_height else 0.02 * max(gray.size)))
+    w, h = gray.size
+    box = (
+        max(0, x0 * factor - pad),
+        max(0, y0 * factor - pad),
+        min(w, x1 * factor + pad),
+        min(h, y1 * factor + pad),
+    )
+    return TextLayout(box=box, line_height=line_height)
+
+
+def text_scale(layout: TextLayout | None, size: tuple[int, int]) -> float:
+    """Масштаб для OCR: высота строки -> TEXT_HEIGHT_PX; без оценки — прежнее правило MIN_SIDE."""
+    if layout is None or layout.line_height is None:
+        return 2.0 if max(size) < MIN_SIDE else 1.0
+    return min(MAX_SCALE, max(MIN_SCALE, TEXT_HEIGHT_PX / layout.line_height))
+
+
+def fit_text(gray: Image.Image) -> Image.Image:
+    """Обрезка до области текста и масштаб по высоте строк — в Tesseract уходит только нужное."""
+    layout = text_layout(gray)
+    if layout is not None and layout.box != (0, 0, *gray.size):
+        gray = gray.crop(layout.box)
+    scale = text_scale(layout, gray.size)
+    if abs(scale - 1.0) <= SCALE_SLACK:
+        return gray
+    w, h = gray.size
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    # при уменьшении reducing_gap: сначала быстрый reduce() на C, затем Lanczos
+    return gray.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0 if scale < 1 else None)
+
+
+def ocr_variants(image: Image.Image, stages: set[str] | None = None) -> list[Variant]:
+    """
+    Варианты изображения для мульти-прохода OCR: серое + бинарные по порогам из гистограммы
+    (+ адаптивный, если включён). Первый — "gray", далее в порядке приоритета.
+    """
+    stages = _stages() if stages is None else stages
+    gray_img = dark_on_light(image if image.mode == "L" else image.convert("L"))
+    # обрезка и масштаб в одном канале (ресэмплинг Lanczos — чёткие штрихи), затем гистограмма заново
+    gray_img = fit_text(gray_img)
+    hist = histogram(gray_img)
+
+    if "denoise" in stages:
+        gray_img = Image.fromarray(median3(np.asarray(gray_img)))
+        hist = histogram(gray_img)
+    if "deskew" in stages:
+        angle = estimate_skew(np.asarray(gray_img), otsu_threshold(hist))
+        if abs(angle) >= SKEW_STEP_DEG:
+            gray_img = gray_img.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+            hist = histogram(gray_img)
+
+    variants = [Variant("gray", gray_img)]
+    for name, t in pick_thresholds(hist):
+        variants.append(Variant(name, binarize(gray_img, t)))
+    if "adaptive" in stages:
+        variants.append(Variant("adaptive", adaptive_binarize(gray_img)))
+    return variants
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, update
+
+from ..db import async_session
+from ..models import Analysis, TestIndicator
+from . import events, ocr_engine
+from .normalization import canonical_test_name, compute_deviations, to_decimal
+from .pipeline import analyze_stored_document
+from .report_generator import build_report_payload, dump_report, invalidate_report
+from .result_cache import cache_key, get_result_cache
+from .storage import aput_ocr_text
+
+logger = logging.getLogger(__name__)
+
+# Статусы Analysis.status
+STATUS_RECEIVED = "received"
+STATUS_PROCESSING = "processing"
+STATUS_PROCESSED = "processed"
+STATUS_FAILED = "failed"
+# незавершённые статусы: только из них анализ переходит дальше
+PENDING_STATUSES = (STATUS_RECEIVED, STATUS_PROCESSING)
+
+_executor: Executor | None = None
+# фоновые задачи -> analysis_id: держим ссылки (иначе asyncio может собрать задачу GC до завершения)
+# и знаем, какие анализы этот процесс ещё обрабатывает
+_tasks: dict[asyncio.Task, int] = {}
+
+# Прогресс OCR по страницам из воркеров пула: (analysis_id, готово, всего).
+# В процессе API очередь читает поток _forward_progress и публикует события в event loop;
+# в воркере это та же очередь, полученная через initializer пула.
+_progress_queue: multiprocessing.Queue | None = None
+_progress_thread: threading.Thread | None = None
+
+
+def get_executor() -> Executor:
+    """
+    Пул процессов для OCR/извлечения. Tesseract/PyMuPDF/парсеры — CPU-bound,
+    в event loop их запускать нельзя: один скан блокирует все запросы воркера uvicorn.
+    Воркеры живут долго: модели Tesseract загружаются один раз при старте воркера.
+    """
+    global _executor, _progress_queue, _progress_thread
+    if _executor is None:
+        _progress_queue = multiprocessing.Queue()
+        _progress_thread = threading.Thread(
+            target=_forward_progress,
+            args=(_progress_queue, asyncio.get_running_loop()),
+            name="ocr-progress",
+            daemon=True,
+        )
+        _progress_thread.start()
+        # общий счётчик занятых воркеров: по нему воркер делит ядра между страницами/проходами документа
+        busy = multiprocessing.Value("i", 0)
+        _executor = ProcessPoolExecutor(
+            max_workers=ocr_engine.ocr_workers(), initializer=_init_worker, initargs=(_progress_queue, busy)
+        )
+    return _executor
+
+
+async def shutdown(timeout: float = 10) -> None:
+    """
+    Остановка процесса: незавершённые задачи отменяем — каждая помечает свой анализ failed
+    (очередь живёт только в памяти процесса, после рестарта продолжить её некому).
+    """
+    global _executor, _progress_queue, _progress_thread
+    tasks = list(_tasks)
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    if _progress_queue is not None:
+        _progress_queue.put(None)
+        _progress_queue = None
+        _progress_thread = None
+
+
+def _init_worker(progress_queue: multiprocessing.Queue, busy) -> None:
+    """Инициализатор воркера пула OCR: очередь прогресса, счётчик занятых воркеров, прогрев Tesseract."""
+    global _progress_queue
+    _progress_queue = progress_queue
+    ocr_engine.set_busy_counter(busy)
+    ocr_engine.warm_up()
+
+
+def _report_progress(analysis_id: int, done: int, total: int) -> None:
+    if _progress_queue is not None:
+        _progress_queue.put((analysis_id, done, total))
+
+
+def _analyze_in_worker(analysis_id: int, document_ref: str, content_type: str | None) -> tuple[str | None, list[dict]]:
+    """Задача воркера: analyze_stored_document с отчётом о прогрессе в процесс API."""
+    with ocr_engine.busy():
+        return analyze_stored_document(document_ref, content_type, functools.partial(_report_progress, analysis_id))
+
+
+def _forward_progress(queue: multiprocessing.Queue, loop: asyncio.AbstractEventLoop) -> None:
+    while True:
+        item = queue.get()
+        if item is None:
+            return
+        analysis_id, done, total = item
+        try:
+            loop.call_soon_threadsafe(
+                events.publish, analysis_id, events.EVENT_PROGRESS, {"pages_done": done, "pages_total": total}
+            )
+        except RuntimeError:
+            # event loop уже закрыт (остановка процесса)
+            return
+
+
+def _stale_minutes() -> int:
+    try:
+        return max(1, int(os.environ.get("JOB_STALE_MINUTES", "30")))
+    except ValueError:
+        return 30
+
+
+async def fail_stale_analyses() -> list[int]:
+    """
+    Анализы в received/processing без отметки живого процесса дольше JOB_STALE_MINUTES -> failed:
+    процесс, который их обрабатывал, упал или перезапущен.
+
+    Длинная очередь сама по себе не «зависание»: сначала отмечаем heartbeat_at у анализов,
+    которые этот процесс держит в _tasks (каждый воркер uvicorn — свои), и их же исключаем.
+    Идемпотентно — безопасно запускать из всех воркеров одновременно; интервал обхода
+    (sweep_stale_analyses) должен быть меньше JOB_STALE_MINUTES.
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(minutes=_stale_minutes())
+    local = set(_tasks.values())
+    async with async_session() as session, session.begin():
+        if local:
+            await session.execute(
+                update(Analysis)
+                .where(Analysis.id.in_(local), Analysis.status.in_(PENDING_STATUSES))
+                .values(heartbeat_at=now)
+            )
+        stale = update(Analysis).where(
+            Analysis.status.in_(PENDING_STATUSES),
+            func.coalesce(Analysis.heartbeat_at, Analysis.date) < cutoff,
+        )
+        if local:
+            stale = stale.where(Analysis.id.not_in(local))
+        ids = list(await session.scalars(stale.values(status=STATUS_FAILED).returning(Analysis.id)))
+    for analysis_id in ids:
+        events.publish(analysis_id, events.EVENT_STATUS, {"status": STATUS_FAILED})
+    return ids
+
+
+async def sweep_stale_analyses(interval: float = 300) -> None:
+    """Фоновая задача процесса API: fail_stale_analyses при старте и затем каждые interval секунд."""
+    while True:
+        try:
+            ids = await fail_stale_analyses()
+            if ids:
+                logger.warning("marked %d stale analyses as failed: %s", len(ids), ids)
+        except Exception:
+            logger.exception("stale analyses sweep failed")
+        await asyncio.sleep(interval)
+
+
+async def _set_status(analysis_id: int, status: str) -> bool:
+    """
+    received/processing -> status. False, если анализ уже завершён (например, его пометил failed
+    обход зависших) или удалён: завершённый анализ не «воскрешаем».
+    """
+    async with async_session() as session:
+        updated = await session.scalar(
+            update(Analysis)
+            .where(Analysis.id == analysis_id, Analysis.status.in_(PENDING_STATUSES))
+            .values(status=status, heartbeat_at=datetime.utcnow())
+            .returning(Analysis.id)
+        )
+        await session.commit()
+    if updated is None:
+        return False
+    invalidate_report(analysis_id)
+    events.publish(analysis_id, events.EVENT_STATUS, {"status": status})
+    return True
+
+
+def indicator_rows(analysis_id: int, tests: list[dict]) -> list[dict]:
+    """Строки test_indicators для одного multi-row INSERT."""
+    values = [to_decimal(t.get("value")) for t in tests]
+    ref_mins = [to_decimal(t.get("ref_min")) for t in tests]
+    ref_maxs = [to_decimal(t.get("ref_max")) for t in tests]
+    deviations = compute_deviations(values, ref_mins, ref_maxs)
+    return [
+        {
+            "analysis_id": analysis_id,
+            "test_name": str(t.get("test_name")),
+            "test_key": canonical_test_name(t.get("test_name")),
+            "value": value,
+            "units": t.get("units"),
+            "ref_min": ref_min,
+            "ref_max": ref_max,
+            "deviation": deviation,
+            "comment": t.get("comment"),
+        }
+        for t, value, ref_min, ref_max, deviation in zip(tests, values, ref_mins, ref_maxs, deviations)
+    ]
+
+
+def _truncate_text(s: str | None, limit: int = 15000) -> str | None:
+    if not s:
+        return None
+    s = s.strip()
+    if len(s) <= limit:
+        return s
+    return s[:limit] + "\n\n...[truncated]..."
+
+
+async def _save_result(analysis_id: int, ocr_text: str | None, tests: list[dict]) -> str | None:
+    # Полный OCR-текст — сжатым в хранилище, в БД остаётся только превью.
+    if ocr_text:
+        try:
+            await aput_ocr_text(analysis_id, ocr_text)
+        except Exception:
+            logger.exception("analysis %s: failed to store full ocr text", analysis_id)
+
+    # Постоянное число round trip-ов независимо от числа показателей (их бывает 50–150):
+    # UPDATE analyses ... RETURNING id + один INSERT ... VALUES (...), (...), ... в одной транзакции.
+    # Заодно materialize-им JSON отчёта: GET /report/{id} отдаёт его как есть.
+    rows = indicator_rows(analysis_id, tests)
+    report_json = dump_report(
+        build_report_payload(analysis_id=analysis_id, status=STATUS_PROCESSED, indicators=rows)
+    )
+    async with async_session() as session, session.begin():
+        updated = await session.scalar(
+            update(Analysis)
+            .where(Analysis.id == analysis_id, Analysis.status.in_(PENDING_STATUSES))
+            .values(ocr_text=_truncate_text(ocr_text), status=STATUS_PROCESSED, report_json=report_json)
+            .returning(Analysis.id)
+        )
+        if updated is None:
+            # анализ успели удалить или пометить failed, пока шёл OCR
+            return None
+        if rows:
+            await session.execute(insert(TestIndicator).values(rows))
+    invalidate_report(analysis_id)
+    return report_json
+
+
+async def _analyze_cached(
+    analysis_id: int, document_ref: str, content_type: str | None, sha256: str
+) -> tuple[str | None, list[dict]]:
+    """
+    Повторная загрузка того же файла (ретраи бота, web + mobile) не гоняет OCR заново:
+    результат берём из кэша по sha256 содержимого + версии пайплайна.
+    """
+    cache = get_result_cache()
+    key = cache_key(sha256, content_type) if cache is not None else None
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            return cached.get("ocr_text"), cached.get("tests") or []
+
+    loop = asyncio.get_running_loop()
+    ocr_text, tests = await loop.run_in_executor(
+        get_executor(), _analyze_in_worker, analysis_id, document_ref, content_type
+    )
+    # пустой результат не кэшируем: это может быть временная ошибка OCR
+    if cache is not None and (ocr_text or tests):
+        await asyncio.to_thread(cache.set, key, {"ocr_text": ocr_text, "tests": tests})
+    return ocr_text, tests
+
+
+async def process_analysis(analysis_id: int, document_ref: str, content_type: str | None, sha256: str) -> None:
+    """
+    received -> processing -> processed/failed.
+    OCR выполняется в пуле процессов (документ воркер читает из хранилища сам),
+    event loop только ждёт результат и пишет его в БД.
+    Статусы, прогресс OCR и готовый отчёт публикуются в services/events (SSE /analysis/{id}/events).
+    """
+    try:
+        if not await _set_status(analysis_id, STATUS_PROCESSING):
+            logger.warning("analysis %s is no longer pending, skipping", analysis_id)
+            return
+        ocr_text, tests = await _analyze_cached(analysis_id, document_ref, content_type, sha256)
+        report_json = await _save_result(analysis_id, ocr_text, tests)
+        if report_json is not None:
+            events.publish(analysis_id, events.EVENT_STATUS, {"status": STATUS_PROCESSED})
+            events.publish(analysis_id, events.EVENT_REPORT, report_json)
+    except asyncio.CancelledError:
+        # остановка процесса (shutdown) или отмена задачи пула: анализ не должен остаться в processing
+        logger.warning("analysis %s processing cancelled", analysis_id)
+        await asyncio.shield(_mark_failed(analysis_id))
+        raise
+    except Exception:
+        logger.exception("analysis %s processing failed", analysis_id)
+        await _mark_failed(analysis_id)
+
+
+async def _mark_failed(analysis_id: int) -> None:
+    try:
+        await _set_status(analysis_id, STATUS_FAILED)
+    except Exception:
+        logger.exception("analysis %s: failed to set status=failed", analysis_id)
+
+
+def _discard_task(task: asyncio.Task) -> None:
+    _tasks.pop(task, None)
+
+
+def submit_analysis(analysis_id: int, document_ref: str, content_type: str | None, sha256: str) -> asyncio.Task:
+    """Ставит документ в очередь на обработку и сразу возвращает управление."""
+    task = asyncio.create_task(process_analysis(analysis_id, document_ref, content_type, sha256))
+    _tasks[task] = analysis_id
+    task.add_done_callback(_discard_task)
+    return task
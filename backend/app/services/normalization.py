@@ -2,6 +2,23 @@ from __future__ import annotations
 
 from decimal import Decimal
 
+from .analytes import match_analyte
+
+# Версия правил canonical_test_name (и словаря аналитов): увеличивать при любом изменении ключей —
+# migrate пересчитывает test_indicators.test_key один раз на новую версию.
+TEST_KEY_VERSION = 2
+
+
+def canonical_test_name(name: str | None) -> str:
+    """
+    Ключ показателя для сравнения между анализами: ключ аналита из словаря
+    ("Глюкоза", "Glucose" -> "glucose"), иначе имя без учёта регистра и пробелов.
+    """
+    analyte = match_analyte(name)
+    if analyte is not None:
+        return analyte.key
+    return " ".join(str(name or "").lower().split())
+
 
 def compute_deviation(value: Decimal | None, ref_min: Decimal | None, ref_max: Decimal | None) -> str | None:
     if value is None or ref_min is None or ref_max is None:
@@ -12,3 +29,18 @@ def compute_deviation(value: Decimal | None, ref_min: Decimal | None, ref_max: D
         return "high"
     return "normal"
 
+
+def to_decimal(x) -> Decimal | None:
+    if x is None:
+        return None
+    if isinstance(x, Decimal):
+        return x
+    # через str: float -> Decimal без артефактов двоичного представления (5.6, а не 5.5999...)
+    return Decimal(str(x))
+
+
+def compute_deviations(
+    values: list[Decimal | None], ref_mins: list[Decimal | None], ref_maxs: list[Decimal | None]
+) -> list[str | None]:
+    """compute_deviation для всего батча показателей одним проходом."""
+    return [compute_deviation(v, lo, hi) for v, lo, hi in zip(values, ref_mins, ref_maxs)]
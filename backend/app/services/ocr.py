@@ -1,113 +1,239 @@
 import os
 import io
 import re
-
-import pytesseract
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from itertools import islice
+from typing import Callable, Iterator
+
+import numpy as np
 from PIL import Image
-import fitz  # PyMuPDF
+
+from . import image_preprocess, ocr_engine
+from .analytes import find_analytes, mentions_analyte
+from .normalization import canonical_test_name
+from .pdf_document import PdfDocument
+from .pdf_layout import band, group_rows, two_means
+
+
+# PSM: 6=таблица/блок, 4=колонки, 11=sparse
+_PSMS = (6, 4, 11)
+
+# Статистика побед пар (вариант предобработки, psm) в этом процессе:
+# чаще выигрывающие пары пробуем первыми. Варианты — по имени (image_preprocess.Variant.name).
+_win_counts: Counter[tuple[str, int]] = Counter()
+_win_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _score_text(text: str) -> int:
+    if not text:
+        return -10_000
+    # основной сигнал: сколько показателей извлёк парсер
+    try:
+        extracted = extract_tests_from_text(text)
+    except Exception:
+        extracted = []
+    n_tests = len(extracted)
+    n_nums = len(_NUMBER_RE.findall(text))
+    bonus = 0
+    low = text.lower()
+    if "исслед" in low or "показат" in low:
+        bonus += 10
+    if "рефер" in low or "норм" in low:
+        bonus += 5
+    # штраф за “паспортный” текст без таблицы
+    if ("перейти на исходный" in low) and n_tests <= 1:
+        bonus -= 20
+    return n_tests * 50 + n_nums + bonus
+
+
+def _ordered_candidates(variant_names: list[str]) -> list[tuple[str, int]]:
+    pairs = [(name, psm) for name in variant_names for psm in _PSMS]
+    with _win_lock:
+        wins = dict(_win_counts)
+    # sort стабильный: при равной статистике сохраняется исходный порядок
+    pairs.sort(key=lambda p: -wins.get(p, 0))
+    return pairs
 
 
 def ocr_image_bytes(image_bytes: bytes, lang: str = "rus+eng") -> str:
     """
-    OCR для PNG/JPG. Для PDF на MVP-этапе лучше сначала конвертировать в изображения.
+    OCR для PNG/JPG.
     """
-    tcmd = os.environ.get("TESSERACT_CMD")
-    if tcmd:
-        pytesseract.pytesseract.tesseract_cmd = tcmd
+    return ocr_image(Image.open(io.BytesIO(image_bytes)), lang=lang)
+
+
+def ocr_image_file(path: str | os.PathLike, lang: str = "rus+eng") -> str:
+    """OCR для PNG/JPG из файла: PIL декодирует прямо из файла, без копии байтов в памяти."""
+    with Image.open(path) as im:
+        return ocr_image(im, lang=lang)
+
 
+def ocr_image(image: Image.Image, lang: str = "rus+eng", parallel: int | None = None) -> str:
+    """
+    OCR уже декодированного изображения (PNG/JPG или отрендеренная страница PDF).
+
+    Настройки поиска (env):
+    - OCR_SEARCH_MODE: adaptive (по умолчанию) или exhaustive (все варианты x все PSM);
+    - OCR_PLATEAU_PASSES: ранний выход, если лучший score не растёт столько проходов подряд
+      (кандидаты идут в порядке побед, так что лучший обычно находится первыми; 0 — выключено);
+    - OCR_SCORE_THRESHOLD: ранний выход, как только лучший результат набрал этот score
+      (заведомо хороший результат для больших панелей — не ждём плато);
+    - OCR_MAX_PASSES: максимум вызовов Tesseract на изображение;
+    - OCR_PARALLEL: сколько проходов Tesseract запускать одновременно (по умолчанию —
+      parallel от вызывающего кода или ocr_engine.thread_budget(): ядра, не занятые другими
+      документами пула).
+    Движок Tesseract — services/ocr_engine.py (OCR_ENGINE).
+    """
     # Мульти-проход OCR: несколько вариантов предобработки и несколько PSM.
     # Выбираем лучший результат по тому, сколько показателей удаётся извлечь парсером.
-    img0 = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-
-    def _resize_if_small(im: Image.Image) -> Image.Image:
-        w, h = im.size
-        if max(w, h) < 1200:
-            return im.resize((w * 2, h * 2))
-        return im
-
-    def _binarize(gray: Image.Image, thr: int) -> Image.Image:
-        return gray.point(lambda p: 255 if p > thr else 0)
-
-    def _invert_if_needed(gray: Image.Image) -> Image.Image:
-        # если фон тёмный (скриншот/тёмная тема) — инвертируем
-        px = gray.resize((64, 64)).getdata()
-        avg = sum(px) / max(1, len(px))
-        if avg < 110:
-            return gray.point(lambda p: 255 - p)
-        return gray
-
-    # кандидаты изображений
-    variants: list[Image.Image] = []
-    base = _resize_if_small(img0)
-    gray = base.convert("L")
-    gray = _invert_if_needed(gray)
-    variants.append(gray)  # без бинаризации
-    for thr in (140, 170, 200):
-        variants.append(_binarize(gray, thr))
-
-    psms = (6, 4, 11)  # 6=таблица/блок, 4=колонки, 11=sparse
-
-    def _score_text(text: str) -> int:
-        if not text:
-            return -10_000
-        # основной сигнал: сколько показателей извлёк парсер
-        try:
-            extracted = extract_tests_from_text(text)
-        except Exception:
-            extracted = []
-        n_tests = len(extracted)
-        n_nums = len(re.findall(r"[0-9]+(?:[.,][0-9]+)?", text))
-        bonus = 0
-        low = text.lower()
-        if "исслед" in low or "показат" in low:
-            bonus += 10
-        if "рефер" in low or "норм" in low:
-            bonus += 5
-        # штраф за “паспортный” текст без таблицы
-        if ("перейти на исходный" in low) and n_tests <= 1:
-            bonus -= 20
-        return n_tests * 50 + n_nums + bonus
+    # Варианты (серое + пороги из гистограммы) — services/image_preprocess.py (OCR_PREPROCESS).
+    variants = {v.name: v.image for v in image_preprocess.ocr_variants(image)}
+
+    exhaustive = os.environ.get("OCR_SEARCH_MODE", "adaptive").lower() == "exhaustive"
+    threshold = _env_int("OCR_SCORE_THRESHOLD", 400)
+    plateau = max(0, _env_int("OCR_PLATEAU_PASSES", 3))
+    max_passes = max(1, _env_int("OCR_MAX_PASSES", len(variants) * len(_PSMS)))
+    parallel = max(1, _env_int("OCR_PARALLEL", parallel or ocr_engine.thread_budget()))
+
+    candidates = _ordered_candidates(list(variants))
+    if not exhaustive:
+        candidates = candidates[:max_passes]
+
+    def _run(pair: tuple[str, int]) -> str:
+        name, psm = pair
+        return ocr_engine.image_to_string(variants[name], lang=lang, psm=psm)
 
     best_text = ""
     best_score = -10_000
-
-    for im in variants:
-        for psm in psms:
-            config = f"--oem 1 --psm {psm}"
-            txt = pytesseract.image_to_string(im, lang=lang, config=config) or ""
-            sc = _score_text(txt)
-            if sc > best_score:
-                best_score = sc
-                best_text = txt
+    best_pair: tuple[str, int] | None = None
+    stale = 0  # завершённых проходов подряд без улучшения лучшего score
+
+    # Tesseract работает вне GIL (tesserocr отпускает GIL, pytesseract — отдельный процесс),
+    # так что потоков достаточно для загрузки всех ядер.
+    # Кандидаты запускаются в порядке приоритета, не больше parallel одновременно: следующий —
+    # только после завершения предыдущего, так что после раннего выхода лишние проходы не стартуют.
+    rank = {pair: i for i, pair in enumerate(candidates)}
+    queued = iter(candidates)
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        running = {pool.submit(_run, pair): pair for pair in islice(queued, parallel)}
+        stop = False
+        while running and not stop:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in sorted(done, key=lambda f: rank[running[f]]):
+                pair = running.pop(fut)
+                txt = fut.result()
+                sc = _score_text(txt)
+                stale = 0 if best_pair is None or sc > best_score else stale + 1
+                # при равном score побеждает более приоритетный кандидат — результат не зависит от гонки потоков
+                if sc > best_score or (sc == best_score and best_pair is not None and rank[pair] < rank[best_pair]):
+                    best_score = sc
+                    best_text = txt
+                    best_pair = pair
+                if not exhaustive and (best_score >= threshold or (plateau and stale >= plateau)):
+                    stop = True
+            if not stop:
+                running.update((pool.submit(_run, pair), pair) for pair in islice(queued, len(done)))
+
+    if best_pair is not None:
+        with _win_lock:
+            _win_counts[best_pair] += 1
 
     return best_text.strip()
 
 
-def ocr_pdf_bytes(pdf_bytes: bytes, lang: str = "rus+eng", max_pages: int = 4) -> str:
+@contextmanager
+def _open_pdf(pdf: bytes | PdfDocument, max_pages: int) -> Iterator[PdfDocument]:
+    # Уже открытый PdfDocument не закрываем: его жизненным циклом управляет вызывающий код.
+    if isinstance(pdf, PdfDocument):
+        yield pdf
+        return
+    with PdfDocument(pdf, max_pages=max_pages) as doc:
+        yield doc
+
+
+# zoom рендера скан-страниц PDF для OCR (подбирается по высоте строк, см. _render_for_ocr)
+_PDF_MIN_ZOOM = 1.0
+_PDF_MAX_ZOOM = 4.0
+
+
+def _render_for_ocr(doc: PdfDocument, i: int) -> Image.Image:
+    """
+    Скан-страница для OCR: пробный рендер с zoom=1 (дёшево) -> область текста и высота строк ->
+    рендер только области текста с zoom, при котором высота строки ~ TEXT_HEIGHT_PX.
+    Если строки не нашли — как раньше, вся страница с zoom=2.
+    """
+    layout = image_preprocess.text_layout(image_preprocess.dark_on_light(doc.render_page(i, zoom=1.0)))
+    if layout is None:
+        return doc.render_page(i)
+    zoom = 2.0
+    if layout.line_height is not None:
+        zoom = min(_PDF_MAX_ZOOM, max(_PDF_MIN_ZOOM, image_preprocess.TEXT_HEIGHT_PX / layout.line_height))
+    return doc.render_page(i, zoom=zoom, clip=layout.box)
+
+
+def iter_pdf_pages_text(
+    pdf: bytes | PdfDocument, lang: str = "rus+eng", max_pages: int = 4
+) -> Iterator[tuple[int, str]]:
+    """
+    Текст страниц PDF по мере готовности: (номер страницы, текст) в порядке завершения.
+    - страницы с текстовым слоем отдаются сразу;
+    - остальные рендерятся (в этом потоке: fitz.Document не потокобезопасен) и уходят на OCR
+      в пул потоков, пока рендерится следующая страница. Tesseract работает вне GIL,
+      поэтому страницы реально распознаются параллельно на разных ядрах.
+    OCR_PDF_PARALLEL — сколько страниц распознавать одновременно. По умолчанию ядра документа
+    (ocr_engine.thread_budget(): все свободные ядра, если пул простаивает) делятся между
+    страницами, а остаток — между проходами OCR каждой страницы, без вложенного перебора потоков.
+    """
+    with _open_pdf(pdf, max_pages) as doc:
+        pages = min(doc.page_count, max_pages)
+        budget = ocr_engine.thread_budget()
+        parallel = max(1, _env_int("OCR_PDF_PARALLEL", min(max(1, pages), budget)))
+        per_page = max(1, budget // parallel)
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            futures: dict = {}
+            for i in range(pages):
+                direct = doc.page_text(i)
+                if len(direct) >= 40:
+                    yield i, direct
+                    continue
+                # OCR fallback: рендер области текста в масштабе по высоте строк;
+                # важно: используем тот же пайплайн, что и для PNG/JPG (предобработка + psm/oem)
+                futures[pool.submit(ocr_image, _render_for_ocr(doc, i), lang, per_page)] = i
+            for fut in as_completed(futures):
+                yield futures[fut], fut.result()
+
+
+def ocr_pdf_bytes(
+    pdf: bytes | PdfDocument,
+    lang: str = "rus+eng",
+    max_pages: int = 4,
+    progress: Callable[[int, int], None] | None = None,
+) -> str:
     """
     PDF -> text:
     - сначала пробуем извлечь текст напрямую (для "цифровых" PDF это лучше и быстрее)
     - если текста нет/мало, делаем OCR: рендерим первые max_pages страниц в изображения и прогоняем Tesseract.
+    Страницы распознаются параллельно (см. iter_pdf_pages_text), текст собирается в порядке страниц.
+    progress(готово страниц, всего страниц) вызывается по мере готовности страниц.
     """
-    tcmd = os.environ.get("TESSERACT_CMD")
-    if tcmd:
-        pytesseract.pytesseract.tesseract_cmd = tcmd
-
-    text_parts: list[str] = []
-    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-        pages = min(len(doc), max_pages)
-        for i in range(pages):
-            page = doc.load_page(i)
-            direct = (page.get_text("text") or "").strip()
-            if len(direct) >= 40:
-                text_parts.append(direct)
-                continue
-
-            # OCR fallback: 2x масштаб даёт заметно лучше OCR
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_bytes = pix.tobytes("png")
-            # важно: используем тот же пайплайн, что и для PNG/JPG (предобработка + psm/oem)
-            text_parts.append(ocr_image_bytes(img_bytes, lang=lang))
+    by_page: dict[int, str] = {}
+    with _open_pdf(pdf, max_pages) as doc:
+        pages = min(doc.page_count, max_pages)
+        for i, text in iter_pdf_pages_text(doc, lang=lang, max_pages=max_pages):
+            by_page[i] = text
+            if progress is not None:
+                progress(len(by_page), pages)
+    text_parts = [by_page[i] for i in sorted(by_page)]
     return "\n\n".join([t for t in text_parts if t])
 
 
@@ -115,75 +241,10 @@ _NUM_RE = re.compile(r"^[0-9]+([.,][0-9]+)?$")
 _RANGE_RE = re.compile(r"(?P<min>[0-9]+(?:[.,][0-9]+)?)\s*[-–]\s*(?P<max>[0-9]+(?:[.,][0-9]+)?)")
 _UNITS_RE = re.compile(r"[A-Za-zА-Яа-я/%µμ\^]|/|×|х")
 
-
-def extract_tests_from_pdf(pdf_bytes: bytes, max_pages: int = 4) -> tuple[list[dict], str]:
-    """
-    Структурное извлечение из PDF по координатам (для "цифровых" PDF таблиц).
-    Возвращает (tests, extracted_text_preview).
-    """
-    def _num(x: str) -> float:
-        return float(x.replace(",", "."))
-
-    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-        pages = min(len(doc), max_pages)
-        tokens: list[dict] = []
-        text_preview_parts: list[str] = []
-
-        for i in range(pages):
-            page = doc.load_page(i)
-            text_preview_parts.append((page.get_text("text") or "").strip())
-            d = page.get_text("dict")
-            for b in d.get("blocks", []):
-                for line in b.get("lines", []):
-                    for span in line.get("spans", []):
-                        t = (span.get("text") or "").strip()
-                        if not t:
-                            continue
-                        x0, y0, x1, y1 = span.get("bbox", (0, 0, 0, 0))
-                        tokens.append({"text": t, "x0": float(x0), "x1": float(x1), "y0": float(y0), "y1": float(y1)})
-
-        preview = "\n\n".join([p for p in text_preview_parts if p])
-
-        if not tokens:
-            return [], preview
-
-        # группируем по строкам (y)
-        tokens.sort(key=lambda t: ((t["y0"] + t["y1"]) / 2.0, t["x0"]))
-        rows: list[list[dict]] = []
-        tol = 2.8  # px
-        for t in tokens:
-            y = (t["y0"] + t["y1"]) / 2.0
-            if not rows:
-                rows.append([t])
-                continue
-            last = rows[-1]
-            y_last = sum((x["y0"] + x["y1"]) / 2.0 for x in last) / len(last)
-            if abs(y - y_last) <= tol:
-                last.append(t)
-            else:
-                rows.append([t])
-
-        def _merge_row(row: list[dict]) -> list[dict]:
-            row = sorted(row, key=lambda t: t["x0"])
-            merged: list[dict] = []
-            for t in row:
-                if not merged:
-                    merged.append(t.copy())
-                    continue
-                prev = merged[-1]
-                gap = t["x0"] - prev["x1"]
-                # если токены близко — считаем одной "ячейкой"
-                if gap >= 0 and gap <= 6:
-                    prev["text"] = (prev["text"] + " " + t["text"]).strip()
-                    prev["x1"] = max(prev["x1"], t["x1"])
-                    prev["y0"] = min(prev["y0"], t["y0"])
-                    prev["y1"] = max(prev["y1"], t["y1"])
-                else:
-                    merged.append(t.copy())
-            return merged
-
-        # Служебные/паспортные строки, которые не должны становиться "показателями"
-        blacklist = (
+# Служебные/паспортные строки PDF, которые не должны становиться "показателями"
+_PDF_BLACKLIST_RE = re.compile(
+    "|".join(
+        (
             "страница",
             "дата",
             "пол пациента",
@@ -204,140 +265,125 @@ def extract_tests_from_pdf(pdf_bytes: bytes, max_pages: int = 4) -> tuple[list[d
             "направляющий",
             "диагноз",
         )
+    )
+)
+# слова заголовка таблицы -> тип колонки (порядок важен: первое совпадение)
+_HEADER_KEYWORDS = (
+    ("name", ("исслед", "показат")),
+    ("value", ("значен",)),
+    ("units", ("ед", "ед.", "ед изм", "ед.изм")),
+    ("ref", ("норм", "реф")),
+)
+_HEADER_KIND_RES = tuple((kind, re.compile("|".join(map(re.escape, kws)))) for kind, kws in _HEADER_KEYWORDS)
+# быстрый отсев: большинство ячеек не содержит ни одного ключевого слова заголовка
+_HEADER_ANY_RE = re.compile("|".join(re.escape(k) for _, kws in _HEADER_KEYWORDS for k in kws))
+_HEADER_BAND_TOL = 4.5
+_DIGIT_RE = re.compile(r"[0-9]")
+
+
+def _is_noise_pdf_name(name: str) -> bool:
+    # известный аналит (в т.ч. "25-OH витамин D", "HbA1c") — не шум, даже с цифрами
+    if mentions_analyte(name):
+        return False
+    if _PDF_BLACKLIST_RE.search(name.lower()):
+        return True
+    # много цифр/служебных символов -> скорее номер/ГОСТ/код
+    digits = sum(ch.isdigit() for ch in name)
+    if digits / max(1, len(name)) > 0.25:
+        return True
+    if "№" in name or " N" in name:
+        return True
+    return False
+
 
-        def _first_number(s: str) -> float | None:
-            m = re.search(r"([0-9]+(?:[.,][0-9]+)?)", s)
-            if not m:
-                return None
-            return _num(m.group(1))
-
-        def _is_noise_name(name: str) -> bool:
-            n = name.lower()
-            if any(b in n for b in blacklist):
-                return True
-            # много цифр/служебных символов -> скорее номер/ГОСТ/код
-            digits = sum(ch.isdigit() for ch in name)
-            if digits / max(1, len(name)) > 0.25:
-                return True
-            if "№" in name or " N" in name:
-                return True
-            return False
+def extract_tests_from_pdf(pdf: bytes | PdfDocument, max_pages: int = 4) -> tuple[list[dict], str]:
+    """
+    Структурное извлечение из PDF по координатам (для "цифровых" PDF таблиц).
+    Геометрия (строки, ячейки, колонки) — на NumPy, см. services/pdf_layout.py.
+    Возвращает (tests, extracted_text_preview).
+    """
+    with _open_pdf(pdf, max_pages) as doc:
+        pages = min(doc.page_count, max_pages)
+        spans_by_page = [doc.page_spans(i) for i in range(pages)]
+        preview = "\n\n".join([p for p in (doc.page_text(i) for i in range(pages)) if p])
+
+        # строки по (страница, y): строки разных страниц с одинаковым y не склеиваются
+        layout = group_rows(spans_by_page)
+        merged_rows = layout.rows
+        if not merged_rows:
+            return [], preview
 
         # Ищем заголовок таблицы более устойчиво: по отдельным словам и кластеризации по Y.
         # Это работает даже если "Ед. изм." / "Нормальные значения" разбиты на несколько спанов/блоков.
-        merged_rows = [_merge_row(r) for r in rows]
-
         header_idx: int | None = None
-        header_y: float | None = None
         col_value_x: float | None = None
         col_units_x: float | None = None
         col_ref_x: float | None = None
         col_name_end_x: float | None = None
 
-        kw_map = {
-            "name": ("исслед", "показат"),
-            "value": ("значен",),
-            "units": ("ед", "ед.", "ед изм", "ед.изм"),
-            "ref": ("норм", "реф"),
-        }
-
-        matches: list[tuple[str, float, float, float]] = []  # (kind, xcenter, ycenter, x1)
-        for row in merged_rows:
+        kinds: list[str] = []
+        points: list[tuple[int, float, float, float]] = []  # (page, xcenter, ycenter, x1)
+        for row_page, row in zip(layout.page.tolist(), merged_rows):
             for x in row:
                 t = x["text"].lower()
-                yc = (x["y0"] + x["y1"]) / 2.0
-                xc = (x["x0"] + x["x1"]) / 2.0
-                for kind, kws in kw_map.items():
-                    if any(k in t for k in kws):
-                        matches.append((kind, xc, yc, x["x1"]))
-                        break
-
-        # кластеризация по Y
-        if matches:
-            matches.sort(key=lambda m: m[2])
-            bands: list[dict] = []
-            band_tol = 4.5
-            for kind, xc, yc, x1 in matches:
-                if not bands:
-                    bands.append({"y": yc, "kinds": {kind}, "points": [(kind, xc, x1)]})
+                if not _HEADER_ANY_RE.search(t):
                     continue
-                if abs(yc - bands[-1]["y"]) <= band_tol:
-                    b = bands[-1]
-                    b["kinds"].add(kind)
-                    b["points"].append((kind, xc, x1))
-                    # обновляем среднее Y
-                    b["y"] = (b["y"] * (len(b["points"]) - 1) + yc) / len(b["points"])
-                else:
-                    bands.append({"y": yc, "kinds": {kind}, "points": [(kind, xc, x1)]})
-
-            best = max(bands, key=lambda b: (len(b["kinds"]), len(b["points"])))
-            if len(best["kinds"]) >= 3:
-                header_y = float(best["y"])
-                # берём x по каждому типу в этом бэнде
-                def _median(xs: list[float]) -> float:
-                    xs = sorted(xs)
-                    return xs[len(xs) // 2]
-
-                xs_value = [xc for (k, xc, _x1) in best["points"] if k == "value"]
-                xs_units = [xc for (k, xc, _x1) in best["points"] if k == "units"]
-                xs_ref = [xc for (k, xc, _x1) in best["points"] if k == "ref"]
-                xs_name_end = [_x1 for (k, _xc, _x1) in best["points"] if k == "name"]
-
-                if xs_value:
-                    col_value_x = _median(xs_value)
-                if xs_units:
-                    col_units_x = _median(xs_units)
-                if xs_ref:
-                    col_ref_x = _median(xs_ref)
-                if xs_name_end:
-                    col_name_end_x = max(xs_name_end)
-
-                # найдём индекс строки, ближайшей к header_y
-                header_idx = min(
-                    range(len(merged_rows)),
-                    key=lambda i: abs(
-                        (sum((x["y0"] + x["y1"]) / 2.0 for x in merged_rows[i]) / max(1, len(merged_rows[i])))
-                        - header_y
-                    ),
-                )
+                for kind, kind_re in _HEADER_KIND_RES:
+                    if kind_re.search(t):
+                        kinds.append(kind)
+                        points.append((row_page, (x["x0"] + x["x1"]) / 2.0, (x["y0"] + x["y1"]) / 2.0, x["x1"]))
+                        break
 
-        # Fallback: если заголовок не нашли, используем старую эвристику по x-распределению чисел
+        if points:
+            # кластеризация совпадений по Y (полосы в пределах страницы)
+            pts = np.array(points, dtype=np.float64)
+            order = np.lexsort((pts[:, 2], pts[:, 0]))
+            band_ids = band(pts[order, 0], pts[order, 2], _HEADER_BAND_TOL)
+            best: tuple[int, int] | None = None
+            best_members: np.ndarray | None = None
+            for b in range(int(band_ids[-1]) + 1):
+                members = order[band_ids == b]
+                score = (len({kinds[i] for i in members.tolist()}), len(members))
+                if best is None or score > best:
+                    best, best_members = score, members
+            if best is not None and best[0] >= 3:
+                header_page = int(pts[best_members[0], 0])
+                header_y = float(pts[best_members, 2].mean())
+                band_kinds = np.array([kinds[i] for i in best_members.tolist()])
+                band_pts = pts[best_members]
+
+                # берём x по каждому типу в этом бэнде (верхняя медиана)
+                def _median(kind: str, col: int) -> float | None:
+                    xs = np.sort(band_pts[band_kinds == kind, col])
+                    return float(xs[len(xs) // 2]) if xs.size else None
+
+                col_value_x = _median("value", 1)
+                col_units_x = _median("units", 1)
+                col_ref_x = _median("ref", 1)
+                name_ends = band_pts[band_kinds == "name", 3]
+                col_name_end_x = float(name_ends.max()) if name_ends.size else None
+
+                # строка, ближайшая к header_y на странице заголовка
+                dist = np.where(layout.page == header_page, np.abs(layout.y - header_y), np.inf)
+                header_idx = int(np.argmin(dist))
+
+        # Fallback: если заголовок (или позиции всех колонок в нём) не нашли —
+        # колонки значений/референсов по x-распределению чисел (k-means на два кластера)
         value_c = None
         ref_c = None
-        if header_idx is None:
-            num_x = [t["x0"] for t in tokens if _NUM_RE.match(t["text"])]
+        if header_idx is None or col_value_x is None or col_units_x is None or col_ref_x is None:
+            header_idx = None
+            num_x = [t["x0"] for p in spans_by_page for t in p if _NUM_RE.match(t["text"])]
             if len(num_x) < 6:
                 return [], preview
-            xs = sorted(num_x)
-            c1 = xs[int(len(xs) * 0.25)]
-            c2 = xs[int(len(xs) * 0.75)]
-            for _ in range(10):
-                g1 = [x for x in xs if abs(x - c1) <= abs(x - c2)]
-                g2 = [x for x in xs if abs(x - c2) < abs(x - c1)]
-                if g1:
-                    c1 = sum(g1) / len(g1)
-                if g2:
-                    c2 = sum(g2) / len(g2)
-            value_c, ref_c = (c1, c2) if c1 < c2 else (c2, c1)
-        else:
+            value_c, ref_c = two_means(np.array(num_x))
+
+        if header_idx is not None:
             # границы колонок из заголовка (самый надёжный вариант для PDF-таблиц)
-            if col_value_x is None or col_units_x is None or col_ref_x is None:
-                # если не смогли вытащить позиции колонок из заголовка — fallback
-                header_idx = None
-                num_x = [t["x0"] for t in tokens if _NUM_RE.match(t["text"])]
-                if len(num_x) < 6:
-                    return [], preview
-                xs = sorted(num_x)
-                c1 = xs[int(len(xs) * 0.25)]
-                c2 = xs[int(len(xs) * 0.75)]
-                for _ in range(10):
-                    g1 = [x for x in xs if abs(x - c1) <= abs(x - c2)]
-                    g2 = [x for x in xs if abs(x - c2) < abs(x - c1)]
-                    if g1:
-                        c1 = sum(g1) / len(g1)
-                    if g2:
-                        c2 = sum(g2) / len(g2)
-                value_c, ref_c = (c1, c2) if c1 < c2 else (c2, c1)
+            name_end = (col_name_end_x or (col_value_x - 10))
+            sep_name_value = (name_end + col_value_x) / 2.0
+            sep_value_units = (col_value_x + col_units_x) / 2.0
+            sep_units_ref = (col_units_x + col_ref_x) / 2.0
 
         tests: list[dict] = []
         for idx, row in enumerate(merged_rows):
@@ -346,23 +392,17 @@ def extract_tests_from_pdf(pdf_bytes: bytes, max_pages: int = 4) -> tuple[list[d
                 if idx <= header_idx:
                     continue
 
-            texts = " ".join(x["text"] for x in row).lower()
-            if any(b in texts for b in blacklist):
+            if _PDF_BLACKLIST_RE.search(" ".join(x["text"] for x in row).lower()):
                 continue
 
             # Если у нас есть координаты колонок (header найден) — раскладываем по колонкам
-            if header_idx is not None and col_value_x is not None and col_units_x is not None and col_ref_x is not None:
-                name_end = (col_name_end_x or (col_value_x - 10))
-                sep_name_value = (name_end + col_value_x) / 2.0
-                sep_value_units = (col_value_x + col_units_x) / 2.0
-                sep_units_ref = (col_units_x + col_ref_x) / 2.0
-
+            if header_idx is not None:
                 name_tokens: list[str] = []
                 value_tokens: list[str] = []
                 units_tokens: list[str] = []
                 ref_tokens: list[str] = []
 
-                for x in sorted(row, key=lambda t: t["x0"]):
+                for x in row:  # ячейки уже слева направо
                     xc = (x["x0"] + x["x1"]) / 2.0
                     tx = x["text"]
                     if xc < sep_name_value:
@@ -377,15 +417,15 @@ def extract_tests_from_pdf(pdf_bytes: bytes, max_pages: int = 4) -> tuple[list[d
                 name = " ".join(name_tokens).strip(" .,:;()[]")
                 if not name or len(name) < 3 or len(name) > 80:
                     continue
-                if not re.match(r"^[A-Za-zА-Яа-я]", name):
+                if not _NAME_START_RE.match(name) and not mentions_analyte(name):
                     continue
                 # отсечём явно “мусорные” имена
-                if _is_noise_name(name):
+                if _is_noise_pdf_name(name):
                     continue
 
                 value = None
                 for vt in value_tokens:
-                    if _NUM_RE.match(vt) or re.search(r"[0-9]", vt):
+                    if _NUM_RE.match(vt) or _DIGIT_RE.search(vt):
                         value = _first_number(vt)
                         if value is not None:
                             break
@@ -436,9 +476,9 @@ def extract_tests_from_pdf(pdf_bytes: bytes, max_pages: int = 4) -> tuple[list[d
             name = " ".join(name_parts).strip(" .,:;()[]")
             if not name or len(name) < 3 or len(name) > 80:
                 continue
-            if not re.match(r"^[A-Za-zА-Яа-я]", name):
+            if not _NAME_START_RE.match(name) and not mentions_analyte(name):
                 continue
-            if _is_noise_name(name):
+            if _is_noise_pdf_name(name):
                 continue
 
             value = _num(v_tok["text"])
@@ -484,317 +524,370 @@ def extract_tests_from_pdf(pdf_bytes: bytes, max_pages: int = 4) -> tuple[list[d
         return tests, preview
 
 
-def extract_tests_from_text(text: str) -> list[dict]:
-    """
-    MVP-парсер: пытается вытащить несколько показателей из OCR-текста.
-    Если не получилось — вернём пустой список, чтобы вызывающий код мог сделать fallback.
-    """
-    if not text or not text.strip():
-        return []
-
-    def _num(x: str) -> float:
-        return float(x.replace(",", "."))
-
-    tests: list[dict] = []
-
-    # Glucose / Глюкоза
-    norm_all = " ".join(text.replace("\n", " ").split())
-    m = re.search(r"(glucose|глюкоз[аы])\s*[:\-]?\s*([0-9]+[.,]?[0-9]*)", norm_all, re.IGNORECASE)
-    if m:
-        tests.append(
-            {
-                "test_name": "Glucose",
-                "value": _num(m.group(2)),
-                "units": "mmol/L",
-                "ref_min": 3.9,
-                "ref_max": 5.5,
-            }
-        )
-
-    # Cholesterol / Холестерин
-    m = re.search(
-        r"(cholesterol|холестерин)\s*[:\-]?\s*([0-9]+[.,]?[0-9]*)", norm_all, re.IGNORECASE
-    )
-    if m:
-        tests.append(
-            {
-                "test_name": "Cholesterol",
-                "value": _num(m.group(2)),
-                "units": "mg/dL",
-                "ref_min": 0,
-                "ref_max": 200,
-            }
-        )
+# --- парсер OCR-текста ---
+# Горячий путь: ocr_image оценивает этим парсером каждый вариант OCR (до 12 раз на изображение).
+# Всё, что не зависит от текста, скомпилировано здесь один раз, а каждая строка
+# нормализуется и классифицируется ровно один раз (_classify_lines).
+
+# "Глюкоза 5.6 ммоль/л 3.9-5.5" или "ALT 42 U/L (0-40)" и т.п.
+_ROW_RE = re.compile(
+    r"(?P<name>[A-Za-zА-Яа-я][A-Za-zА-Яа-я0-9/\-\s]{2,50}?)\s+"
+    r"(?P<value>[0-9]+[.,]?[0-9]*)\s*"
+    r"(?P<units>[A-Za-zА-Яа-я/%µμ\./×х\^]{0,12})\s*"
+    r"(?:\(?\s*(?P<refmin>[0-9]+[.,]?[0-9]*)\s*[-–]\s*(?P<refmax>[0-9]+[.,]?[0-9]*)\s*\)?)?",
+    re.IGNORECASE,
+)
+_REF_OP_RE = re.compile(r"(?P<op><=|>=|<|>)\s*(?P<num>[0-9]+[.,]?[0-9]*)")
+_NUMBER_RE = re.compile(r"([0-9]+(?:[.,][0-9]+)?)")
+_NAME_START_RE = re.compile(r"^[A-Za-zА-Яа-я]")
+_LETTER_RE = re.compile(r"[A-Za-zА-Яа-я]")
+_UNIT_ABBR_RE = re.compile(r"(ме|ед|iu|u|mg|g|ng|pg|ммоль|мкмоль|мкг|мг|нг|пг|г|л|мл)")
+# "<аналит> [:-] <число>" сразу после совпадения словаря
+_QUICK_VALUE_RE = re.compile(r"\s*[:\-]?\s*([0-9]+[.,]?[0-9]*)")
+
+_SKIP_KEYWORDS = (
+    "инвитро",
+    "перейти на исходный",
+    "документ результатов",
+    "лабораторного тестирования",
+    "пол",
+    "возраст",
+    "адрес",
+    "дата",
+    "врач",
+    "пациент",
+    "инз",
+    "номер заказа",
+    "заказ",
+    "исполнитель",
+    "подпись",
+    "внимание",
+    "результаты исследований",
+    "не являются диагнозом",
+    "необходима консультация",
+    "www.",
+    "http",
+)
+# одна альтернация вместо any(k in low for k in ...) на каждую строку
+_SKIP_RE = re.compile("|".join(re.escape(k) for k in _SKIP_KEYWORDS))
+_METHOD_RE = re.compile("технология|оборудование|тест-система")
+_QUALITATIVE_RE = re.compile("отрицат|положит|обнаруж")
+_NOT_A_NAME_RE = re.compile("отрицат|положит|обнаруж|норма")
+_VERTICAL_HEADER_RE = re.compile(r"исслед|результ|значен|единиц|ед\.|рефер|норм|коммент")
+_HEADER_WORDS = frozenset(("исследование", "результат", "единицы", "референсные", "значения", "комментарий"))
+_SEX_WORDS = frozenset(("муж", "жен", "мужской", "женский"))
+# OCR часто выдаёт "не-ASCII" дефисы/минусы — приводим к обычному '-'
+_DASHES = ("‑", "–", "—", "−", "‐", "\xad")
+
+# Классы строк
+_EMPTY, _STOP, _SKIP, _TEXT = range(4)
+
+
+def _num(x: str) -> float:
+    return float(x.replace(",", "."))
+
+
+def _first_number(s: str) -> float | None:
+    m = _NUMBER_RE.search(s)
+    return _num(m.group(1)) if m else None
+
+
+def _digit_ratio(s: str) -> float:
+    return sum(map(str.isdigit, s)) / max(1, len(s))
+
+
+def _classify_lines(text: str) -> list[tuple[int, str, str]]:
+    """(класс, нормализованная строка, она же в нижнем регистре) — по одной записи на строку текста."""
+    out: list[tuple[int, str, str]] = []
+    # цепочка replace: для отсутствующего символа — быстрый поиск в C (str.translate с
+    # не-ASCII таблицей на порядок медленнее)
+    for dash in _DASHES:
+        text = text.replace(dash, "-")
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            out.append((_EMPTY, "", ""))
+            continue
+        low = line.lower()
+        if "внимание" in low:  # футер-предупреждение: дальше таблицы нет
+            kind = _STOP
+        elif _SKIP_RE.search(low):
+            kind = _SKIP
+        else:
+            kind = _TEXT
+        out.append((kind, line, low))
+    return out
 
-    # Общий парсер строк вида:
-    # "Глюкоза 5.6 ммоль/л 3.9-5.5" или "ALT 42 U/L (0-40)" и т.п.
-    # Важно: это эвристика, но она даёт разные результаты на разных документах.
-    row_re = re.compile(
-        r"(?P<name>[A-Za-zА-Яа-я][A-Za-zА-Яа-я0-9/\-\s]{2,50}?)\s+"
-        r"(?P<value>[0-9]+[.,]?[0-9]*)\s*"
-        r"(?P<units>[A-Za-zА-Яа-я/%µμ\./×х\^]{0,12})\s*"
-        r"(?:\(?\s*(?P<refmin>[0-9]+[.,]?[0-9]*)\s*[-–]\s*(?P<refmax>[0-9]+[.,]?[0-9]*)\s*\)?)?",
-        re.IGNORECASE,
-    )
 
-    ref_op_re = re.compile(r"(?P<op><=|>=|<|>)\s*(?P<num>[0-9]+[.,]?[0-9]*)")
-
-    skip_keywords = (
-        "инвитро",
-        "перейти на исходный",
-        "документ результатов",
-        "лабораторного тестирования",
-        "пол",
-        "возраст",
-        "адрес",
-        "дата",
-        "врач",
-        "пациент",
-        "инз",
-        "номер заказа",
-        "заказ",
-        "исполнитель",
-        "подпись",
-        "внимание",
-        "результаты исследований",
-        "не являются диагнозом",
-        "необходима консультация",
-        "www.",
-        "http",
-    )
+def _is_table_header(low: str) -> bool:
+    has_test = ("исслед" in low) or ("показат" in low)
+    has_value = ("результ" in low) or ("значен" in low)
+    has_units = ("ед" in low) or ("единиц" in low)
+    has_ref = ("рефер" in low) or ("норм" in low)
+    return has_test and has_value and has_units and has_ref
 
-    def is_table_header(line: str) -> bool:
-        l = line.lower()
-        has_test = ("исслед" in l) or ("показат" in l)
-        has_value = ("результ" in l) or ("значен" in l)
-        has_units = ("ед" in l) or ("единиц" in l) or ("ед. изм" in l) or ("ед изм" in l)
-        has_ref = ("рефер" in l) or ("норм" in l) or ("нормальн" in l)
-        return has_test and has_value and has_units and has_ref
 
-    lines = [ln.strip() for ln in text.splitlines()]
-    start_idx = 0
+def _table_start(lines: list[tuple[int, str, str]]) -> int:
+    """Индекс первой строки после заголовка таблицы (0 — заголовок не найден)."""
     # 1) "горизонтальный" заголовок (в одной строке)
-    for i, ln in enumerate(lines):
-        if is_table_header(ln):
-            start_idx = i + 1
-            break
+    for i, (_kind, _line, low) in enumerate(lines):
+        if _is_table_header(low):
+            return i + 1
 
     # 2) "вертикальный" заголовок (каждое слово в отдельной строке): Исследование / Результат / Единицы / Референсные / значения / Комментарий
-    if start_idx == 0:
-        header_tokens = ("исслед", "результ", "значен", "единиц", "ед.", "рефер", "норм", "коммент")
-
-        def _is_header_line(s: str) -> bool:
-            l = s.lower()
-            return any(t in l for t in header_tokens)
-
-        for i, ln in enumerate(lines):
-            l = ln.lower()
-            if ("исслед" in l) or ("показат" in l):
-                window = " ".join(lines[i : i + 10]).lower()
-                has_value = ("результ" in window) or ("значен" in window)
-                has_units = ("единиц" in window) or ("ед." in window) or ("ед изм" in window)
-                has_ref = ("рефер" in window) or ("норм" in window) or ("значен" in window)
-                if has_value and has_units and has_ref:
-                    j = i
-                    while j < len(lines) and _is_header_line(lines[j]):
-                        j += 1
-                    start_idx = j
-                    break
+    for i, (_kind, _line, low) in enumerate(lines):
+        if ("исслед" in low) or ("показат" in low):
+            window = " ".join(x[2] for x in lines[i : i + 10])
+            has_value = ("результ" in window) or ("значен" in window)
+            has_units = ("единиц" in window) or ("ед." in window) or ("ед изм" in window)
+            has_ref = ("рефер" in window) or ("норм" in window) or ("значен" in window)
+            if has_value and has_units and has_ref:
+                j = i
+                while j < len(lines) and _VERTICAL_HEADER_RE.search(lines[j][2]):
+                    j += 1
+                return j
+    return 0
+
+
+def _looks_like_units(s: str, low: str) -> bool:
+    if not s or len(s) > 20:
+        return False
+    if " " in s:
+        return False
+    if any(ch.isdigit() for ch in s):
+        return False
+    # типичные единицы почти всегда содержат "/" или "%", либо короткие общепринятые сокращения
+    low = low.replace(".", "")
+    if "/" in low or "%" in low or "×" in s or "x" in low:
+        return True
+    return _UNIT_ABBR_RE.fullmatch(low) is not None
+
+
+def _looks_like_name(s: str, low: str) -> bool:
+    # строки со служебными словами (_SKIP) сюда не доходят
+    if len(s) < 3 or len(s) > 80:
+        return False
+    if not _NAME_START_RE.match(s):
+        return False
+    # заголовки/служебное
+    if low in _HEADER_WORDS or low in _SEX_WORDS:
+        return False
+    # единицы/значения/комментарии не должны становиться именами
+    if _looks_like_units(s, low):
+        return False
+    if _METHOD_RE.search(low) or _NOT_A_NAME_RE.search(low):
+        return False
+    return _digit_ratio(s) <= 0.2
+
+
+def _parse_ref(s: str) -> tuple[float | None, float | None]:
+    m = _RANGE_RE.search(s)
+    if m:
+        return _num(m.group("min")), _num(m.group("max"))
+    mop = _REF_OP_RE.search(s)
+    if mop:
+        num = _num(mop.group("num"))
+        if mop.group("op") in ("<", "<="):
+            return None, num
+        return num, None
+    nums = [n for n in map(_first_number, s.split()) if n is not None]
+    if len(nums) >= 2:
+        return nums[0], nums[1]
+    return None, None
 
-    def _normalize_line(s: str) -> str:
-        # OCR часто выдаёт "не-ASCII" дефисы/минусы — приводим к обычному '-'
-        return (
-            s.replace("‑", "-")
-            .replace("–", "-")
-            .replace("—", "-")
-            .replace("−", "-")
-            .replace("‐", "-")
-            .replace("­", "-")
-        )
 
-    def _first_number(s: str) -> float | None:
-        m = re.search(r"([0-9]+(?:[.,][0-9]+)?)", s)
-        if not m:
-            return None
-        return _num(m.group(1))
-
-    def _looks_like_name(s: str) -> bool:
-        if not s or len(s) < 3 or len(s) > 80:
-            return False
-        if not re.match(r"^[A-Za-zА-Яа-я]", s):
-            return False
-        low = s.lower()
-        # заголовки/служебное
-        if low in ("исследование", "результат", "единицы", "референсные", "значения", "комментарий"):
-            return False
-        # единицы/значения/комментарии не должны становиться именами
-        if _looks_like_units(s):
-            return False
-        if low in ("муж", "жен", "мужской", "женский"):
-            return False
-        if any(w in low for w in ("технология", "оборудование", "тест-система")):
-            return False
-        if any(w in low for w in ("отрицат", "положит", "не обнаруж", "обнаруж", "норма")):
-            return False
-        digits = sum(ch.isdigit() for ch in s)
-        if digits / max(1, len(s)) > 0.2:
-            return False
-        if any(k in low for k in skip_keywords):
-            return False
-        return True
+def _append_comment(cur: dict, line: str) -> None:
+    cur["comment"] = (cur["comment"] + "\n" if cur["comment"] else "") + line
 
-    def _parse_ref(s: str) -> tuple[float | None, float | None]:
-        s = s.replace("—", "-").replace("–", "-")
-        m = _RANGE_RE.search(s)
-        if m:
-            return _num(m.group("min")), _num(m.group("max"))
-        mop = ref_op_re.search(s)
-        if mop:
-            op = mop.group("op")
-            num = _num(mop.group("num"))
-            if op in ("<", "<="):
-                return None, num
-            return num, None
-        nums = [_first_number(x) for x in re.split(r"\s+", s)]
-        nums = [n for n in nums if n is not None]
-        if len(nums) >= 2:
-            return nums[0], nums[1]
-        return None, None
-
-    def _looks_like_units(s: str) -> bool:
-        if not s or len(s) > 20:
-            return False
-        if " " in s:
-            return False
-        if any(ch.isdigit() for ch in s):
-            return False
-        # типичные единицы почти всегда содержат "/" или "%", либо короткие общепринятые сокращения
-        low = s.lower().replace(".", "")
-        if "/" in low or "%" in low or "×" in s or "x" in low:
-            return True
-        return bool(re.fullmatch(r"(ме|ед|iu|u|mg|g|ng|pg|ммоль|мкмоль|мкг|мг|нг|пг|г|л|мл)", low))
-
-    # Табличный OCR-режим (PDF сканы часто дают "вертикальную" раскладку: имя/значение/ед/реф по строкам)
-    table_tests: list[dict] = []
+
+def _parse_table(lines: list[tuple[int, str, str]], start: int) -> list[dict]:
+    """
+    Табличный OCR-режим (PDF-сканы часто дают "вертикальную" раскладку: имя/значение/ед/реф по строкам).
+    Автомат по строкам: строка либо продолжает текущий показатель (значение, единицы,
+    референс, комментарий), либо начинает новый (имя), либо пропускается.
+    """
+    out: list[dict] = []
     cur: dict | None = None
-    for raw in lines[start_idx:]:
-        if not raw:
-            continue
-        line = _normalize_line(raw).strip()
-        if not line:
-            continue
-        low = line.lower()
-        if "внимание" in low:
+    for kind, line, low in lines[start:]:
+        if kind == _STOP:
             break
-        if any(k in low for k in skip_keywords):
+        if kind != _TEXT or low == "значения":
             continue
-        if low == "значения":
-            continue
-        if cur:
+        if cur is not None:
             # значение числовое отдельной строкой
-            if cur.get("value") is None and _NUM_RE.match(line):
+            if cur["value"] is None and _NUM_RE.match(line):
                 cur["value"] = _num(line)
                 continue
-
             # единицы отдельной строкой
-            if cur.get("units") is None and _looks_like_units(line):
+            if cur["units"] is None and _looks_like_units(line, low):
                 cur["units"] = line
                 continue
-
             # референс отдельной строкой
-            if cur.get("ref_min") is None and cur.get("ref_max") is None:
+            if cur["ref_min"] is None and cur["ref_max"] is None:
                 rmin, rmax = _parse_ref(line)
                 if rmin is not None or rmax is not None:
                     cur["ref_min"], cur["ref_max"] = rmin, rmax
                     continue
-
             # качественное значение (например "отрицат.")
-            if cur.get("value") is None and len(line) <= 30 and re.search(r"[A-Za-zА-Яа-я]", line):
-                if any(w in low for w in ("отрицат", "положит", "не обнаруж", "обнаруж")):
-                    cur["comment"] = (cur.get("comment") + "\n" if cur.get("comment") else "") + line
-                    continue
-
+            if cur["value"] is None and len(line) <= 30 and _LETTER_RE.search(line) and _QUALITATIVE_RE.search(low):
+                _append_comment(cur, line)
+                continue
             # длинные комментарии по методике/оборудованию — приклеиваем к comment
-            if any(w in low for w in ("технология", "оборудование", "тест-система")):
-                cur["comment"] = (cur.get("comment") + "\n" if cur.get("comment") else "") + line
+            if _METHOD_RE.search(low):
+                _append_comment(cur, line)
                 continue
-
         # старт новой строки-показателя
-        if _looks_like_name(line):
-            if cur and cur.get("test_name"):
-                table_tests.append(cur)
+        if _looks_like_name(line, low):
+            if cur is not None:
+                out.append(cur)
             cur = {"test_name": line, "value": None, "units": None, "ref_min": None, "ref_max": None, "comment": None}
-            continue
+    if cur is not None:
+        out.append(cur)
+    return out
 
-        if not cur:
-            continue
-
-    if cur and cur.get("test_name"):
-        table_tests.append(cur)
 
-    # если таблицу распарсили — вернём её (и добавим к уже найденным glucose/cholesterol, если они есть)
-    if table_tests:
-        # нормализация/дедуп по имени
-        seen = {x.get("test_name", "").lower() for x in tests}
-        for t in table_tests:
-            if t["test_name"].lower() in seen:
-                continue
-            tests.append(t)
-            seen.add(t["test_name"].lower())
-        return tests
-
-    # Построчно — меньше "смешивания" колонок
-    for line in (ln.strip() for ln in lines[start_idx:]):
-        if not line:
-            continue
-        line = _normalize_line(line)
-        low = line.lower()
-        if any(k in low for k in skip_keywords):
-            # если это предупреждение/футер — можно прекратить парсинг
-            if "внимание" in low:
-                break
+def _parse_rows(lines: list[tuple[int, str, str]], start: int) -> list[dict]:
+    """Построчный режим: показатель целиком в одной строке — меньше "смешивания" колонок."""
+    tests: list[dict] = []
+    keys: set[str] = set()
+    for kind, line, _low in lines[start:]:
+        if kind == _STOP:
+            break
+        if kind != _TEXT:
             continue
         # защита от "паспортных" строк: слишком много цифр и двоеточие/точки
-        digits = sum(ch.isdigit() for ch in line)
-        if digits / max(1, len(line)) > 0.35 and (":" in line or "." in line):
+        if _digit_ratio(line) > 0.35 and (":" in line or "." in line):
             continue
 
-        for m2 in row_re.finditer(line):
-            name = " ".join(m2.group("name").split()).strip(" .,:;()[]")
-            if not name or len(name) < 3:
-                continue
-            if any(k in name.lower() for k in skip_keywords):
+        for m in _ROW_RE.finditer(line):
+            name = " ".join(m.group("name").split()).strip(" .,:;()[]")
+            if len(name) < 3 or _SKIP_RE.search(name.lower()):
                 continue
-            value = _num(m2.group("value"))
-            units = (m2.group("units") or "").strip()
-            refmin = m2.group("refmin")
-            refmax = m2.group("refmax")
-
+            refmin = m.group("refmin")
+            refmax = m.group("refmax")
             ref_min = _num(refmin) if refmin else None
             ref_max = _num(refmax) if refmax else None
             # поддержка референсов вида "<7,29" / "> 1.2"
             if ref_min is None and ref_max is None:
-                mref = ref_op_re.search(line)
+                mref = _REF_OP_RE.search(line)
                 if mref:
-                    op = mref.group("op")
-                    num = _num(mref.group("num"))
-                    if op in ("<", "<="):
-                        ref_max = num
+                    if mref.group("op") in ("<", "<="):
+                        ref_max = _num(mref.group("num"))
                     else:
-                        ref_min = num
-
-            t = {
-                "test_name": name[:255],
-                "value": value,
-                "units": units or None,
-                "ref_min": ref_min,
-                "ref_max": ref_max,
-            }
-            # не плодим дубликаты по имени
-            if not any(x.get("test_name", "").lower() == t["test_name"].lower() for x in tests):
+                        ref_min = _num(mref.group("num"))
+            # не плодим дубликаты по аналиту
+            key = canonical_test_name(name)
+            if key in keys:
+                continue
+            keys.add(key)
+            tests.append(
+                {
+                    "test_name": name[:255],
+                    "value": _num(m.group("value")),
+                    "units": m.group("units").strip() or None,
+                    "ref_min": ref_min,
+                    "ref_max": ref_max,
+                }
+            )
+    return tests
+
+
+# кириллические и латинские обозначения единиц -> общий вид для сравнения с единицами словаря
+_UNIT_ALIASES = (
+    ("мкмоль", "umol"), ("ммоль", "mmol"), ("нмоль", "nmol"), ("пмоль", "pmol"),
+    ("мкме", "uu"), ("мкед", "uu"), ("мме", "miu"), ("ед", "u"),
+    ("мкг", "ug"), ("мг", "mg"), ("нг", "ng"), ("пг", "pg"), ("г", "g"),
+    ("дл", "dl"), ("мл", "ml"), ("фл", "fl"), ("мм", "mm"), ("л", "l"), ("ч", "h"),
+)
+
+
+def _units_key(units: str | None) -> str:
+    u = "".join((units or "").lower().split()).replace("µ", "u").replace("μ", "u").replace(".", "")
+    for src, dst in _UNIT_ALIASES:
+        u = u.replace(src, dst)
+    return u
+
+
+def _quick_tests(text: str) -> dict[str, dict]:
+    """
+    Быстрый проход по словарю аналитов (один проход автомата по всему тексту):
+    "<аналит> [:-] <число> [единицы] [референс]". Единицы и референс берутся из строки документа;
+    референс словаря — только если в документе его нет, а единицы совпадают со словарными.
+    """
+    norm_all = "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+    matches = find_analytes(norm_all)
+    quick: dict[str, dict] = {}
+    for i, am in enumerate(matches):
+        a = am.analyte
+        if a.key in quick:
+            continue
+        mv = _QUICK_VALUE_RE.match(norm_all, am.end)
+        if not mv:
+            continue
+        # хвост строки после значения — до конца строки или следующего аналита
+        end = norm_all.find("\n", mv.end())
+        end = len(norm_all) if end < 0 else end
+        if i + 1 < len(matches):
+            end = min(end, matches[i + 1].start)
+        tail = norm_all[mv.end() : end].split(maxsplit=1)
+        units = None
+        if tail and _looks_like_units(tail[0], tail[0].lower()):
+            units = tail.pop(0)
+        ref_min, ref_max = _parse_ref(tail[0]) if tail else (None, None)
+        if ref_min is None and ref_max is None and units and _units_key(units) == _units_key(a.units):
+            ref_min, ref_max = a.ref_min, a.ref_max
+        quick[a.key] = {
+            "test_name": a.name,
+            "value": _num(mv.group(1)),
+            "units": units,
+            "ref_min": ref_min,
+            "ref_max": ref_max,
+        }
+    return quick
+
+
+def _with_quick(parsed: list[dict], quick: dict[str, dict]) -> list[dict]:
+    """
+    Словарные записи — запасные: строка документа с тем же аналитом важнее. Строке без значения
+    (склеенная OCR-строка и т.п.) значение дополняется из словарного прохода, а её собственные
+    единицы/референсы остаются.
+    """
+    out: list[dict] = []
+    keys: set[str] = set()
+    for t in parsed:
+        key = canonical_test_name(t.get("test_name"))
+        if t.get("value") is None and key in quick:
+            t = {**quick[key], **{k: v for k, v in t.items() if v is not None}}
+        out.append(t)
+        keys.add(key)
+    return out + [t for k, t in quick.items() if k not in keys]
+
+
+def extract_tests_from_text(text: str) -> list[dict]:
+    """
+    MVP-парсер: пытается вытащить несколько показателей из OCR-текста.
+    Если не получилось — вернём пустой список, чтобы вызывающий код мог сделать fallback.
+    """
+    if not text or not text.strip():
+        return []
+
+    quick = _quick_tests(text)
+    lines = _classify_lines(text)
+    start = _table_start(lines)
+
+    # если таблицу распарсили — вернём её (с дедупом по аналиту)
+    table_tests = _parse_table(lines, start)
+    if table_tests:
+        tests: list[dict] = []
+        seen: set[str] = set()
+        for t in table_tests:
+            key = canonical_test_name(t["test_name"])
+            if key not in seen:
                 tests.append(t)
+                seen.add(key)
+        return _with_quick(tests, quick)
 
-    return tests
+    return _with_quick(_parse_rows(lines, start), quick)
 
 
 def mock_extract_tests(_: str):
@@ -0,0 +1,239 @@
+"""
+Движок Tesseract для OCR.
+
+pytesseract на каждый вызов запускает процесс `tesseract`: загрузка traineddata rus+eng
+(десятки МБ) и временные файлы на диске — на небольших изображениях это дороже самого
+распознавания, а проходов до 12 на изображение. Поэтому основной движок — tesserocr
+(биндинг C API): экземпляры TessBaseAPI живут всё время жизни процесса-воркера, модели
+языков загружаются один раз, изображение передаётся из памяти.
+
+OCR_ENGINE: auto (по умолчанию: tesserocr, если установлен) | tesserocr | cli (pytesseract).
+
+Ядра делят процессы пула (OCR_WORKERS) и потоки внутри них (thread_budget), поэтому
+многопоточность самого tesseract выключают окружением: OMP_THREAD_LIMIT=1 (Dockerfile,
+env.example). OpenMP читает переменную при загрузке libtesseract — из кода её не задаём.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+import pytesseract
+from PIL import Image
+
+try:  # опциональная зависимость: нужны libtesseract/libleptonica (см. Dockerfile)
+    import tesserocr
+except ImportError:  # pragma: no cover - зависит от окружения
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANG = "rus+eng"
+
+# Простаивающие экземпляры API по языку. TessBaseAPI не потокобезопасен: каждый проход
+# берёт экземпляр из пула на время вызова (параллельные проходы — разные экземпляры).
+# Экземпляров одного языка в процессе не больше max_instances() (каждый — полная копия моделей
+# в памяти): лишние вызовы ждут свободный слот, а не создают новый экземпляр.
+_idle: dict[str, queue.SimpleQueue] = {}
+_slots: dict[str, threading.BoundedSemaphore] = {}
+_idle_pid: int | None = None
+# языки, для которых tesserocr не инициализировался (нет traineddata и т.п.) — сразу в CLI
+_broken_langs: set[str] = set()
+_lock = threading.Lock()
+
+
+def ocr_workers() -> int:
+    """OCR_WORKERS — число процессов пула OCR (по умолчанию = число CPU)."""
+    try:
+        return max(1, int(os.environ.get("OCR_WORKERS", str(os.cpu_count() or 2))))
+    except ValueError:
+        return 2
+
+
+# Число процессов пула OCR, которые сейчас обрабатывают документ: общий для пула
+# multiprocessing.Value, приходит в воркер через инициализатор пула (jobs._init_worker).
+_busy: Any = None
+
+
+def set_busy_counter(counter: Any) -> None:
+    global _busy
+    _busy = counter
+
+
+@contextmanager
+def busy() -> Iterator[None]:
+    """Документ в работе у этого процесса пула — учитывается в thread_budget() всех процессов."""
+    if _busy is None:
+        yield
+        return
+    with _busy.get_lock():
+        _busy.value += 1
+    try:
+        yield
+    finally:
+        with _busy.get_lock():
+            _busy.value -= 1
+
+
+def static_share() -> int:
+    """Доля ядер процесса пула при полной загрузке: cpu_count // OCR_WORKERS (по умолчанию 1)."""
+    return max(1, (os.cpu_count() or 1) // ocr_workers())
+
+
+def thread_budget() -> int:
+    """
+    Сколько вызовов Tesseract одному документу выполнять одновременно: ядра делятся между
+    процессами пула, занятыми документом прямо сейчас. Одиночный документ на простаивающем
+    сервере получает все ядра, при полностью загруженном пуле — static_share().
+    Вне пула (счётчика нет) — static_share(). От этого значения считаются умолчания
+    OCR_PDF_PARALLEL (страницы) и OCR_PARALLEL (проходы одного изображения).
+    """
+    if _busy is None:
+        return static_share()
+    return max(1, (os.cpu_count() or 1) // max(1, _busy.value))
+
+
+def engine_name() -> str:
+    if tesserocr is None or os.environ.get("OCR_ENGINE", "auto").lower() == "cli":
+        return "cli"
+    return "tesserocr"
+
+
+def max_instances() -> int:
+    """
+    OCR_ENGINE_INSTANCES — экземпляров TessBaseAPI на язык в процессе. По умолчанию — число CPU
+    (столько вызовов одновременно даёт thread_budget() одиночному документу), но простаивающими
+    держим только idle_instances(): экземпляры сверх них после всплеска освобождаются.
+    """
+    try:
+        return max(1, int(os.environ.get("OCR_ENGINE_INSTANCES", str(os.cpu_count() or 1))))
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+def idle_instances() -> int:
+    """Сколько простаивающих экземпляров держать: OCR_ENGINE_INSTANCES, если задан, иначе static_share()."""
+    if "OCR_ENGINE_INSTANCES" in os.environ:
+        return max_instances()
+    return static_share()
+
+
+def _lang_pool(lang: str) -> tuple[queue.SimpleQueue, threading.BoundedSemaphore]:
+    """
+    Пул привязан к pid: воркеры пула OCR (fork) не должны пользоваться экземплярами родителя,
+    у каждого процесса — свои.
+    """
+    global _idle_pid
+    pid = os.getpid()
+    with _lock:
+        if _idle_pid != pid:
+            _idle.clear()
+            _slots.clear()
+            _idle_pid = pid
+        q = _idle.get(lang)
+        if q is None:
+            q = _idle[lang] = queue.SimpleQueue()
+            _slots[lang] = threading.BoundedSemaphore(max_instances())
+        return q, _slots[lang]
+
+
+def _new_api(lang: str) -> Any:
+    kwargs: dict[str, Any] = {"lang": lang, "oem": tesserocr.OEM.LSTM_ONLY}
+    tessdata = os.environ.get("TESSDATA_PREFIX")
+    if tessdata:
+        kwargs["path"] = tessdata
+    return tesserocr.PyTessBaseAPI(**kwargs)
+
+
+_Pool = tuple[queue.SimpleQueue, threading.BoundedSemaphore]
+
+
+def _acquire(lang: str) -> tuple[Any, _Pool]:
+    """Экземпляр API и пул, в который его вернуть (ждёт свободный слот, если все заняты)."""
+    pool = idle, slots = _lang_pool(lang)
+    slots.acquire()
+    try:
+        return idle.get_nowait(), pool
+    except queue.Empty:
+        pass
+    try:
+        return _new_api(lang), pool
+    except BaseException:
+        slots.release()
+        raise
+
+
+def _release(api: Any, pool: _Pool) -> None:
+    idle, slots = pool
+    try:
+        if idle.qsize() >= idle_instances():
+            api.End()  # экземпляр всплеска: модели в памяти каждого процесса пула не копим
+        else:
+            api.Clear()  # освобождает изображение и результаты, модели остаются загружены
+            idle.put(api)
+    finally:
+        slots.release()
+
+
+def _mark_broken(lang: str, e: Exception) -> None:
+    # tesserocr не смог загрузить язык — CLI справится сам или выдаст понятную ошибку
+    logger.warning("tesserocr init failed for lang=%s: %s; falling back to pytesseract", lang, e)
+    _broken_langs.add(lang)
+
+
+def _cli_image_to_string(image: Image.Image, lang: str, psm: int) -> str:
+    tcmd = os.environ.get("TESSERACT_CMD")
+    if tcmd:
+        pytesseract.pytesseract.tesseract_cmd = tcmd
+    return pytesseract.image_to_string(image, lang=lang, config=f"--oem 1 --psm {psm}") or ""
+
+
+def image_to_string(image: Image.Image, lang: str = DEFAULT_LANG, psm: int = 6) -> str:
+    """Текст изображения (LSTM, заданный режим сегментации страницы)."""
+    if engine_name() == "cli" or lang in _broken_langs:
+        return _cli_image_to_string(image, lang, psm)
+    try:
+        api, pool = _acquire(lang)
+    except RuntimeError as e:
+        _mark_broken(lang, e)
+        return _cli_image_to_string(image, lang, psm)
+    try:
+        api.SetPageSegMode(psm)
+        api.SetImage(image)
+        return api.GetUTF8Text() or ""
+    finally:
+        _release(api, pool)
+
+
+def warm_up(lang: str = DEFAULT_LANG) -> None:
+    """
+    Инициализатор воркера пула OCR: загрузить модели языка до первого документа,
+    чтобы первый запрос не платил за загрузку traineddata.
+    """
+    if engine_name() == "cli" or lang in _broken_langs:
+        return
+    try:
+        _release(*_acquire(lang))
+    except RuntimeError as e:
+        _mark_broken(lang, e)
+
+
+def shutdown() -> None:
+    """Освободить экземпляры API текущего процесса (модели, кэши Tesseract)."""
+    with _lock:
+        if _idle_pid != os.getpid():
+            return
+        queues = list(_idle.values())
+        _idle.clear()
+        _slots.clear()
+    for q in queues:
+        while True:
+            try:
+                q.get_nowait().End()
+            except queue.Empty:
+                break
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import os
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+
+class PdfDocument:
+    """
+    PDF, открытый один раз на всю обработку документа.
+    Текст и спаны каждой страницы извлекаются одним вызовом get_text("dict") и кэшируются:
+    их используют и структурный парсер (extract_tests_from_pdf), и OCR-fallback (ocr_pdf_bytes).
+
+    Не потокобезопасен (как и сам fitz.Document): все вызовы — из одного потока.
+    """
+
+    def __init__(self, pdf: bytes | str | os.PathLike, max_pages: int = 4) -> None:
+        # путь к файлу: MuPDF читает файл сам по мере надобности, байты документа не копируются в память
+        if isinstance(pdf, (str, os.PathLike)):
+            self._doc = fitz.open(pdf, filetype="pdf")
+        else:
+            self._doc = fitz.open(stream=pdf, filetype="pdf")
+        self.page_count = min(len(self._doc), max_pages)
+        self._pages: dict[int, tuple[str, list[dict]]] = {}
+
+    def __enter__(self) -> PdfDocument:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._doc.close()
+
+    def _load(self, i: int) -> tuple[str, list[dict]]:
+        cached = self._pages.get(i)
+        if cached is not None:
+            return cached
+        d = self._doc.load_page(i).get_text("dict")
+        # текст страницы собираем из того же dict — это ровно то, что вернул бы get_text("text")
+        lines_text: list[str] = []
+        spans: list[dict] = []
+        for b in d.get("blocks", []):
+            for line in b.get("lines", []):
+                lines_text.append("".join(span.get("text") or "" for span in line.get("spans", [])))
+                for span in line.get("spans", []):
+                    t = (span.get("text") or "").strip()
+                    if not t:
+                        continue
+                    x0, y0, x1, y1 = span.get("bbox", (0, 0, 0, 0))
+                    spans.append({"text": t, "x0": float(x0), "x1": float(x1), "y0": float(y0), "y1": float(y1)})
+        text = "\n".join(lines_text).strip()
+        self._pages[i] = (text, spans)
+        return text, spans
+
+    def page_text(self, i: int) -> str:
+        return self._load(i)[0]
+
+    def page_spans(self, i: int) -> list[dict]:
+        return self._load(i)[1]
+
+    def render_page(
+        self, i: int, zoom: float = 2.0, clip: tuple[float, float, float, float] | None = None
+    ) -> Image.Image:
+        # Пиксели pixmap сразу в PIL, без PNG encode/decode. Рендерим в градациях серого:
+        # OCR-пайплайн всё равно работает с L-изображением.
+        # clip — область в пикселях рендера с zoom=1 (= page.rect, в т.ч. для повёрнутых страниц):
+        # рендерится только она.
+        page = self._doc.load_page(i)
+        rect = fitz.Rect(clip) if clip is not None else None
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False, clip=rect)
+        return Image.frombytes("L", (pix.width, pix.height), pix.samples, "raw", "L", pix.stride)
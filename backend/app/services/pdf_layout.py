@@ -0,0 +1,99 @@
+"""
+Геометрия спанов "цифрового" PDF на NumPy: строки, ячейки, колонки.
+Используется структурным парсером extract_tests_from_pdf (services/ocr.py).
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+ROW_TOL = 2.8  # px: центры спанов одной строки по y
+CELL_GAP = 6.0  # px: спаны ближе этого по x — одна ячейка
+
+
+@dataclass
+class RowLayout:
+    rows: list[list[dict]]  # строки сверху вниз (по страницам), ячейки слева направо
+    page: np.ndarray  # страница каждой строки
+    y: np.ndarray  # средний центр ячеек строки по y
+
+
+def band(keys: np.ndarray, values: np.ndarray, tol: float) -> np.ndarray:
+    """
+    Номера полос для значений, отсортированных по (keys, values): новая полоса начинается
+    при смене ключа (страницы) или разрыве между соседними значениями больше tol.
+    """
+    if values.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    new = np.empty(values.size, dtype=bool)
+    new[0] = True
+    new[1:] = (np.diff(values) > tol) | (keys[1:] != keys[:-1])
+    return np.cumsum(new) - 1
+
+
+def group_rows(spans_by_page: list[list[dict]], tol: float = ROW_TOL, gap: float = CELL_GAP) -> RowLayout:
+    """Спаны страниц -> строки таблицы из склеенных ячеек."""
+    spans = [s for p in spans_by_page for s in p]
+    if not spans:
+        return RowLayout([], np.zeros(0, dtype=np.int64), np.zeros(0))
+    page = np.repeat(np.arange(len(spans_by_page)), [len(p) for p in spans_by_page])
+    box = np.array([(s["x0"], s["x1"], s["y0"], s["y1"]) for s in spans], dtype=np.float64)
+    x0, x1, y0, y1 = box.T
+    yc = (y0 + y1) / 2.0
+
+    # 1) строки: сортировка по (страница, y, x) и разрывы по y больше tol
+    order = np.lexsort((x0, yc, page))
+    row = band(page[order], yc[order], tol)
+    # внутри строки — слева направо (lexsort стабилен: при равных x сохраняется порядок по y)
+    order = order[np.lexsort((x0[order], row))]
+    row = np.sort(row)
+    x0, x1, y0, y1, page = x0[order], x1[order], y0[order], y1[order], page[order]
+
+    # 2) ячейки: зазор до правого края уже пройденных спанов строки в [0, gap].
+    # Накопленный максимум x1 сбрасываем на границе строк сдвигом на номер строки.
+    offset = row * (np.abs(box).max() * 2 + 1)
+    reach = np.maximum.accumulate(x1 + offset) - offset
+    new_cell = np.ones(len(order), dtype=bool)
+    dist = x0[1:] - reach[:-1]
+    new_cell[1:] = (row[1:] != row[:-1]) | (dist < 0) | (dist > gap)
+    starts = np.flatnonzero(new_cell)
+    ends = np.append(starts[1:], len(order))
+    c_x0 = x0[starts]
+    c_x1 = np.maximum.reduceat(x1, starts)
+    c_y0 = np.minimum.reduceat(y0, starts)
+    c_y1 = np.maximum.reduceat(y1, starts)
+    c_row = row[starts]
+
+    texts = [spans[i]["text"] for i in order]
+    # tolist(): итерация по скалярам NumPy в разы медленнее, чем по float
+    cells = [
+        {"text": " ".join(texts[a:b]), "x0": cx0, "x1": cx1, "y0": cy0, "y1": cy1}
+        for a, b, cx0, cx1, cy0, cy1 in zip(
+            starts.tolist(), ends.tolist(), c_x0.tolist(), c_x1.tolist(), c_y0.tolist(), c_y1.tolist()
+        )
+    ]
+
+    # 3) строки из ячеек + средний центр ячеек строки по y (для поиска строки заголовка)
+    n_rows = int(row[-1]) + 1
+    row_starts = np.searchsorted(c_row, np.arange(n_rows))
+    bounds = np.append(row_starts, len(cells)).tolist()
+    rows = [cells[bounds[i] : bounds[i + 1]] for i in range(n_rows)]
+    counts = np.bincount(c_row, minlength=n_rows)
+    row_y = np.bincount(c_row, weights=(c_y0 + c_y1) / 2.0, minlength=n_rows) / counts
+    return RowLayout(rows, page[starts][row_starts], row_y)
+
+
+def two_means(xs: np.ndarray, iters: int = 10) -> tuple[float, float]:
+    """1D k-means на два кластера (колонки значений и референсов): центры по возрастанию."""
+    xs = np.sort(np.asarray(xs, dtype=np.float64))
+    c1 = xs[int(len(xs) * 0.25)]
+    c2 = xs[int(len(xs) * 0.75)]
+    for _ in range(iters):
+        near1 = np.abs(xs - c1) <= np.abs(xs - c2)
+        if near1.any():
+            c1 = xs[near1].mean()
+        if not near1.all():
+            c2 = xs[~near1].mean()
+    return (float(c1), float(c2)) if c1 < c2 else (float(c2), float(c1))
@@ -12,6 +12,10 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
 
+# Версия шаблона отчёта: входит в ключ сохранённых PDF (reports/{id}/report_t{версия}.pdf).
+# Повышаем при изменении вёрстки, чтобы не отдавать старые PDF из хранилища.
+PDF_TEMPLATE_VERSION = "1"
+
 
 def build_report_pdf(
     *,
@@ -168,6 +172,16 @@ def build_report_pdf(
     return buf.getvalue()
 
 
+def build_report_pdf_from_payload(report: dict) -> bytes:
+    """PDF по готовому JSON-отчёту (см. report_generator.build_report_payload)."""
+    return build_report_pdf(
+        analysis_id=report["analysis_id"],
+        indicators=report["indicators"],
+        deviations=report["deviations"],
+        recommendations=report["recommendations"],
+    )
+
+
 def _register_fonts() -> tuple[str, str]:
     """
     Регистрируем DejaVuSans (кириллица) если шрифты доступны в системе.
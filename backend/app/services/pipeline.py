@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Callable
+
+from .normalization import canonical_test_name
+from .ocr import (
+    extract_tests_from_pdf,
+    extract_tests_from_text,
+    mock_extract_tests,
+    ocr_image_bytes,
+    ocr_image_file,
+    ocr_pdf_bytes,
+)
+from .pdf_document import PdfDocument
+from .storage import spooled_object
+
+
+def _merge_tests(primary: list[dict], secondary: list[dict]) -> list[dict]:
+    """
+    Сливаем результаты двух парсеров (структурный PDF + OCR-текст) с дедупом по ключу аналита
+    ("Глюкоза" из PDF и "Glucose" из OCR — один показатель).
+    Предпочитаем запись, где есть числовое value/референсы/единицы/комментарий.
+    """
+
+    def _key(t: dict) -> str:
+        return canonical_test_name(t.get("test_name"))
+
+    def _score(t: dict) -> int:
+        s = 0
+        if t.get("value") is not None:
+            s += 3
+        if t.get("units"):
+            s += 1
+        if t.get("ref_min") is not None or t.get("ref_max") is not None:
+            s += 1
+        if t.get("comment"):
+            s += 1
+        return s
+
+    out: dict[str, dict] = {}
+    for t in primary + secondary:
+        k = _key(t)
+        if not k:
+            continue
+        if k not in out or _score(t) > _score(out[k]):
+            out[k] = t
+    return list(out.values())
+
+
+def is_pdf(content_type: str | None) -> bool:
+    ctype = (content_type or "").lower()
+    return ctype in ("application/pdf",) or ctype.endswith("+pdf")
+
+
+def analyze_document(
+    content: bytes | os.PathLike,
+    content_type: str | None,
+    progress: Callable[[int, int], None] | None = None,
+) -> tuple[str | None, list[dict]]:
+    """
+    OCR + извлечение показателей для одного документа: байты или путь к файлу (Path).
+    Синхронная и CPU-тяжёлая функция: вызывается в пуле воркеров (см. services/jobs.py),
+    поэтому должна быть picklable и не трогать БД/event loop.
+    progress(готово страниц, всего страниц) — прогресс OCR (изображение — одна страница).
+    Возвращает (ocr_text, tests); ocr_text — полный, без обрезки. Ошибки (битый файл, сбой OCR)
+    не глотаются: jobs.process_analysis ставит по ним статус failed.
+    """
+    ocr_text: str | None = None
+    tests: list[dict] = []
+    ctype = (content_type or "").lower()
+    if ctype.startswith("image/"):
+        ocr_text = ocr_image_file(content) if isinstance(content, os.PathLike) else ocr_image_bytes(content)
+        if progress is not None:
+            progress(1, 1)
+        tests = extract_tests_from_text(ocr_text)
+    elif is_pdf(ctype):
+        pdf_max_pages = int(os.environ.get("PDF_MAX_PAGES", "4"))
+        min_pdf_tests = int(os.environ.get("PDF_MIN_TESTS", "3"))
+
+        # PDF открываем и разбираем один раз: текст/спаны страниц общие для обоих парсеров
+        with PdfDocument(content, max_pages=pdf_max_pages) as pdf:
+            # 1) Пробуем структурно извлечь из "цифрового" PDF по координатам
+            tests_struct, preview = extract_tests_from_pdf(pdf, max_pages=pdf_max_pages)
+            ocr_text = preview.strip() or None
+
+            # 2) Fallback: если получилось слишком мало показателей — делаем OCR и построчный парсинг
+            tests = tests_struct
+            if len(tests_struct) < min_pdf_tests:
+                ocr_full = ocr_pdf_bytes(pdf, max_pages=pdf_max_pages, progress=progress)
+                tests_ocr = extract_tests_from_text(ocr_full)
+                tests = _merge_tests(tests_ocr, tests_struct) if len(tests_ocr) > len(tests_struct) else _merge_tests(tests_struct, tests_ocr)
+                # для пользователя/отладки полезнее хранить именно OCR-текст, а не preview из PDF
+                ocr_text = ocr_full.strip() or ocr_text
+
+    # Важно: если OCR/парсер ничего не нашёл, оставляем пусто (это честнее, чем одинаковая заглушка).
+    # Заглушку оставим только как ручной fallback через env.
+    if not tests and os.environ.get("USE_MOCK_TESTS", "false").lower() == "true":
+        tests = mock_extract_tests(ocr_text or "")
+
+    return ocr_text, tests
+
+
+def analyze_stored_document(
+    document_ref: str,
+    content_type: str | None,
+    progress: Callable[[int, int], None] | None = None,
+) -> tuple[str | None, list[dict]]:
+    """
+    То же, что analyze_document, но документ читается из хранилища прямо в воркере:
+    в очереди задач и в процессе API висит только ключ объекта, а не байты файла.
+    В воркере документ тоже не держится в памяти целиком: он потоково пишется во временный файл,
+    и PyMuPDF/PIL читают его оттуда.
+    """
+    with spooled_object(document_ref) as path:
+        return analyze_document(Path(path), content_type, progress)
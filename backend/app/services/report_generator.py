@@ -1,6 +1,28 @@
 from __future__ import annotations
 
+import json
+import os
 from dataclasses import dataclass
+from decimal import Decimal
+
+from .result_cache import MemoryLRUCache
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+# Готовые отчёты неизменны: держим последние в памяти, чтобы частые запросы (бот, web)
+# не ходили в БД за report_json. Ключ — analysis_id, владелец проверяется по user_id.
+# При повторной обработке анализа запись сбрасывает jobs (invalidate_report).
+report_cache = MemoryLRUCache(max_entries=max(1, _env_int("REPORT_CACHE_SIZE", 1024)))
+
+
+def invalidate_report(analysis_id: int) -> None:
+    report_cache.delete(str(analysis_id))
 
 
 @dataclass(frozen=True)
@@ -24,3 +46,53 @@ def generate_recommendations(deviations: list[dict]) -> list[Recommendation]:
             recs.append(Recommendation(text=f"{test}: значение ниже нормы. Рекомендуется уточнить питание/дефициты и обсудить с врачом."))
     return recs or [Recommendation(text="Есть отклонения. Рекомендуется консультация врача.")]
 
+
+def _float(x: Decimal | float | None) -> float | None:
+    return float(x) if x is not None else None
+
+
+def build_report_payload(
+    *, analysis_id: int, status: str, indicators: list[dict]
+) -> dict:
+    """
+    JSON-отчёт по анализу. indicators — dict-и с полями TestIndicator
+    (test_name, value, units, ref_min, ref_max, deviation, comment).
+    OCR-текст в отчёт не входит: он большой и нужен редко (см. /report/{id}/ocr-text).
+    """
+    deviations = [
+        {
+            "test": i["test_name"],
+            "value": _float(i.get("value")),
+            "units": i.get("units"),
+            "deviation": i.get("deviation"),
+            "reason": "MVP: причина уточняется врачом",
+        }
+        for i in indicators
+        if i.get("deviation") in ("low", "high")
+    ]
+
+    recs = generate_recommendations(deviations)
+
+    return {
+        "analysis_id": analysis_id,
+        "status": status,
+        "deviations": deviations,
+        "recommendations": [{"text": r.text, "doctor_contact": r.doctor_contact} for r in recs],
+        "indicators": [
+            {
+                "test_name": i["test_name"],
+                "value": _float(i.get("value")),
+                "units": i.get("units"),
+                "ref_min": _float(i.get("ref_min")),
+                "ref_max": _float(i.get("ref_max")),
+                "deviation": i.get("deviation"),
+                "comment": i.get("comment"),
+            }
+            for i in indicators
+        ],
+    }
+
+
+def dump_report(payload: dict) -> str:
+    # компактный JSON: именно эти байты отдаются клиентам из analyses.report_json
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
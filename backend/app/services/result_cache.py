@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+
+# Версия парсеров/OCR-пайплайна. Повышаем при любом изменении, влияющем на результат
+# (эвристики extract_*, предобработка, набор PSM) — старые записи кэша перестают совпадать.
+PIPELINE_VERSION = "7"
+
+# env-настройки, от которых зависит результат analyze_document
+_SETTINGS_ENV = (
+    "PDF_MAX_PAGES",
+    "PDF_MIN_TESTS",
+    "USE_MOCK_TESTS",
+    "OCR_SEARCH_MODE",
+    "OCR_SCORE_THRESHOLD",
+    "OCR_PLATEAU_PASSES",
+    "OCR_MAX_PASSES",
+    "OCR_PREPROCESS",
+)
+
+
+def content_sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def cache_key(sha256: str, content_type: str | None) -> str:
+    """sha256(документа) + тип + версия пайплайна + настройки OCR/парсера."""
+    settings = ";".join(f"{k}={os.environ.get(k, '')}" for k in _SETTINGS_ENV)
+    raw = f"v{PIPELINE_VERSION}|{(content_type or '').lower()}|{settings}|{sha256}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache(ABC):
+    """
+    Базовый интерфейс бэкенда кэша: значение — JSON-совместимый dict.
+    Бэкенд без get/set не создаётся (TypeError при инстанцировании).
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> dict | None: ...
+
+    @abstractmethod
+    def set(self, key: str, value: dict) -> None: ...
+
+
+class MemoryLRUCache(ResultCache):
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max(1, max_entries)
+        self._data: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class DiskCache(ResultCache):
+    """
+    Файловый уровень: по JSON-файлу на ключ. Переживает рестарт и общий для всех
+    воркеров uvicorn на хосте. При превышении max_bytes удаляем самые старые файлы.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            # "touch" — для LRU-вытеснения по mtime
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def set(self, key: str, value: dict) -> None:
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            files = []
+            total = 0
+            for p in self.directory.glob("*.json"):
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            files.sort()
+            for _mtime, size, p in files:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    p.unlink()
+                    total -= size
+                except OSError:
+                    pass
+
+
+class TieredCache(ResultCache):
+    """Цепочка уровней (память -> диск): попадание на нижнем уровне поднимаем наверх."""
+
+    def __init__(self, *tiers: ResultCache) -> None:
+        self.tiers = tiers
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for upper in self.tiers[:i]:
+                    upper.set(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: dict) -> None:
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_cache: TieredCache | None = None
+
+
+def get_result_cache() -> TieredCache | None:
+    """
+    RESULT_CACHE: memory (по умолчанию) | disk (memory + диск) | off.
+    RESULT_CACHE_SIZE — записей в памяти, RESULT_CACHE_DIR / RESULT_CACHE_DISK_MAX_MB — файловый уровень.
+    """
+    global _cache
+    mode = os.environ.get("RESULT_CACHE", "memory").lower()
+    if mode == "off":
+        return None
+    if _cache is None:
+        try:
+            size = int(os.environ.get("RESULT_CACHE_SIZE", "256"))
+        except ValueError:
+            size = 256
+        tiers: list[ResultCache] = [MemoryLRUCache(size)]
+        if mode == "disk":
+            try:
+                max_mb = int(os.environ.get("RESULT_CACHE_DISK_MAX_MB", "256"))
+            except ValueError:
+                max_mb = 256
+            directory = os.environ.get("RESULT_CACHE_DIR", "/tmp/execal-result-cache")
+            tiers.append(DiskCache(directory, max_bytes=max_mb * 1024 * 1024))
+        _cache = TieredCache(*tiers)
+    return _cache
@@ -1,10 +1,33 @@
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 import jwt
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+# Стоимость bcrypt (BCRYPT_ROUNDS). min=max=default: хэши с другой стоимостью считаются
+# устаревшими, и при успешном логине пароль прозрачно перехэшируется (verify_and_update).
+_bcrypt_rounds = _env_int("BCRYPT_ROUNDS", 12)
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=_bcrypt_rounds,
+    bcrypt__min_rounds=_bcrypt_rounds,
+    bcrypt__max_rounds=_bcrypt_rounds,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь на bcrypt переполнена (PASSWORD_HASH_QUEUE_LIMIT)."""
 
 
 def hash_password(password: str) -> str:
@@ -15,6 +38,50 @@ def verify_password(password: str, password_hash: str) -> bool:
     return pwd_context.verify(password, password_hash)
 
 
+# bcrypt намеренно медленный (десятки-сотни мс): в event loop он замораживает все запросы воркера.
+# Выполняем его в отдельном ограниченном пуле (bcrypt отпускает GIL), а глубину очереди ограничиваем,
+# чтобы шторм логинов (например, рестарт бота) не копил бесконечный хвост.
+_hash_executor: ThreadPoolExecutor | None = None
+_hash_inflight = 0
+
+
+def _get_hash_executor() -> ThreadPoolExecutor:
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(
+            max_workers=max(1, _env_int("PASSWORD_HASH_THREADS", 2)), thread_name_prefix="bcrypt"
+        )
+    return _hash_executor
+
+
+def shutdown() -> None:
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+
+async def _run_hash(fn, *args):
+    global _hash_inflight
+    if _hash_inflight >= max(1, _env_int("PASSWORD_HASH_QUEUE_LIMIT", 64)):
+        raise PasswordHasherBusy()
+    _hash_inflight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_hash_executor(), fn, *args)
+    finally:
+        _hash_inflight -= 1
+
+
+async def ahash_password(password: str) -> str:
+    return await _run_hash(hash_password, password)
+
+
+async def averify_and_update(password: str, password_hash: str) -> tuple[bool, str | None]:
+    """(пароль верный, новый хэш или None) — новый хэш, если сменилась стоимость bcrypt."""
+    return await _run_hash(pwd_context.verify_and_update, password, password_hash)
+
+
 def _jwt_secret() -> str:
     return os.environ.get("JWT_SECRET", "CHANGE_ME_SECRET")
 
@@ -30,10 +97,13 @@ def _jwt_exp_minutes() -> int:
         return 60
 
 
-def create_access_token(subject: str) -> str:
+def create_access_token(subject: str, user_id: int | None = None) -> str:
     now = datetime.now(timezone.utc)
     exp = now + timedelta(minutes=_jwt_exp_minutes())
     payload = {"sub": subject, "iat": int(now.timestamp()), "exp": exp}
+    if user_id is not None:
+        # uid в claims: get_current_user находит пользователя по PK/кэшу, а не по email
+        payload["uid"] = user_id
     return jwt.encode(payload, _jwt_secret(), algorithm=_jwt_algorithm())
 
 
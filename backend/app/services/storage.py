@@ -1,16 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
 import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from io import BytesIO
+from typing import AsyncIterator, BinaryIO, Iterator
 
+import urllib3
 from minio import Minio
 from minio.error import S3Error
 
+# Минимальный размер части multipart-загрузки в S3/MinIO
+_MIN_PART_SIZE = 5 * 1024 * 1024
+# Кусок потокового чтения объекта во временный файл
+_SPOOL_CHUNK = 1024 * 1024
+
+_io_executor: ThreadPoolExecutor | None = None
+_client: Minio | None = None
+_client_pid: int | None = None
+_bucket_ready: set[str] = set()
+_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    object_name: str
+    size: int
+    sha256: str
+
 
 def _minio_client() -> Minio:
-    endpoint = os.environ.get("MINIO_ENDPOINT", "minio:9000")
-    access_key = os.environ.get("MINIO_ACCESS_KEY", "minio")
-    secret_key = os.environ.get("MINIO_SECRET_KEY", "minio12345")
-    secure = os.environ.get("MINIO_SECURE", "false").lower() == "true"
-    return Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure)
+    """
+    Один клиент на процесс с общим пулом соединений urllib3 (MINIO_POOL_SIZE).
+    Клиент привязан к pid: воркеры пула OCR (fork) не должны делить сокеты с родителем.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            endpoint = os.environ.get("MINIO_ENDPOINT", "minio:9000")
+            access_key = os.environ.get("MINIO_ACCESS_KEY", "minio")
+            secret_key = os.environ.get("MINIO_SECRET_KEY", "minio12345")
+            secure = os.environ.get("MINIO_SECURE", "false").lower() == "true"
+            pool_size = _env_int("MINIO_POOL_SIZE", 10)
+            http_client = urllib3.PoolManager(
+                maxsize=pool_size,
+                timeout=urllib3.Timeout(connect=10, read=300),
+                retries=urllib3.Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+            )
+            _client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure, http_client=http_client)
+            _client_pid = pid
+            _bucket_ready.clear()
+    return _client
 
 
 def _bucket() -> str:
@@ -18,24 +74,69 @@ def _bucket() -> str:
 
 
 def ensure_bucket() -> None:
-    client = _minio_client()
+    # bucket_exists — лишний round trip, поэтому проверяем один раз на процесс
     bucket = _bucket()
+    if bucket in _bucket_ready:
+        return
+    client = _minio_client()
     if not client.bucket_exists(bucket):
-        client.make_bucket(bucket)
+        try:
+            client.make_bucket(bucket)
+        except S3Error as e:
+            # бакет мог создать параллельный воркер
+            if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                raise
+    _bucket_ready.add(bucket)
 
 
-def put_object(object_name: str, content: bytes, content_type: str | None = None) -> str:
+class _HashingReader:
+    """Обёртка над file-like: считает sha256 и размер по мере чтения."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        self._raw = raw
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def read(self, n: int = -1) -> bytes:
+        chunk = self._raw.read(n)
+        if chunk:
+            self._hash.update(chunk)
+            self.size += len(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def put_stream(
+    object_name: str,
+    data: BinaryIO,
+    length: int | None = None,
+    content_type: str | None = None,
+) -> StoredObject:
+    """
+    Потоковая загрузка из file-like объекта (например, UploadFile.file) кусками,
+    без чтения всего файла в память. Заодно считаем sha256 содержимого.
+    """
     ensure_bucket()
     client = _minio_client()
-    bucket = _bucket()
-    bio = BytesIO(content)
+    reader = _HashingReader(data)
+    # Файлы больше part_size уходят multipart-загрузкой, части грузятся параллельно
+    # (STORAGE_PART_SIZE_MB, STORAGE_PARALLEL_UPLOADS).
     client.put_object(
-        bucket_name=bucket,
+        bucket_name=_bucket(),
         object_name=object_name,
-        data=bio,
-        length=len(content),
+        data=reader,
+        length=length if length is not None else -1,
         content_type=content_type or "application/octet-stream",
+        part_size=max(_MIN_PART_SIZE, _env_int("STORAGE_PART_SIZE_MB", 8) * 1024 * 1024),
+        num_parallel_uploads=max(1, _env_int("STORAGE_PARALLEL_UPLOADS", 3)),
     )
+    return StoredObject(object_name=object_name, size=reader.size, sha256=reader.hexdigest())
+
+
+def put_object(object_name: str, content: bytes, content_type: str | None = None) -> str:
+    put_stream(object_name, BytesIO(content), length=len(content), content_type=content_type)
     return object_name
 
 
@@ -56,3 +157,134 @@ def get_object_bytes(object_name: str) -> bytes:
             except Exception:
                 pass
 
+
+@contextmanager
+def spooled_object(object_name: str) -> Iterator[str]:
+    """
+    Объект во временный файл (потоково, кусками по _SPOOL_CHUNK) — путь к файлу.
+    Для разбора документа в воркере: PyMuPDF/PIL читают файл сами по мере надобности,
+    в памяти процесса не держится весь документ. Файл удаляется при выходе.
+    Каталог — SPOOL_DIR (по умолчанию системный tmp).
+    """
+    client = _minio_client()
+    fd, path = tempfile.mkstemp(prefix="doc-", dir=os.environ.get("SPOOL_DIR") or None)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            resp = None
+            try:
+                resp = client.get_object(_bucket(), object_name)
+                for chunk in resp.stream(_SPOOL_CHUNK):
+                    f.write(chunk)
+            except S3Error as e:
+                raise FileNotFoundError(object_name) from e
+            finally:
+                if resp is not None:
+                    try:
+                        resp.close()  # type: ignore[misc]
+                        resp.release_conn()  # type: ignore[misc]
+                    except Exception:
+                        pass
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+# --- async-фасад ---
+# MinIO SDK синхронный: вызов из async-обработчика блокирует event loop на всё время
+# сетевой записи. Все операции с объектами уводим в ограниченный пул потоков.
+
+
+def _get_io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    if _io_executor is None:
+        with _lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(
+                    max_workers=max(1, _env_int("STORAGE_IO_THREADS", 8)), thread_name_prefix="storage-io"
+                )
+    return _io_executor
+
+
+def shutdown() -> None:
+    global _io_executor
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=True)
+        _io_executor = None
+
+
+async def _run_io(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_io_executor(), fn, *args)
+
+
+class _AsyncIterReader:
+    """
+    file-like поверх async-итератора байтов. read() вызывается из потока пула storage
+    и забирает следующие куски из event loop через run_coroutine_threadsafe.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop) -> None:
+        self._it = chunks.__aiter__()
+        self._loop = loop
+        self._buf = bytearray()
+        self._eof = False
+
+    def _next_chunk(self) -> bytes | None:
+        async def _anext():
+            try:
+                return await self._it.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        return asyncio.run_coroutine_threadsafe(_anext(), self._loop).result()
+
+    def read(self, n: int = -1) -> bytes:
+        while not self._eof and (n < 0 or len(self._buf) < n):
+            chunk = self._next_chunk()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buf += chunk
+        if n < 0:
+            n = len(self._buf)
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+
+async def aput_stream(
+    object_name: str,
+    data: BinaryIO | AsyncIterator[bytes],
+    length: int | None = None,
+    content_type: str | None = None,
+) -> StoredObject:
+    """Async-версия put_stream: принимает file-like или async-итератор кусков."""
+    if hasattr(data, "__aiter__"):
+        data = _AsyncIterReader(data, asyncio.get_running_loop())  # type: ignore[arg-type]
+    return await _run_io(put_stream, object_name, data, length, content_type)
+
+
+async def aput_object(object_name: str, content: bytes, content_type: str | None = None) -> str:
+    return await _run_io(put_object, object_name, content, content_type)
+
+
+async def aget_object_bytes(object_name: str) -> bytes:
+    return await _run_io(get_object_bytes, object_name)
+
+
+def ocr_text_object_name(analysis_id: int) -> str:
+    return f"ocr/{analysis_id}.txt.gz"
+
+
+async def aput_ocr_text(analysis_id: int, text: str) -> None:
+    """Полный OCR-текст анализа, gzip (OCR-текст сжимается в разы)."""
+    data = await asyncio.to_thread(gzip.compress, text.encode("utf-8"))
+    await aput_object(ocr_text_object_name(analysis_id), data, content_type="application/gzip")
+
+
+async def aget_ocr_text(analysis_id: int) -> str:
+    data = await aget_object_bytes(ocr_text_object_name(analysis_id))
+    return (await asyncio.to_thread(gzip.decompress, data)).decode("utf-8")
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import event
+
+from ..models import User
+from .result_cache import MemoryLRUCache
+
+
+@dataclass(frozen=True)
+class AuthUser:
+    """
+    Аутентифицированный пользователь для обработчиков: только нужные поля, без ORM-сессии.
+    Большинству эндпоинтов достаточно id.
+    """
+
+    id: int
+    email: str
+    age: int | None = None
+    gender: str | None = None
+    language: str = "ru"
+
+    @classmethod
+    def from_orm_user(cls, user: User) -> AuthUser:
+        return cls(id=user.id, email=user.email, age=user.age, gender=user.gender, language=user.language or "ru")
+
+
+def _ttl_seconds() -> float:
+    """
+    USER_CACHE_TTL_SECONDS (по умолчанию 30). Инвалидация по событиям ORM (_invalidate_on_change)
+    работает только в процессе, который изменил пользователя: остальные воркеры uvicorn отдают
+    закэшированного AuthUser (удалённого пользователя, старый email) до истечения TTL.
+    Поэтому TTL короткий; 0 — без кэша.
+    """
+    try:
+        return float(os.environ.get("USER_CACHE_TTL_SECONDS", "30"))
+    except ValueError:
+        return 30.0
+
+
+_cache = MemoryLRUCache(max_entries=int(os.environ.get("USER_CACHE_SIZE", "10000")))
+
+
+def get_cached_user(user_id: int) -> AuthUser | None:
+    entry = _cache.get(str(user_id))
+    if entry is None or entry["expires"] < time.monotonic():
+        return None
+    return entry["user"]
+
+
+def cache_user(user: AuthUser) -> None:
+    if _ttl_seconds() <= 0:
+        return
+    _cache.set(str(user.id), {"user": user, "expires": time.monotonic() + _ttl_seconds()})
+
+
+def invalidate_user(user_id: int) -> None:
+    _cache.delete(str(user_id))
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(_mapper, _connection, target: User) -> None:
+    if target.id is not None:
+        invalidate_user(target.id)
@@ -0,0 +1,117 @@
+"""
+Микробенчмарк структурного парсера PDF (extract_tests_from_pdf): группировка спанов в строки,
+склейка ячеек, поиск колонок. Извлечение спанов из PDF (PyMuPDF) в замер не входит —
+страницы PdfDocument загружаются заранее.
+
+    cd backend && python -m benchmarks.bench_pdf_parser [каталог с *.pdf] [--repeat N]
+
+Без каталога генерируются синтетические "цифровые" бланки (нужен шрифт DejaVuSans с кириллицей).
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+from app.services.analytes import ANALYTES
+from app.services.ocr import extract_tests_from_pdf
+from app.services.pdf_document import PdfDocument
+
+_FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+)
+
+
+def _font() -> str:
+    for path in _FONT_CANDIDATES:
+        if Path(path).exists():
+            return path
+    raise SystemExit("DejaVuSans.ttf not found (apt install fonts-dejavu-core)")
+
+
+def synthetic_pdf(pages: int, rows_per_page: int, header: bool = True, seed: int = 0) -> bytes:
+    """
+    Бланк-таблица: имя (часто из нескольких спанов) / значение / единицы / референс.
+    Небольшой разброс y внутри строки — как у реальных PDF со смешанными шрифтами.
+    """
+    rnd = random.Random(seed)
+    font = _font()
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page(width=595, height=60 + rows_per_page * 14 + 80)
+        page.insert_font(fontname="dv", fontfile=font)
+
+        def put(x: float, y: float, s: str, size: float = 9) -> None:
+            page.insert_text((x, y), s, fontname="dv", fontsize=size)
+
+        put(40, 30, f"Пациент: Иванов И.И.   Дата: 12.03.2024   Страница {p + 1}")
+        y = 60.0
+        if header:
+            for x, s in ((40, "Исследование"), (250, "Значение"), (330, "Ед. изм."), (420, "Нормальные значения")):
+                put(x, y, s)
+            y += 16
+        for r in range(rows_per_page):
+            a = ANALYTES[(p * rows_per_page + r) % len(ANALYTES)]
+            jitter = rnd.uniform(-0.6, 0.6)
+            x = 40.0
+            for word in (a.synonyms[0] if a.synonyms else a.name).split():
+                put(x, y + jitter, word.capitalize())
+                x += 5.5 * len(word) + 9  # отдельные спаны с зазором > 6 — разные ячейки
+            lo = a.ref_min if a.ref_min is not None else 1
+            hi = a.ref_max if a.ref_max is not None else lo + 10
+            put(250, y + rnd.uniform(-0.6, 0.6), f"{rnd.uniform(lo, hi * 1.2):.1f}")
+            put(330, y, a.units or "ед")
+            put(420, y + rnd.uniform(-0.6, 0.6), f"{lo} - {hi}")
+            y += 14
+        put(40, y + 20, "Исполнитель: Сидорова   ГОСТ ISO 15189")
+    out = doc.tobytes()
+    doc.close()
+    return out
+
+
+def builtin_corpus() -> dict[str, bytes]:
+    return {
+        "table_1p": synthetic_pdf(1, 30),
+        "noheader_1p": synthetic_pdf(1, 30, header=False, seed=1),
+        "table_4p_x150": synthetic_pdf(4, 150, seed=2),
+        "noheader_4p_x150": synthetic_pdf(4, 150, header=False, seed=3),
+    }
+
+
+def _load_corpus(directory: str | None) -> dict[str, bytes]:
+    if not directory:
+        return builtin_corpus()
+    files = sorted(Path(directory).glob("*.pdf"))
+    if not files:
+        raise SystemExit(f"no *.pdf files in {directory}")
+    return {f.name: f.read_bytes() for f in files}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("corpus", nargs="?", help="каталог с *.pdf")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'document':<22}{'spans':>8}{'tests':>7}{'parse, ms':>12}")
+    for name, data in _load_corpus(args.corpus).items():
+        with PdfDocument(data, max_pages=4) as pdf:
+            n_spans = sum(len(pdf.page_spans(i)) for i in range(pdf.page_count))
+            tests, _preview = extract_tests_from_pdf(pdf)
+            runs = []
+            for _ in range(5):
+                t0 = time.perf_counter()
+                for _ in range(args.repeat):
+                    extract_tests_from_pdf(pdf)
+                runs.append((time.perf_counter() - t0) / args.repeat * 1e3)
+        print(f"{name:<22}{n_spans:>8}{len(tests):>7}{statistics.median(runs):>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
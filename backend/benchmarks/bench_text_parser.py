@@ -0,0 +1,143 @@
+"""
+Микробенчмарк парсера OCR-текста (extract_tests_from_text) — горячий путь ocr_image:
+парсер вызывается для оценки каждого варианта OCR (до 12 раз на изображение).
+
+    cd backend && python -m benchmarks.bench_text_parser [каталог с *.txt] [--repeat N]
+
+Без каталога используется встроенный корпус типичных раскладок OCR-выдачи лабораторных бланков.
+Для реальных замеров сохраните тексты OCR (GET /report/{id}/ocr-text) в каталог *.txt.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from app.services.ocr import _score_text, extract_tests_from_text
+
+# "Вертикальная" раскладка (сканы PDF): имя / значение / единицы / референс отдельными строками
+_VERTICAL = """ИНВИТРО
+Пациент: Иванов И.И. Пол: муж Возраст: 42
+Номер заказа: 123456789 Дата: 12.03.2024
+Исследование
+Результат
+Единицы
+Референсные
+значения
+Комментарий
+Глюкоза
+5,8
+ммоль/л
+3,9 - 6,1
+Холестерин общий
+6,2
+ммоль/л
+< 5,2
+Холестерин ЛПВП
+1,1
+ммоль/л
+> 1,0
+Триглицериды
+1,9
+ммоль/л
+< 1,7
+АЛТ
+42
+Ед/л
+< 41
+Технология: фотометрия. Оборудование: Architect c8000
+АСТ
+35
+Ед/л
+< 40
+Билирубин общий
+14,2
+мкмоль/л
+3,4 - 20,5
+Креатинин
+88
+мкмоль/л
+62 - 106
+HBsAg
+отрицат.
+ВНИМАНИЕ! Результаты исследований не являются диагнозом.
+"""
+
+# Строчная раскладка: "имя значение единицы референс" в одной строке
+_ROWS = """Лаборатория "Здоровье" www.lab.example
+Перейти на исходный документ результатов лабораторного тестирования
+Показатель Результат Ед. изм. Нормальные значения
+Гемоглобин 138 г/л 130-160
+Эритроциты 4,6 10^12/л 4,0-5,0
+Лейкоциты 7,2 10^9/л 4,0-9,0
+Тромбоциты 250 10^9/л 150-400
+СОЭ 8 мм/ч 2-15
+Гематокрит 41,5 % 39-49
+MCV 88 fL 80-100
+MCH 30 pg 27-34
+Glucose 6.1 mmol/L 3.9-5.5
+ALT 42 U/L (0-40)
+AST 35 U/L (0-40)
+Cholesterol 4.2 ммоль/л 0-5.2
+TSH 2.1 mIU/L 0.4-4.0
+Ферритин 45 нг/мл 20-250
+Подпись врача: ____________
+"""
+
+# Шумная выдача без таблицы (неудачный вариант предобработки)
+_NOISY = """ИНЗ 12345 6789 Дата 12.03.2024 10:15
+Пациент: Петрова А.А. Пол: жен Возраст: 35 Адрес: г. Москва, ул. Ленина, д. 1
+rn,u ,, 1l . .. ; Глюкоза: 5.4 ll'' ,, Хопестерин 4,9
+,,,, ,, ;; .. 1 2 3 Исполнитель: Сидорова
+"""
+
+BUILTIN_CORPUS = {
+    "vertical": _VERTICAL,
+    "rows": _ROWS,
+    "noisy": _NOISY,
+    "long": "\n".join([_ROWS] * 6 + [_VERTICAL] * 2),
+}
+
+
+def _load_corpus(directory: str | None) -> dict[str, str]:
+    if not directory:
+        return BUILTIN_CORPUS
+    files = sorted(Path(directory).glob("*.txt"))
+    if not files:
+        raise SystemExit(f"no *.txt files in {directory}")
+    return {f.name: f.read_text(encoding="utf-8") for f in files}
+
+
+def _bench(fn, text: str, repeat: int) -> float:
+    """Медиана времени одного вызова, мкс."""
+    runs = []
+    for _ in range(5):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            fn(text)
+        runs.append((time.perf_counter() - t0) / repeat * 1e6)
+    return statistics.median(runs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("corpus", nargs="?", help="каталог с *.txt (OCR-выдача)")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = _load_corpus(args.corpus)
+    print(f"{'document':<24}{'chars':>8}{'tests':>7}{'parse, us':>12}{'score, us':>12}")
+    total = 0.0
+    for name, text in corpus.items():
+        n_tests = len(extract_tests_from_text(text))
+        parse_us = _bench(extract_tests_from_text, text, args.repeat)
+        score_us = _bench(_score_text, text, args.repeat)
+        total += parse_us
+        print(f"{name:<24}{len(text):>8}{n_tests:>7}{parse_us:>12.1f}{score_us:>12.1f}")
+    print(f"{'total':<24}{'':>8}{'':>7}{total:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
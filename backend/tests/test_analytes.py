@@ -0,0 +1,30 @@
+from app.services.analytes import ANALYTES, find_analytes, match_analyte
+
+
+def test_find_analytes_leftmost_longest_whole_words():
+    text = "Холестерин ЛПВП 1.2; Холестерина нет; ALT 42, АЛТ-тест"
+    assert [(text[m.start : m.end], m.analyte.key) for m in find_analytes(text)] == [
+        ("Холестерин ЛПВП", "hdl"),
+        ("ALT", "alt"),
+        ("АЛТ", "alt"),
+    ]
+
+
+def test_match_analyte_separators_and_case():
+    assert match_analyte("25-OH  витамин D").key == "vitamin_d"
+    assert match_analyte("гликированный гемоглобин (HbA1c)").key == "hba1c"
+    assert match_analyte("Нейтрофилы") is None
+
+
+def test_dictionary_keys_unique():
+    keys = [a.key for a in ANALYTES]
+    assert len(keys) == len(set(keys))
+
+
+def test_match_analyte_whole_name_only():
+    assert match_analyte("Глюкоза в сыворотке крови").key == "glucose"
+    assert match_analyte("Аланинаминотрансфераза (АЛТ)").key == "alt"
+    # уточнение меняет аналит — словарного ключа нет
+    for name in ("Билирубин непрямой", "Холестерин ЛПОНП", "Глюкоза в моче", "Лейкоциты в моче", "Эритроциты в моче"):
+        assert match_analyte(name) is None, name
+    assert match_analyte("Гемоглобин / Гематокрит") is None
@@ -12,3 +12,260 @@ async def test_root():
     assert r.status_code == 200
     assert r.json()["status"] == "ok"
 
+
+@pytest.mark.asyncio
+async def test_metrics(monkeypatch):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        # без METRICS_TOKEN эндпоинт выключен; с ним — только с верным bearer-токеном
+        monkeypatch.delenv("METRICS_TOKEN", raising=False)
+        assert (await ac.get("/metrics")).status_code == 404
+        monkeypatch.setenv("METRICS_TOKEN", "s3cret")
+        assert (await ac.get("/metrics")).status_code == 401
+        assert (await ac.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 401
+        r = await ac.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert r.status_code == 200
+    pool = r.json()["db_pool"]
+    assert pool["checkouts"] >= 0
+    assert "utilisation" in pool
+
+
+@pytest.mark.asyncio
+async def test_upload_size_limit(monkeypatch):
+    monkeypatch.setenv("MAX_UPLOAD_MB", "0.01")
+    body = (
+        b'--x\r\nContent-Disposition: form-data; name="file"; filename="scan.pdf"\r\n'
+        b"Content-Type: application/pdf\r\n\r\n" + b"x" * (200 * 1024)
+    )
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        # по Content-Length — до чтения тела и до аутентификации
+        r = await ac.post("/upload/document", content=body, headers={"content-type": "multipart/form-data; boundary=x"})
+        assert r.status_code == 413
+
+        async def chunks():
+            for i in range(0, len(body), 16 * 1024):
+                yield body[i : i + 16 * 1024]
+
+        # без Content-Length (chunked) — по мере приёма
+        r = await ac.post("/upload/document", content=chunks(), headers={"content-type": "multipart/form-data; boundary=x"})
+        assert r.status_code == 413
+        assert "max 0.01 MB" in r.json()["detail"]
+
+
+def test_batch_zip_documents():
+    import io
+    import zipfile
+
+    from fastapi import HTTPException
+
+    from app.api.uploads import _zip_documents
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("scans/", b"")
+        zf.writestr("scans/blood.pdf", b"%PDF-1.4")
+        zf.writestr("scans/urine.JPG", b"\xff\xd8")
+        zf.writestr("__MACOSX/scans/._blood.pdf", b"")
+        zf.writestr("scans/.DS_Store", b"")
+        zf.writestr("readme.txt", b"hi")
+    with zipfile.ZipFile(buf) as zf:
+        docs = _zip_documents(zf, limit=1024, budget=1024)
+        assert [(i.filename, ct) for i, ct in docs] == [
+            ("scans/blood.pdf", "application/pdf"),
+            ("scans/urine.JPG", "image/jpeg"),
+        ]
+        with pytest.raises(HTTPException) as e:
+            _zip_documents(zf, limit=4, budget=1024)
+        assert e.value.status_code == 413
+        # сумма объявленных размеров больше бюджета распаковки пакета
+        with pytest.raises(HTTPException) as e:
+            _zip_documents(zf, limit=1024, budget=9)
+        assert e.value.status_code == 413
+
+
+def test_batch_zip_rejects_bomb_members():
+    import io
+    import zipfile
+
+    from fastapi import HTTPException
+
+    from app.api.uploads import _zip_documents
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # 8 МБ нулей сжимаются в ~8 КБ: отказ по заголовку, до распаковки
+        zf.writestr("bomb.pdf", b"%PDF-1.4" + b"\0" * (8 * 1024 * 1024))
+    assert len(buf.getvalue()) < 64 * 1024
+    with zipfile.ZipFile(buf) as zf:
+        with pytest.raises(HTTPException) as e:
+            _zip_documents(zf, limit=25 * 1024 * 1024, budget=400 * 1024 * 1024)
+    assert e.value.status_code == 413
+    assert "compression ratio" in e.value.detail
+
+
+@pytest.mark.asyncio
+async def test_analysis_event_stream(monkeypatch):
+    import asyncio
+
+    from app.api import analysis
+    from app.services import events
+
+    states = iter([("processing", None)])
+
+    async def fake_db_state(analysis_id, user_id):
+        return next(states)
+
+    monkeypatch.setattr(analysis, "_db_state", fake_db_state)
+    stream = analysis._event_stream(5, user_id=1)
+    assert await stream.__anext__() == b'event: status\ndata: {"status": "processing"}\n\n'
+
+    nxt = asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0)
+    events.publish(5, events.EVENT_PROGRESS, {"pages_done": 1, "pages_total": 2})
+    events.publish(5, events.EVENT_STATUS, {"status": "processed"})
+    events.publish(5, events.EVENT_REPORT, '{"analysis_id":5}')
+    assert b"pages_done" in await nxt
+    assert b"processed" in await stream.__anext__()
+    assert await stream.__anext__() == b'event: report\ndata: {"analysis_id":5}\n\n'
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+    assert 5 not in events._subscribers
+
+
+@pytest.mark.asyncio
+async def test_analysis_events_releases_session(monkeypatch):
+    from app.api import analysis
+
+    class FakeSession:
+        closed = False
+
+        async def scalar(self, _q):
+            return 5
+
+        async def close(self):
+            self.closed = True
+
+    session = FakeSession()
+    resp = await analysis.analysis_events(5, current_user=type("U", (), {"id": 1})(), session=session)
+    assert session.closed
+    assert resp.media_type == "text/event-stream"
+
+
+class _ReportSession:
+    """Сессия-заглушка для load_report: SELECT status, report_json -> заданная строка."""
+
+    def __init__(self, row):
+        self.row = row
+        self.queries = 0
+
+    async def execute(self, _stmt):
+        self.queries += 1
+        row = self.row
+
+        class _Result:
+            def first(self):
+                return row
+
+        return _Result()
+
+
+@pytest.mark.asyncio
+async def test_report_etag_cache_and_invalidation():
+    from app.api import reports
+    from app.services.report_generator import invalidate_report
+
+    user = type("U", (), {"id": 1})()
+    invalidate_report(77)
+    session = _ReportSession(("processed", '{"analysis_id":77,"v":1}'))
+
+    r = await reports.get_report(77, include=None, if_none_match=None, current_user=user, session=session)
+    assert r.status_code == 200 and r.body == b'{"analysis_id":77,"v":1}'
+    etag = r.headers["ETag"]
+
+    # повтор с If-None-Match: 304 из кэша, без запроса в БД
+    r = await reports.get_report(77, include=None, if_none_match=f'W/{etag}, "other"', current_user=user, session=session)
+    assert r.status_code == 304 and r.headers["ETag"] == etag
+    assert session.queries == 1
+
+    # чужой пользователь не получает отчёт из кэша
+    with pytest.raises(reports.HTTPException) as e:
+        await reports.get_report(77, include=None, if_none_match=None, current_user=type("U", (), {"id": 2})(), session=_ReportSession(None))
+    assert e.value.status_code == 404
+
+    # повторная обработка сбрасывает кэш: новый отчёт и новый ETag
+    invalidate_report(77)
+    session.row = ("processed", '{"analysis_id":77,"v":2}')
+    r = await reports.get_report(77, include=None, if_none_match=etag, current_user=user, session=session)
+    assert r.status_code == 200 and r.body.endswith(b'"v":2}') and r.headers["ETag"] != etag
+    invalidate_report(77)
+
+
+def test_parse_range():
+    from app.api.reports import HTTPException, _parse_range
+
+    assert _parse_range(None, 100) is None
+    assert _parse_range("bytes=0-9", 100) == (0, 9)
+    assert _parse_range("bytes=90-", 100) == (90, 99)  # открытый
+    assert _parse_range("bytes=-10", 100) == (90, 99)  # суффикс
+    assert _parse_range("bytes=-500", 100) == (0, 99)
+    assert _parse_range("bytes=50-1000", 100) == (50, 99)
+    # несколько диапазонов/мусор — весь файл
+    assert _parse_range("bytes=0-1,5-6", 100) is None
+    assert _parse_range("bytes=a-b", 100) is None
+    with pytest.raises(HTTPException) as e:
+        _parse_range("bytes=100-", 100)
+    assert e.value.status_code == 416
+    assert e.value.headers["Content-Range"] == "bytes */100"
+
+
+@pytest.mark.asyncio
+async def test_report_pdf_ranges_and_cached_object(monkeypatch):
+    from app.api import reports
+    from app.services.report_generator import invalidate_report
+
+    pdf = bytes(range(256)) * 4
+    stored: dict[str, bytes] = {}
+    rendered = []
+
+    async def fake_get(name):
+        if name not in stored:
+            raise FileNotFoundError(name)
+        return stored[name]
+
+    async def fake_put(name, content, content_type=None):
+        stored[name] = content
+
+    def fake_render(payload):
+        rendered.append(payload)
+        return pdf
+
+    monkeypatch.setattr(reports, "aget_object_bytes", fake_get)
+    monkeypatch.setattr(reports, "aput_object", fake_put)
+    monkeypatch.setattr(reports, "build_report_pdf_from_payload", fake_render)
+    invalidate_report(78)
+    user = type("U", (), {"id": 1})()
+    session = _ReportSession(("processed", '{"analysis_id":78}'))
+
+    async def get(rng=None, inm=None):
+        return await reports.get_report_pdf(78, if_none_match=inm, range_header=rng, current_user=user, session=session)
+
+    r = await get()
+    assert r.status_code == 200 and r.body == pdf and r.headers["Accept-Ranges"] == "bytes"
+    assert len(rendered) == 1 and reports._pdf_object_name(78) in stored
+
+    # дальше — из сохранённого объекта, без повторного рендера
+    r = await get("bytes=10-19")
+    assert r.status_code == 206 and r.body == pdf[10:20]
+    assert r.headers["Content-Range"] == f"bytes 10-19/{len(pdf)}"
+    r = await get("bytes=-4")
+    assert r.status_code == 206 and r.body == pdf[-4:]
+    assert len(rendered) == 1
+
+    with pytest.raises(reports.HTTPException) as e:
+        await get(f"bytes={len(pdf)}-")
+    assert e.value.status_code == 416
+
+    r = await get(inm=r.headers["ETag"])
+    assert r.status_code == 304
+    invalidate_report(78)
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services import security, user_cache
+from app.services.security import create_access_token, decode_token
+from app.services.user_cache import AuthUser, cache_user, get_cached_user, invalidate_user
+
+
+def test_token_carries_user_id():
+    payload = decode_token(create_access_token(subject="a@example.com", user_id=42))
+    assert payload["sub"] == "a@example.com"
+    assert payload["uid"] == 42
+
+
+def test_user_cache_ttl_and_invalidation(monkeypatch):
+    user = AuthUser(id=7, email="u@example.com")
+    cache_user(user)
+    assert get_cached_user(7) == user
+    invalidate_user(7)
+    assert get_cached_user(7) is None
+
+    monkeypatch.setenv("USER_CACHE_TTL_SECONDS", "10")
+    cache_user(user)
+    now = time.monotonic()
+    monkeypatch.setattr(user_cache.time, "monotonic", lambda: now + 11)
+    assert get_cached_user(7) is None
+
+    # TTL 0 — кэш выключен (несколько воркеров без задержки инвалидации)
+    monkeypatch.setenv("USER_CACHE_TTL_SECONDS", "0")
+    cache_user(user)
+    assert get_cached_user(7) is None
+
+
+@pytest.mark.asyncio
+async def test_password_hash_queue_limit(monkeypatch):
+    monkeypatch.setenv("PASSWORD_HASH_QUEUE_LIMIT", "1")
+    monkeypatch.setattr(security, "hash_password", lambda p: time.sleep(0.05) or "h")
+    results = await asyncio.gather(
+        security.ahash_password("a"), security.ahash_password("b"), return_exceptions=True
+    )
+    assert results[0] == "h"
+    assert isinstance(results[1], security.PasswordHasherBusy)
+
+
+@pytest.mark.asyncio
+async def test_verify_rehashes_on_cost_change():
+    from passlib.context import CryptContext
+
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4).hash("secret1")
+    ok, new_hash = await security.averify_and_update("secret1", old_hash)
+    assert ok
+    assert new_hash is not None and new_hash != old_hash
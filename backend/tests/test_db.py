@@ -0,0 +1,26 @@
+import pytest
+from sqlalchemy import exc
+
+from app import db
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_count_checkouts_and_timeouts():
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine(
+        "sqlite+aiosqlite://", poolclass=db._TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.2
+    )
+    before = db.pool_stats.snapshot()
+    try:
+        async with engine.connect():
+            # пул из одного соединения занят: второй checkout ждёт pool_timeout и падает
+            with pytest.raises(exc.TimeoutError):
+                async with engine.connect():
+                    pass
+    finally:
+        await engine.dispose()
+    after = db.pool_stats.snapshot()
+    assert after["checkouts"] == before["checkouts"] + 1
+    assert after["timeouts"] == before["timeouts"] + 1
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.api.uploads import _decode_cursor, _encode_cursor, history  # noqa: E402
+from app.models import Analysis, Base, User  # noqa: E402
+
+T1 = datetime(2024, 3, 1, 10, 0, 0, 1)
+T2 = datetime(2024, 3, 2, 10, 0, 0, 1)
+
+
+@pytest_asyncio.fixture
+async def session():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as s:
+        s.add_all(
+            [
+                User(id=1, email="a@example.com", password_hash="x"),
+                User(id=2, email="b@example.com", password_hash="x"),
+            ]
+        )
+        # три анализа с одинаковой датой (порядок между ними — по id) + по одному до и после
+        s.add_all(
+            [
+                Analysis(id=1, user_id=1, date=T1, status="processed"),
+                Analysis(id=2, user_id=1, date=T2, status="processed"),
+                Analysis(id=3, user_id=1, date=T2, status="failed"),
+                Analysis(id=4, user_id=1, date=T2, status="processed"),
+                Analysis(id=5, user_id=1, date=datetime(2024, 3, 3, 1, 0, 0, 1), status="received"),
+                Analysis(id=6, user_id=2, date=T2, status="processed"),
+            ]
+        )
+        await s.commit()
+        yield s
+    await engine.dispose()
+
+
+async def _pages(session, limit, **filters):
+    user = type("U", (), {"id": 1})()
+    pages, cursor = [], None
+    while True:
+        params = {"status": None, "source": None, **filters}
+        page = await history(limit=limit, cursor=cursor, current_user=user, session=session, **params)
+        pages.append([a["id"] for a in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.asyncio
+async def test_history_keyset_pages_and_ties(session):
+    # граница страницы проходит внутри группы с одинаковой датой: без пропусков и повторов
+    assert await _pages(session, 2) == [[5, 4], [3, 2], [1]]
+    assert await _pages(session, 5) == [[5, 4, 3, 2, 1]]
+    assert await _pages(session, 1, status="processed") == [[4], [2], [1]]
+
+
+def test_history_cursor_roundtrip_and_malformed():
+    assert _decode_cursor(_encode_cursor(T2, 3)) == (T2, 3)
+    for bad in ("not-base64!", _encode_cursor(T2, 3)[:-4], "MjAyNA"):
+        with pytest.raises(HTTPException) as e:
+            _decode_cursor(bad)
+        assert e.value.status_code == 400
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from app.services import jobs
+
+
+@pytest.mark.asyncio
+async def test_process_analysis_marks_failed(monkeypatch):
+    statuses: list[tuple[int, str]] = []
+
+    async def fake_set_status(analysis_id, status):
+        statuses.append((analysis_id, status))
+        return True
+
+    async def crash(*_args):
+        raise ValueError("broken pdf")
+
+    async def hang(*_args):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(jobs, "_set_status", fake_set_status)
+    monkeypatch.setattr(jobs, "_analyze_cached", crash)
+    await jobs.process_analysis(1, "ref", "application/pdf", "sha")
+    assert statuses == [(1, "processing"), (1, "failed")]
+
+    # отмена (остановка процесса): анализ тоже failed, а не "processing" навсегда
+    statuses.clear()
+    monkeypatch.setattr(jobs, "_analyze_cached", hang)
+    jobs.submit_analysis(2, "ref", "application/pdf", "sha")
+    await asyncio.sleep(0)
+    await jobs.shutdown()
+    assert statuses == [(2, "processing"), (2, "failed")]
+    assert not jobs._tasks
+
+
+@pytest.mark.asyncio
+async def test_stale_sweep_skips_local_jobs_and_never_resurrects(monkeypatch):
+    pytest.importorskip("aiosqlite")
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import StaticPool
+
+    from app.models import Analysis, Base, User
+
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(jobs, "async_session", session_factory)
+    old = datetime.utcnow() - timedelta(hours=2)
+    async with session_factory() as s:
+        s.add(User(id=1, email="a@example.com", password_hash="x"))
+        s.add_all(
+            [
+                Analysis(id=1, user_id=1, date=old, status="received"),  # в очереди этого процесса
+                Analysis(id=2, user_id=1, date=old, status="processing"),  # процесс-владелец умер
+                Analysis(id=3, user_id=1, date=datetime.utcnow(), status="received"),
+            ]
+        )
+        await s.commit()
+
+    queued = asyncio.get_running_loop().create_future()
+    monkeypatch.setitem(jobs._tasks, queued, 1)
+    try:
+        assert await jobs.fail_stale_analyses() == [2]
+    finally:
+        queued.cancel()
+
+    # поздний результат OCR не переводит failed обратно в processed
+    assert await jobs._save_result(2, None, []) is None
+    assert not await jobs._set_status(2, jobs.STATUS_PROCESSING)
+    async with session_factory() as s:
+        rows = dict((await s.execute(select(Analysis.id, Analysis.status))).all())
+        heartbeat = await s.scalar(select(Analysis.heartbeat_at).where(Analysis.id == 1))
+    assert rows == {1: "received", 2: "failed", 3: "received"}
+    assert heartbeat is not None and heartbeat > old
+    await engine.dispose()
@@ -0,0 +1,28 @@
+from decimal import Decimal
+
+from app.services.normalization import canonical_test_name, compute_deviation, compute_deviations, to_decimal
+
+
+def test_compute_deviations_matches_scalar():
+    values = [to_decimal(x) for x in (3.0, 4.2, 5.6, None, 1.0)]
+    mins = [to_decimal(x) for x in (3.9, 3.9, 3.9, 3.9, None)]
+    maxs = [to_decimal(x) for x in (5.5, 5.5, 5.5, 5.5, 2.0)]
+    assert compute_deviations(values, mins, maxs) == [
+        compute_deviation(v, lo, hi) for v, lo, hi in zip(values, mins, maxs)
+    ]
+    assert to_decimal(5.6) == Decimal("5.6")
+
+
+def test_canonical_test_name():
+    assert canonical_test_name("Глюкоза") == canonical_test_name(" GLUCOSE ") == "glucose"
+    assert canonical_test_name("  Нейтрофилы  Палочкоядерные ") == "нейтрофилы палочкоядерные"
+    assert canonical_test_name(None) == ""
+
+
+def test_canonical_test_name_no_collisions():
+    keys = {
+        canonical_test_name(n)
+        for n in ("Билирубин общий", "Билирубин непрямой", "Глюкоза", "Глюкоза в моче", "Холестерин", "Холестерин ЛПОНП")
+    }
+    assert len(keys) == 6
+    assert canonical_test_name("Глюкоза в моче") == "глюкоза в моче"
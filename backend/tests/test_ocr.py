@@ -0,0 +1,340 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from app.services import ocr
+
+
+def _png() -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (200, 100), "white").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_ocr_image_early_exit(monkeypatch):
+    calls = []
+    table = "\n".join(f"Показатель {i} 5.{i} ммоль/л 3.9-5.5" for i in range(10))
+
+    def fake_image_to_string(im, lang=None, psm=None):
+        calls.append(psm)
+        return table
+
+    monkeypatch.setattr(ocr.ocr_engine, "image_to_string", fake_image_to_string)
+    monkeypatch.setenv("OCR_PARALLEL", "1")
+    monkeypatch.setenv("OCR_SCORE_THRESHOLD", "100")
+    text = ocr.ocr_image_bytes(_png())
+    assert "Показатель 1" in text
+    assert len(calls) == 1
+
+
+def test_ocr_image_max_passes(monkeypatch):
+    calls = []
+
+    def fake_image_to_string(im, lang=None, psm=None):
+        calls.append(psm)
+        return ""
+
+    monkeypatch.setattr(ocr.ocr_engine, "image_to_string", fake_image_to_string)
+    monkeypatch.setenv("OCR_PARALLEL", "2")
+    monkeypatch.setenv("OCR_MAX_PASSES", "5")
+    monkeypatch.setenv("OCR_PLATEAU_PASSES", "0")
+    assert ocr.ocr_image_bytes(_png()) == ""
+    assert len(calls) == 5
+
+
+def test_ocr_image_stops_on_score_plateau(monkeypatch):
+    # маленькая панель (2 показателя) не дотягивает до OCR_SCORE_THRESHOLD — выходим по плато
+    results = iter(["Глюкоза 5.1 ммоль/л 3.9-5.5", "Глюкоза 5.1 ммоль/л 3.9-5.5\nАЛТ 20 ед/л 0-40"] + ["шум"] * 20)
+    calls = []
+
+    def fake_image_to_string(im, lang=None, psm=None):
+        calls.append(psm)
+        return next(results)
+
+    monkeypatch.setattr(ocr.ocr_engine, "image_to_string", fake_image_to_string)
+    monkeypatch.setenv("OCR_PARALLEL", "1")
+    monkeypatch.setenv("OCR_PLATEAU_PASSES", "3")
+    text = ocr.ocr_image_bytes(_png())
+    assert "АЛТ" in text
+    assert len(calls) == 5
+
+
+def test_thread_budget_splits_cores_between_workers(monkeypatch):
+    monkeypatch.setattr(ocr.ocr_engine.os, "cpu_count", lambda: 8)
+    monkeypatch.delenv("OCR_WORKERS", raising=False)
+    assert ocr.ocr_engine.thread_budget() == 1
+    monkeypatch.setenv("OCR_WORKERS", "2")
+    assert ocr.ocr_engine.thread_budget() == 4
+
+
+def test_thread_budget_uses_idle_cores(monkeypatch):
+    import multiprocessing
+
+    monkeypatch.setattr(ocr.ocr_engine.os, "cpu_count", lambda: 8)
+    monkeypatch.delenv("OCR_WORKERS", raising=False)
+    counter = multiprocessing.Value("i", 0)
+    monkeypatch.setattr(ocr.ocr_engine, "_busy", counter)
+    with ocr.ocr_engine.busy():
+        # единственный документ в пуле получает все ядра
+        assert ocr.ocr_engine.thread_budget() == 8
+        counter.value += 3
+        assert ocr.ocr_engine.thread_budget() == 2
+        counter.value += 4
+        assert ocr.ocr_engine.thread_budget() == 1
+        counter.value -= 7
+    assert counter.value == 0
+
+
+def _pdf(pages: list[str | None]) -> bytes:
+    import fitz
+
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page(width=300, height=200)
+        if text:
+            page.insert_text((20, 40), text)
+    return doc.tobytes()
+
+
+def test_ocr_pdf_pages_in_order(monkeypatch):
+    monkeypatch.setattr(ocr, "ocr_image", lambda im, lang="rus+eng", parallel=None: f"ocr {im.mode} {im.size[0]}")
+    digital = "Digital page text layer with enough characters"
+    text = ocr.ocr_pdf_bytes(_pdf([None, digital, None]))
+    assert text.split("\n\n") == ["ocr L 600", digital, "ocr L 600"]
+
+
+def test_ocr_pdf_pages_fan_out_on_idle_pool(monkeypatch):
+    import multiprocessing
+    import threading
+    import time
+
+    monkeypatch.setattr(ocr.ocr_engine.os, "cpu_count", lambda: 8)
+    monkeypatch.delenv("OCR_WORKERS", raising=False)
+    monkeypatch.delenv("OCR_PDF_PARALLEL", raising=False)
+    monkeypatch.setattr(ocr.ocr_engine, "_busy", multiprocessing.Value("i", 0))
+    lock = threading.Lock()
+    running, peak, passes = [0], [0], []
+
+    def fake_ocr_image(im, lang="rus+eng", parallel=None):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            passes.append(parallel)
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return "ocr"
+
+    monkeypatch.setattr(ocr, "ocr_image", fake_ocr_image)
+    # одиночный 4-страничный скан в простаивающем пуле (по умолчанию OCR_WORKERS = числу CPU)
+    with ocr.ocr_engine.busy():
+        assert ocr.ocr_pdf_bytes(_pdf([None] * 4)).split("\n\n") == ["ocr"] * 4
+    assert peak[0] > 1
+    # 8 ядер: 4 страницы одновременно, по 2 прохода OCR на страницу
+    assert passes == [2] * 4
+
+
+def test_pdf_document_reads_each_page_once(monkeypatch):
+    from app.services.pdf_document import PdfDocument
+
+    digital = "Digital page text layer with enough characters"
+    with PdfDocument(_pdf([digital])) as pdf:
+        calls = []
+        orig = pdf._load
+        monkeypatch.setattr(pdf, "_load", lambda i: calls.append(i) or orig(i))
+        ocr.extract_tests_from_pdf(pdf)
+        assert ocr.ocr_pdf_bytes(pdf) == digital
+        assert pdf.page_spans(0)[0]["text"] == digital
+    assert len(pdf._pages) == 1
+
+
+def test_extract_tests_from_text_vertical_table():
+    text = "\n".join(
+        [
+            "Пациент: Иванов И.И.",
+            "Исследование",
+            "Результат",
+            "Единицы",
+            "Референсные",
+            "значения",
+            "Креатинин",
+            "88",
+            "мкмоль/л",
+            "62 – 106",
+            "HBsAg",
+            "отрицат.",
+            "ВНИМАНИЕ! Результаты исследований не являются диагнозом.",
+            "Нейтрофилы",
+            "55",
+        ]
+    )
+    assert ocr.extract_tests_from_text(text) == [
+        {"test_name": "Креатинин", "value": 88.0, "units": "мкмоль/л", "ref_min": 62.0, "ref_max": 106.0, "comment": None},
+        {"test_name": "HBsAg", "value": None, "units": None, "ref_min": None, "ref_max": None, "comment": "отрицат."},
+    ]
+
+
+def test_quick_tests_keep_document_units_and_ranges():
+    quick = ocr._quick_tests("Холестерин общий 5.9 ммоль/л 0-5.2\nГлюкоза: 6.1 ммоль/л\nАЛТ 20 мкмоль/л")
+    assert quick["cholesterol"] == {
+        "test_name": "Cholesterol", "value": 5.9, "units": "ммоль/л", "ref_min": 0.0, "ref_max": 5.2
+    }
+    # нет референса в документе, единицы совпадают со словарными -> референс словаря
+    assert (quick["glucose"]["ref_min"], quick["glucose"]["ref_max"]) == (3.9, 5.5)
+    # единицы не те, что в словаре -> без референса
+    assert quick["alt"]["units"] == "мкмоль/л" and quick["alt"]["ref_max"] is None
+
+    row = {"test_name": "Холестерин общий", "value": None, "units": "mg/dL", "ref_min": 0, "ref_max": 200}
+    merged = ocr._with_quick([row], {"cholesterol": quick["cholesterol"]})
+    assert merged == [{"test_name": "Холестерин общий", "value": 5.9, "units": "mg/dL", "ref_min": 0, "ref_max": 200}]
+
+
+def test_group_rows_keeps_pages_apart():
+    from app.services.pdf_layout import group_rows
+
+    def span(text, x0, y):
+        return {"text": text, "x0": x0, "x1": x0 + 6.0 * len(text), "y0": y - 4.0, "y1": y + 4.0}
+
+    page1 = [span("5,1", 250, 60.5), span("Глюкоза", 40, 60), span("крови", 100, 61)]
+    page2 = [span("Креатинин", 40, 60.3), span("88", 250, 60)]
+    layout = group_rows([page1, page2])
+    assert [[c["text"] for c in row] for row in layout.rows] == [["Глюкоза", "крови", "5,1"], ["Креатинин", "88"]]
+    assert layout.page.tolist() == [0, 1]
+
+
+def test_ocr_engine_reuses_api_per_lang(monkeypatch):
+    from types import SimpleNamespace
+
+    from app.services import ocr_engine
+
+    inits = []
+
+    class FakeApi:
+        def __init__(self, lang, oem, path=None):
+            if lang == "xxx":
+                raise RuntimeError("Failed to init API, possibly an invalid tessdata path")
+            inits.append(lang)
+            self.psm = None
+
+        def SetPageSegMode(self, psm):
+            self.psm = psm
+
+        def SetImage(self, im):
+            pass
+
+        def GetUTF8Text(self):
+            return f"psm {self.psm}"
+
+        def Clear(self):
+            pass
+
+    monkeypatch.setattr(ocr_engine, "tesserocr", SimpleNamespace(PyTessBaseAPI=FakeApi, OEM=SimpleNamespace(LSTM_ONLY=1)))
+    monkeypatch.setattr(ocr_engine, "_idle", {})
+    monkeypatch.setattr(ocr_engine, "_broken_langs", set())
+    monkeypatch.setattr(ocr_engine, "_cli_image_to_string", lambda im, lang, psm: "cli")
+    monkeypatch.delenv("OCR_ENGINE", raising=False)
+    im = Image.new("L", (10, 10), 255)
+
+    assert [ocr_engine.image_to_string(im, "rus+eng", psm) for psm in (6, 4, 11)] == ["psm 6", "psm 4", "psm 11"]
+    assert inits == ["rus+eng"]
+    assert ocr_engine.image_to_string(im, "xxx") == "cli"
+    assert "xxx" in ocr_engine._broken_langs
+
+
+def test_ocr_engine_bounds_instances_per_process(monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from types import SimpleNamespace
+
+    from app.services import ocr_engine
+
+    created = []
+    busy = []
+    lock = threading.Lock()
+
+    class SlowApi:
+        def __init__(self, lang, oem, path=None):
+            created.append(lang)
+
+        def SetPageSegMode(self, psm):
+            pass
+
+        def SetImage(self, im):
+            pass
+
+        def GetUTF8Text(self):
+            with lock:
+                busy.append(1)
+                peak = len(busy)
+            time.sleep(0.02)
+            with lock:
+                busy.pop()
+            return str(peak)
+
+        def Clear(self):
+            pass
+
+    monkeypatch.setattr(ocr_engine, "tesserocr", SimpleNamespace(PyTessBaseAPI=SlowApi, OEM=SimpleNamespace(LSTM_ONLY=1)))
+    monkeypatch.setattr(ocr_engine, "_idle", {})
+    monkeypatch.setattr(ocr_engine, "_slots", {})
+    monkeypatch.setattr(ocr_engine, "_idle_pid", None)
+    monkeypatch.setenv("OCR_ENGINE_INSTANCES", "2")
+    monkeypatch.delenv("OCR_ENGINE", raising=False)
+    im = Image.new("L", (10, 10), 255)
+
+    with ThreadPoolExecutor(8) as pool:
+        peaks = list(pool.map(lambda _: ocr_engine.image_to_string(im, "rus+eng"), range(16)))
+    # лишние вызовы ждут слот: не больше 2 экземпляров (и одновременных вызовов) на язык
+    assert len(created) == 2
+    assert max(map(int, peaks)) <= 2
+
+
+def test_ocr_variants_otsu_and_deskew():
+    from PIL import ImageDraw
+
+    from app.services import image_preprocess
+
+    im = Image.new("L", (1400, 900), 235)
+    draw = ImageDraw.Draw(im)
+    for i in range(20):
+        draw.rectangle((60, 40 + i * 40, 1300, 52 + i * 40), fill=40)  # "строки текста"
+
+    hist = image_preprocess.histogram(im)
+    assert 40 <= image_preprocess.otsu_threshold(hist) < 235
+    names = [v.name for v in image_preprocess.ocr_variants(im, set())]
+    # двухуровневое изображение: все пороги между уровнями дают одну и ту же картинку
+    assert names == ["gray", "otsu"]
+
+    tilted = im.rotate(-2, expand=True, fillcolor=235)
+    assert image_preprocess.estimate_skew(np.asarray(tilted), 137) == 2.0
+
+    noisy = np.full((5, 5), 200, dtype=np.uint8)
+    noisy[2, 2] = 0
+    assert (image_preprocess.median3(noisy) == 200).all()
+
+
+def test_text_layout_crops_margins_and_scales_by_line_height():
+    from PIL import ImageDraw
+
+    from app.services import image_preprocess
+
+    # "фото": тёмный стол, лист бумаги, на листе 12 строк "текста" высотой 60 px
+    im = Image.new("L", (3000, 4000), 70)
+    draw = ImageDraw.Draw(im)
+    draw.rectangle((400, 400, 2600, 3600), fill=250)
+    for i in range(12):
+        y = 800 + i * 120
+        for x in range(700, 1900, 50):
+            draw.rectangle((x, y, x + 30, y + 60), fill=20)
+
+    layout = image_preprocess.text_layout(im)
+    assert layout.line_height == 60.0
+    x0, y0, x1, y1 = layout.box
+    assert 600 <= x0 < 700 and 1880 <= x1 <= 2000
+    assert 700 <= y0 < 800 and 2180 <= y1 <= 2300
+
+    fitted = image_preprocess.fit_text(im)
+    scale = image_preprocess.TEXT_HEIGHT_PX / 60.0
+    assert fitted.size == (round((x1 - x0) * scale), round((y1 - y0) * scale))
@@ -0,0 +1,31 @@
+import pytest
+
+from app.services.pipeline import _merge_tests, analyze_document
+
+
+def test_merge_tests_prefers_richer_record():
+    primary = [{"test_name": "Глюкоза", "value": None}]
+    secondary = [{"test_name": "глюкоза ", "value": 5.1, "units": "ммоль/л"}]
+    merged = _merge_tests(primary, secondary)
+    assert len(merged) == 1
+    assert merged[0]["value"] == 5.1
+
+
+def test_merge_tests_keeps_distinct_analytes():
+    rows = [
+        {"test_name": "Глюкоза", "value": 5.1},
+        {"test_name": "Глюкоза в моче", "value": 0.1},
+        {"test_name": "Билирубин общий", "value": 12},
+        {"test_name": "Билирубин непрямой", "value": 9},
+    ]
+    assert [t["test_name"] for t in _merge_tests(rows, [])] == [t["test_name"] for t in rows]
+
+
+def test_analyze_document_unknown_type():
+    assert analyze_document(b"plain text", "text/plain") == (None, [])
+
+
+def test_analyze_document_corrupt_pdf_raises():
+    # битый документ — ошибка (jobs ставит status=failed), а не "обработан без показателей"
+    with pytest.raises(Exception):
+        analyze_document(b"not a pdf", "application/pdf")
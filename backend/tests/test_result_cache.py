@@ -0,0 +1,47 @@
+import pytest
+
+from app.services.result_cache import (
+    DiskCache,
+    MemoryLRUCache,
+    ResultCache,
+    TieredCache,
+    cache_key,
+    content_sha256,
+)
+
+
+def test_cache_key_depends_on_content_and_type():
+    a, b = content_sha256(b"a"), content_sha256(b"b")
+    assert cache_key(a, "image/png") == cache_key(a, "image/png")
+    assert cache_key(a, "image/png") != cache_key(b, "image/png")
+    assert cache_key(a, "image/png") != cache_key(a, "application/pdf")
+
+
+def test_memory_lru_eviction():
+    c = MemoryLRUCache(max_entries=2)
+    c.set("a", {"v": 1})
+    c.set("b", {"v": 2})
+    assert c.get("a") == {"v": 1}
+    c.set("c", {"v": 3})
+    assert c.get("b") is None
+    assert c.get("a") == {"v": 1}
+
+
+def test_tiered_cache_promotes_and_counts(tmp_path):
+    mem = MemoryLRUCache(4)
+    disk = DiskCache(tmp_path)
+    disk.set("k", {"ocr_text": "x", "tests": []})
+    cache = TieredCache(mem, disk)
+    assert cache.get("k") == {"ocr_text": "x", "tests": []}
+    assert mem.get("k") is not None
+    assert cache.get("missing") is None
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_incomplete_backend_cannot_be_created():
+    class GetOnly(ResultCache):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
@@ -0,0 +1,83 @@
+import hashlib
+from io import BytesIO
+
+import pytest
+
+from app.services import storage
+
+
+class FakeMinio:
+    def __init__(self):
+        self.bucket_checks = 0
+        self.objects = {}
+
+    def bucket_exists(self, bucket):
+        self.bucket_checks += 1
+        return True
+
+    def put_object(self, bucket_name, object_name, data, length, content_type, part_size=0, **kwargs):
+        chunks = []
+        while True:
+            chunk = data.read(4)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        self.objects[object_name] = b"".join(chunks)
+
+    def get_object(self, bucket, object_name):
+        data = self.objects[object_name]
+
+        class Resp:
+            def stream(self, amt):
+                for i in range(0, len(data), amt):
+                    yield data[i : i + amt]
+
+            def close(self):
+                pass
+
+            def release_conn(self):
+                pass
+
+        return Resp()
+
+
+def test_put_stream_checks_bucket_once_and_hashes(monkeypatch):
+    fake = FakeMinio()
+    monkeypatch.setattr(storage, "_minio_client", lambda: fake)
+    monkeypatch.setattr(storage, "_bucket_ready", set())
+
+    stored = storage.put_stream("1/a.pdf", BytesIO(b"hello world"), length=11)
+    storage.put_object("1/b.pdf", b"second")
+
+    assert fake.bucket_checks == 1
+    assert fake.objects["1/a.pdf"] == b"hello world"
+    assert stored.size == 11
+    assert stored.sha256 == hashlib.sha256(b"hello world").hexdigest()
+
+
+@pytest.mark.asyncio
+async def test_aput_stream_from_async_iterator(monkeypatch):
+    fake = FakeMinio()
+    monkeypatch.setattr(storage, "_minio_client", lambda: fake)
+    monkeypatch.setattr(storage, "_bucket_ready", set())
+
+    async def chunks():
+        for part in (b"ab", b"", b"cdefg", b"h"):
+            yield part
+
+    stored = await storage.aput_stream("1/c.png", chunks())
+    assert fake.objects["1/c.png"] == b"abcdefgh"
+    assert stored.size == 8
+
+
+def test_spooled_object_streams_to_temp_file(monkeypatch, tmp_path):
+    fake = FakeMinio()
+    fake.objects["1/scan.pdf"] = b"%PDF" * 1000
+    monkeypatch.setattr(storage, "_minio_client", lambda: fake)
+    monkeypatch.setattr(storage, "_SPOOL_CHUNK", 64)
+    monkeypatch.setenv("SPOOL_DIR", str(tmp_path))
+
+    with storage.spooled_object("1/scan.pdf") as path:
+        with open(path, "rb") as f:
+            assert f.read() == fake.objects["1/scan.pdf"]
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,142 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+import pytest_asyncio
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import select, update  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.api.reports import get_trends  # noqa: E402
+from app.migrate import _rekey_indicators  # noqa: E402
+from app.models import Analysis, Base, SchemaMarker, User  # noqa: E402
+from app.models import TestIndicator as Indicator  # noqa: E402  (имя Test* pytest пытается собрать)
+from app.services.normalization import TEST_KEY_VERSION, canonical_test_name  # noqa: E402
+
+USER = type("U", (), {"id": 1})()
+GLUCOSE = [5.0, 6.0, 4.0, 7.0, 5.5]
+
+
+def _day(d: int) -> datetime:
+    return datetime(2024, 1, d, 9, 0, 0, 1)
+
+
+def _ind(analysis_id: int, name: str, value: float | None) -> Indicator:
+    return Indicator(
+        analysis_id=analysis_id,
+        test_name=name,
+        test_key=canonical_test_name(name),
+        value=None if value is None else Decimal(str(value)),
+        units="mmol/L",
+    )
+
+
+@pytest_asyncio.fixture
+async def engine():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def session(engine):
+    async with AsyncSession(engine, expire_on_commit=False) as s:
+        s.add_all(
+            [
+                User(id=1, email="a@example.com", password_hash="x"),
+                User(id=2, email="b@example.com", password_hash="x"),
+            ]
+        )
+        for i, v in enumerate(GLUCOSE, start=1):
+            s.add(Analysis(id=i, user_id=1, date=_day(i), status="processed"))
+            # одно и то же под разными названиями — один ряд по test_key
+            s.add(_ind(i, "Глюкоза" if i % 2 else "Glucose", v))
+        s.add(_ind(1, "Гемоглобин", 140))
+        s.add(_ind(2, "Гемоглобин", None))
+        # не попадают в тренды: необработанный анализ и чужой анализ
+        s.add_all([Analysis(id=6, user_id=1, date=_day(6), status="failed"), _ind(6, "Глюкоза", 100)])
+        s.add_all([Analysis(id=7, user_id=2, date=_day(3), status="processed"), _ind(7, "Глюкоза", 50)])
+        await s.commit()
+        yield s
+
+
+async def _trends(session, **params):
+    params = {"tests": None, "date_from": None, "date_to": None, "max_points": 200, **params}
+    result = await get_trends(current_user=USER, session=session, **params)
+    return {s["test"]: s for s in result["series"]}
+
+
+@pytest.mark.asyncio
+async def test_trends_full_series(session):
+    series = await _trends(session)
+    assert set(series) == {"glucose", "hemoglobin"}
+    g = series["glucose"]
+    assert [p["value"] for p in g["points"]] == GLUCOSE
+    assert [p["analysis_id"] for p in g["points"]] == [1, 2, 3, 4, 5]
+    assert (g["count"], g["min"], g["max"]) == (5, 4.0, 7.0)
+    assert g["last"]["analysis_id"] == 5 and g["last"]["value"] == 5.5
+    assert series["hemoglobin"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_trends_buckets(session):
+    # 5 точек в 2 корзины: (rn - 1) * 2 // 5 -> [1, 2, 3], [4, 5]
+    g = (await _trends(session, max_points=2))["glucose"]
+    assert [(p["count"], p["min"], p["max"], p["value"], p["analysis_id"]) for p in g["points"]] == [
+        (3, 4.0, 6.0, 4.0, 3),
+        (2, 5.5, 7.0, 5.5, 5),
+    ]
+    assert (g["count"], g["min"], g["max"], g["last"]["value"]) == (5, 4.0, 7.0, 5.5)
+
+
+@pytest.mark.asyncio
+async def test_trends_window_and_tests_filter(session):
+    series = await _trends(session, tests="GLUCOSE, ", date_from=_day(2), date_to=_day(4))
+    assert list(series) == ["glucose"]
+    assert [p["analysis_id"] for p in series["glucose"]["points"]] == [2, 3, 4]
+    assert await _trends(session, date_from=_day(6)) == {}
+
+
+@pytest.mark.asyncio
+async def test_rekey_indicators_runs_once_per_version(engine):
+    async with engine.begin() as conn:
+        await conn.execute(
+            Indicator.__table__.insert(),
+            [
+                {"id": 1, "analysis_id": 1, "test_name": "Глюкоза", "test_key": None},
+                # ключ, посчитанный старыми правилами (совпадение по подстроке)
+                {"id": 2, "analysis_id": 1, "test_name": "Глюкоза в моче", "test_key": "glucose"},
+            ],
+        )
+
+    async def keys():
+        async with engine.connect() as conn:
+            return dict((await conn.execute(select(Indicator.id, Indicator.test_key))).all())
+
+    async def rekey():
+        async with engine.begin() as conn:
+            await _rekey_indicators(conn)
+
+    await rekey()
+    assert await keys() == {1: "glucose", 2: canonical_test_name("Глюкоза в моче")}
+    async with engine.connect() as conn:
+        assert await conn.scalar(select(SchemaMarker.version)) == TEST_KEY_VERSION
+
+    # та же версия — повторный запуск ничего не пересчитывает
+    async with engine.begin() as conn:
+        await conn.execute(update(Indicator).where(Indicator.id == 1).values(test_key="manual"))
+    await rekey()
+    assert (await keys())[1] == "manual"
+
+    # версия правил сменилась — пересчёт ещё раз
+    async with engine.begin() as conn:
+        await conn.execute(update(SchemaMarker).values(version=TEST_KEY_VERSION - 1))
+    await rekey()
+    assert (await keys())[1] == "glucose"
+    async with engine.connect() as conn:
+        assert await conn.scalar(select(SchemaMarker.version)) == TEST_KEY_VERSION
@@ -21,15 +21,19 @@ CREATE TABLE IF NOT EXISTS analyses (
   format VARCHAR(100) DEFAULT 'file',
   status VARCHAR(20) DEFAULT 'received',
   document_ref VARCHAR(255),
-  ocr_text TEXT
+  ocr_text TEXT,
+  report_json TEXT,
+  heartbeat_at TIMESTAMP WITHOUT TIME ZONE
 );
 
 CREATE INDEX IF NOT EXISTS ix_analyses_user_id ON analyses(user_id);
+CREATE INDEX IF NOT EXISTS ix_analyses_user_id_date_id ON analyses(user_id, date DESC, id DESC);
 
 CREATE TABLE IF NOT EXISTS test_indicators (
   id SERIAL PRIMARY KEY,
   analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
   test_name VARCHAR(255) NOT NULL,
+  test_key VARCHAR(255),
   value NUMERIC(18,6),
   units VARCHAR(50),
   ref_min NUMERIC(18,6),
@@ -39,4 +43,10 @@ CREATE TABLE IF NOT EXISTS test_indicators (
 );
 
 CREATE INDEX IF NOT EXISTS ix_test_indicators_analysis_id ON test_indicators(analysis_id);
+CREATE INDEX IF NOT EXISTS ix_test_indicators_test_key_analysis_id ON test_indicators(test_key, analysis_id);
 
+-- версии одноразовых шагов миграции данных (пересчёт test_key и т.п.)
+CREATE TABLE IF NOT EXISTS schema_markers (
+  name VARCHAR(50) PRIMARY KEY,
+  version INTEGER NOT NULL
+);
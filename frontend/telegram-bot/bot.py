@@ -1,5 +1,8 @@
+import asyncio
+import json
 import os
 from io import BytesIO
+from typing import Awaitable, Callable
 
 import httpx
 from telegram import InputFile, Update
@@ -51,7 +54,8 @@ async def _upload_to_backend(*, filename: str, content_type: str | None, content
     token = await _ensure_access_token()
     headers = {"Authorization": f"Bearer {token}"}
     files = {"file": (filename, content, content_type or "application/octet-stream")}
-    async with httpx.AsyncClient(timeout=120) as client:
+    # backend отвечает сразу после сохранения файла (OCR идёт в фоне), таймаут — только на передачу
+    async with httpx.AsyncClient(timeout=60) as client:
         r = await client.post(f"{BACKEND_BASE_URL}/upload/document", headers=headers, files=files)
         r.raise_for_status()
         data = r.json()
@@ -61,13 +65,51 @@ async def _upload_to_backend(*, filename: str, content_type: str | None, content
         return int(analysis_id)
 
 
-async def _fetch_report(analysis_id: int) -> dict:
+async def _iter_events(response: httpx.Response):
+    """Разбор text/event-stream: (event, data)."""
+    event, data = "message", []
+    async for line in response.aiter_lines():
+        if line == "":
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].removeprefix(" "))
+
+
+async def _wait_report(
+    analysis_id: int,
+    on_progress: Callable[[int, int], Awaitable[None]] | None = None,
+    timeout: float = 600,
+) -> dict:
+    """
+    Backend обрабатывает документ асинхронно: /upload/document сразу отвечает status=received,
+    а OCR идёт в фоне. Ждём результат по SSE /analysis/{id}/events: прогресс по страницам и
+    итоговый отчёт приходят в одном соединении (без опроса /report/{id}).
+    Если поток закрылся раньше (перезапуск backend, лимит длительности) — переподключаемся.
+    """
     token = await _ensure_access_token()
-    headers = {"Authorization": f"Bearer {token}"}
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.get(f"{BACKEND_BASE_URL}/report/{analysis_id}", headers=headers)
-        r.raise_for_status()
-        return r.json()
+    headers = {"Authorization": f"Bearer {token}", "Accept": "text/event-stream"}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    # read-таймаут больше heartbeat сервера (15 с)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(20, read=60)) as client:
+        while loop.time() < deadline:
+            async with client.stream(
+                "GET", f"{BACKEND_BASE_URL}/analysis/{analysis_id}/events", headers=headers
+            ) as r:
+                r.raise_for_status()
+                async for event, data in _iter_events(r):
+                    if event == "report":
+                        return json.loads(data)
+                    payload = json.loads(data)
+                    if event == "status" and payload.get("status") == "failed":
+                        return payload
+                    if event == "progress" and on_progress is not None:
+                        await on_progress(payload["pages_done"], payload["pages_total"])
+    raise RuntimeError(f"Обработка analysis_id={analysis_id} не завершилась за {int(timeout)} с")
 
 
 async def _fetch_report_pdf(analysis_id: int) -> bytes:
@@ -102,7 +144,19 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
             content=bytes(content),
         )
 
-        report = await _fetch_report(analysis_id)
+        progress_msg = await msg.reply_text("Распознаю документ...")
+
+        async def on_progress(done: int, total: int) -> None:
+            try:
+                await progress_msg.edit_text(f"Распознаю документ: страница {done} из {total}")
+            except Exception:
+                # прогресс — не критично (лимиты Telegram на редактирование и т.п.)
+                pass
+
+        report = await _wait_report(analysis_id, on_progress)
+        if report.get("status") == "failed":
+            await msg.reply_text(f"Не удалось обработать документ (analysis_id={analysis_id}).")
+            return
         indicators = report.get("indicators") or []
 
         # короткая сводка
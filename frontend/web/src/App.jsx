@@ -63,6 +63,46 @@ export default function App() {
     return JSON.parse(text);
   };
 
+  // backend обрабатывает документ в фоне: статус, прогресс OCR по страницам и готовый отчёт
+  // приходят по SSE /analysis/{id}/events. EventSource не умеет заголовок Authorization,
+  // поэтому поток читаем через fetch; если он закрылся до отчёта — переподключаемся.
+  const waitReport = async (analysisId, onProgress, timeoutMs = 600000) => {
+    const deadline = Date.now() + timeoutMs;
+    const decoder = new TextDecoder();
+    while (Date.now() < deadline) {
+      const r = await fetch(`${API_BASE}/analysis/${analysisId}/events`, {
+        headers: { Accept: "text/event-stream", ...(token ? { Authorization: `Bearer ${token}` } : {}) }
+      });
+      if (!r.ok) throw new Error(`Events error ${r.status}: ${await r.text()}`);
+      const reader = r.body.getReader();
+      let buffer = "";
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf("\n\n")) >= 0) {
+          const block = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+          let event = "message";
+          const data = [];
+          for (const line of block.split("\n")) {
+            if (line.startsWith("event:")) event = line.slice(6).trim();
+            else if (line.startsWith("data:")) data.push(line.slice(5).replace(/^ /, ""));
+          }
+          if (!data.length) continue;
+          const payload = JSON.parse(data.join("\n"));
+          if (event === "report" || (event === "status" && payload.status === "failed")) {
+            reader.cancel();
+            return payload;
+          }
+          if (event === "progress") onProgress?.(payload.pages_done, payload.pages_total);
+        }
+      }
+    }
+    throw new Error(`Обработка analysis_id=${analysisId} не завершилась вовремя`);
+  };
+
   const downloadPdf = async (analysisId) => {
     if (!token) {
       setStatus("ERROR\nСначала выполните login (нужен токен).");
@@ -126,11 +166,17 @@ export default function App() {
       }
 
       setLastAnalysisId(analysisId);
-      setStatus(`Загружено. analysis_id=${analysisId}. Получаю отчёт...`);
+      setStatus(`Загружено. analysis_id=${analysisId}. Идёт распознавание...`);
 
-      const report = await fetchReport(analysisId);
+      const report = await waitReport(analysisId, (done, total) =>
+        setStatus(`Загружено. analysis_id=${analysisId}. Распознавание: страница ${done} из ${total}...`)
+      );
       setLastReport(report);
-      setStatus(`Готово. analysis_id=${analysisId}`);
+      setStatus(
+        report.status === "failed"
+          ? `ERROR\nНе удалось обработать документ (analysis_id=${analysisId})`
+          : `Готово. analysis_id=${analysisId}`
+      );
     } catch (e) {
       setStatus(`ERROR\n${String(e)}`);
     } finally {
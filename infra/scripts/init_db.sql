@@ -1,3 +1,3 @@
 -- Опционально: если захотите вручную инициализировать БД без auto-create в приложении.
--- Сейчас backend сам создаёт таблицы на старте (MVP-упрощение).
+-- Сейчас схему создаёт `python -m app.migrate` перед стартом backend (MVP-упрощение).
 